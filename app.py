@@ -1,3 +1,5 @@
+import os
+from datetime import datetime
 from flask import Flask
 from extensions import mail, oauth
 from pagelogic.login import login_bp
@@ -5,14 +7,90 @@ from pagelogic.bp import doctor_page_bp
 from pagelogic.repo import drug_repo
 from pagelogic.repo import food_repo
 from apscheduler.schedulers.background import BackgroundScheduler
-from pagelogic.service.notify_service import notify_jobs
+from pagelogic.service.notify_service import notify_jobs, dispatch_reminders, purge_reminders
+from pagelogic.service import catalogue_service
+from utils.leader import LeaderLock, TickStats
+import config
 
 notify_interval = 5*60
+# Only the worker holding this lock runs the tick; see utils/leader.py
+notify_leader = LeaderLock("notify_cronjob", enabled=config.SCHEDULER_LEADER_ELECTION)
+notify_stats = TickStats("notify_cronjob", notify_interval)
+
 def notify_cronjob():
+    if not notify_leader.renew():
+        notify_stats.skip()
+        return
     print("Starting notification cron job...")
-    notify_jobs(days=1, interval=notify_interval)
+    with notify_stats.timed():
+        notify_jobs(days=1, interval=notify_interval)
+
+def get_notify_stats():
+    return dict(notify_stats.as_dict(), leader=notify_leader.is_leader)
+
+# One worker refreshes the catalogues and rewrites their snapshots; the
+# others only remap the new files. Without snapshot files there is nothing
+# to remap, so then every worker refreshes its own copy.
+catalogue_leader = LeaderLock(
+    "catalogue_refresh",
+    enabled=config.SCHEDULER_LEADER_ELECTION and bool(config.CATALOGUE_SNAPSHOT_DIR),
+)
+
+def refresh_catalogues_cronjob():
+    if catalogue_leader.renew():
+        catalogue_service.refresh_catalogues()
+
+def reload_catalogues_cronjob():
+    if catalogue_leader.renew():
+        catalogue_service.reload_catalogues()
+
+# One worker dispatches the outbox, so its mailer's rate limit is the
+# deployment's send rate rather than a per-worker share of it
+dispatch_leader = LeaderLock("outbox_dispatch", enabled=config.SCHEDULER_LEADER_ELECTION)
+
+def dispatch_cronjob():
+    if dispatch_leader.renew():
+        dispatch_reminders()
+
+def load_catalogues():
+    """
+    Load the drug and food catalogues into this process.
+
+    Under gunicorn's preload mode (see gunicorn.conf.py) this runs once in
+    the master before the workers fork, so every worker starts with the
+    catalogues already in memory and shares their pages copy-on-write.
+    Snapshot files are preferred over the database; see catalogue_service.
+    """
+    if not drug_repo.drugs or not len(food_repo.foods):
+        catalogue_service.load_catalogues()
 
-def create_app():
+
+def start_scheduler():
+    scheduler = BackgroundScheduler()
+    # Runs that were missed or are still busy are merged into one: each run
+    # covers everything since the last one anyway (notify_jobs' watermark)
+    scheduler.add_job(notify_cronjob,'interval', seconds=notify_interval,
+                      coalesce=True, max_instances=1, misfire_grace_time=None)
+    # Renew the leader lock between ticks, so a dead leader is replaced
+    # within LEADER_RENEW_SECONDS instead of a whole interval later
+    if config.SCHEDULER_LEADER_ELECTION:
+        scheduler.add_job(notify_leader.renew, 'interval', seconds=config.LEADER_RENEW_SECONDS,
+                          next_run_time=datetime.now())
+    scheduler.add_job(dispatch_cronjob, 'interval', seconds=config.OUTBOX_DISPATCH_SECONDS)
+    scheduler.add_job(purge_reminders, 'interval', hours=24)
+    # Pick up catalogue rows added since the snapshot was written, then keep
+    # polling for new ones; a full reload catches rows edited in place.
+    scheduler.add_job(refresh_catalogues_cronjob, 'interval',
+                      seconds=config.CATALOGUE_REFRESH_SECONDS, next_run_time=datetime.now())
+    scheduler.add_job(reload_catalogues_cronjob, 'interval',
+                      seconds=config.CATALOGUE_RELOAD_SECONDS)
+    scheduler.add_job(catalogue_service.sync_catalogues, 'interval',
+                      seconds=config.CATALOGUE_SYNC_SECONDS)
+    scheduler.start()
+    return scheduler
+
+
+def create_app(start_jobs=True):
     app = Flask(__name__)
     app.config.from_object('config')
 
@@ -51,18 +129,15 @@ def create_app():
     app.register_blueprint(user_notification_bp.user_notification_bp)
 
     # Warm up DB caches
-    drug_repo.get_drugs()
-    drug_repo.drugs
-    food_repo.get_foods()
-    food_repo.foods
-
-    # Start notification scheduler
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(notify_cronjob,'interval', seconds=notify_interval)
-    scheduler.start()
+    load_catalogues()
 
+    # Start notification scheduler. When the app is preloaded in the gunicorn
+    # master, threads started here would not survive the fork, so the
+    # post_fork hook starts it in each worker instead.
+    if start_jobs:
+        start_scheduler()
 
     return app
 
 
-app = create_app()
\ No newline at end of file
+app = create_app(start_jobs=os.getenv("PRELOAD_APP") != "1")
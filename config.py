@@ -19,6 +19,35 @@ AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
 SES_SENDER = os.getenv("SES_SENDER")
 
+# Outgoing mail (utils/emailsender.py): "ses", or "local" to only record
+# messages; sender threads per process and the most messages per second a
+# process sends. Reminders are dispatched by one process (see app.py), so
+# set the rate to the SES sending quota
+MAIL_TRANSPORT = os.getenv("MAIL_TRANSPORT", "ses")
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "4"))
+SES_MAX_SEND_RATE = float(os.getenv("SES_MAX_SEND_RATE", "14"))
+
+# Reminder outbox (pagelogic/repo/reminder_outbox_repo.py): how often the
+# dispatcher polls it, rows claimed per batch, how long a claim
+# holds rows, attempts before a reminder is given up, seconds between
+# retries (times the attempt number), and days sent rows are kept
+OUTBOX_DISPATCH_SECONDS = int(os.getenv("OUTBOX_DISPATCH_SECONDS", "30"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", "60"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "30"))
+
+# Run the reminder tick in one process per deployment (utils/leader.py),
+# and how often that process renews its lock / the others try to take it
+SCHEDULER_LEADER_ELECTION = os.getenv("SCHEDULER_LEADER_ELECTION", "1") == "1"
+LEADER_RENEW_SECONDS = int(os.getenv("LEADER_RENEW_SECONDS", "30"))
+
+# How far back a reminder tick catches up after downtime, and the most doses
+# one tick handles (the rest are picked up by the next tick)
+NOTIFY_MAX_CATCHUP_SECONDS = int(os.getenv("NOTIFY_MAX_CATCHUP_SECONDS", str(6 * 60 * 60)))
+NOTIFY_MAX_PER_TICK = int(os.getenv("NOTIFY_MAX_PER_TICK", "2000"))
+
 FLASK_ENV= os.getenv("FLASK_ENV")
 print("FLASK_ENV: ", FLASK_ENV)
 
@@ -48,8 +77,35 @@ BING_IMAGES_API_KEY = os.getenv("BING_IMAGES_API_KEY", "")
 #         cursorclass=pymysql.cursors.DictCursor
 #     )
 
-def mydb():
-    return psycopg.connect(
+# Connection pool, sized per gunicorn worker (total = workers * DB_POOL_MAX_SIZE)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+# Catalogue snapshots (see utils/snapshot.py); set to "" to always load from the DB
+CATALOGUE_SNAPSHOT_DIR = os.getenv(
+    "CATALOGUE_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "catalogue"),
+)
+
+# How often new catalogue rows are picked up, and how often both tables are
+# reloaded in full (for rows edited in place)
+CATALOGUE_REFRESH_SECONDS = int(os.getenv("CATALOGUE_REFRESH_SECONDS", str(10 * 60)))
+CATALOGUE_RELOAD_SECONDS = int(os.getenv("CATALOGUE_RELOAD_SECONDS", str(24 * 60 * 60)))
+# How often the other workers check for a snapshot the refreshing worker
+# has replaced
+CATALOGUE_SYNC_SECONDS = int(os.getenv("CATALOGUE_SYNC_SECONDS", "60"))
+
+# LISTEN/NOTIFY channel on which plan and notification-setting changes are
+# announced (payload: patient user id), see utils/change_listener.py
+REMINDER_CHANNEL = "reminder_changes"
+
+# Expanded plans kept per worker by plan_service (LRU); 0 disables the cache
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "512"))
+
+def db_conninfo():
+    return dict(
         host=os.getenv("DB_HOST"),
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("DB_USER"),
@@ -57,5 +113,14 @@ def mydb():
         sslmode=os.getenv("DB_SSLMODE")
     )
 
+def mydb_direct():
+    """Open a dedicated, unpooled connection (scripts, long-running jobs)."""
+    return psycopg.connect(**db_conninfo())
+
+def mydb():
+    """Borrow a connection from this process's pool. close() returns it."""
+    from utils import db_pool
+    return db_pool.getconn()
+
 def cursor(conn):
     return conn.cursor(row_factory=dict_row)
\ No newline at end of file
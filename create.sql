@@ -67,3 +67,58 @@ CREATE TABLE IF NOT EXISTS doctor_feedbacks (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(patient_id, feedback_date)
 );
+
+-- One record per planned dose: the ON CONFLICT target of
+-- drug_record_repo.toggle_drug_taken / mark_doses_taken. Existing databases
+-- get it from migration 3 (utils/migrations.py), after migration 2 has moved
+-- duplicate doses out; this statement fails on a table that still has some.
+-- (NULLS NOT DISTINCT: PostgreSQL 15+)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_drug_records_dose
+ON drug_records (user_id, plan_item_id, expected_date, expected_time)
+NULLS NOT DISTINCT
+WHERE plan_item_id IS NOT NULL;
+
+-- Per-patient daily adherence rollup, see pagelogic/repo/adherence_repo.py
+CREATE TABLE IF NOT EXISTS adherence_daily (
+    patient_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    scheduled INT,
+    taken INT NOT NULL DEFAULT 0,
+    late INT NOT NULL DEFAULT 0,
+    early INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (patient_id, day)
+);
+
+-- Reminder emails waiting to be sent, see pagelogic/repo/reminder_outbox_repo.py
+-- (UNIQUE NULLS NOT DISTINCT: PostgreSQL 15+)
+CREATE TABLE IF NOT EXISTS reminder_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    plan_item_id BIGINT NOT NULL,
+    expected_date DATE NOT NULL,
+    expected_time TIME,
+    notify_offset INT NOT NULL,
+    trigger_at TIMESTAMP NOT NULL,
+    drug_name TEXT,
+    dosage INT,
+    unit VARCHAR(32),
+    status VARCHAR(16) NOT NULL DEFAULT 'PENDING',   -- PENDING / SENT / SKIPPED / FAILED
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL,
+    last_error TEXT,
+    sent_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE NULLS NOT DISTINCT (user_id, plan_item_id, expected_date, expected_time, notify_offset)
+);
+
+CREATE INDEX IF NOT EXISTS idx_reminder_outbox_pending
+ON reminder_outbox (next_attempt_at, id)
+WHERE status = 'PENDING';
+
+-- Progress of periodic jobs, see pagelogic/repo/scheduler_repo.py
+CREATE TABLE IF NOT EXISTS scheduler_watermarks (
+    job VARCHAR(64) PRIMARY KEY,
+    processed_until TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,39 @@
+"""
+Gunicorn settings (picked up automatically from the project root).
+
+The app is preloaded: app.py is imported once in the master, which loads
+the drug and food catalogues from Postgres a single time. Workers are then
+forked from that master and share the catalogue pages copy-on-write instead
+of each running SELECT * over both tables and keeping a private copy.
+
+Set PRELOAD_APP=0 to fall back to loading the app in every worker.
+"""
+import gc
+import os
+
+os.environ.setdefault("PRELOAD_APP", "1")
+
+preload_app = os.environ["PRELOAD_APP"] == "1"
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # The master only needed the database to load the catalogues; do not
+    # keep its idle pooled connections open for the lifetime of the server.
+    from utils import db_pool
+    db_pool.close_pool()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Move everything loaded so far out of the collector's reach, so
+        # gc passes in the workers do not write to (and un-share) the
+        # pages holding the catalogues.
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.start_scheduler()
@@ -1,12 +1,14 @@
 from flask import Blueprint, render_template, request, session, jsonify
 from pagelogic.repo import user_repo, plan_repo, feedback_repo, drug_record_repo
-from pagelogic.service import plan_service
-from datetime import date, timedelta
+from pagelogic.service import plan_service, patient_stats_service
+from datetime import date
 from utils.llm_api import call_llm_api
 from config import mydb
 
 doctor_page_bp = Blueprint("doctor_page_bp", __name__)
 
+MAX_TREND_DAYS = 366
+
 @doctor_page_bp.route("/doctor/home")
 def doctor_patients_page():
     doctor_id = session.get("user_id")
@@ -175,28 +177,24 @@ def doctor_plan_item_create():
     if not doctor_id:
         return "Not logged in", 401
 
-    plan = plan_service.get_user_plan(int(patient_id), None, None)
-    
+    # Only the plan id is needed here, so don't load or expand the items
+    plan = plan_repo.get_plan_by_user_id(int(patient_id))
     if not plan:
-        raw_plan = plan_service.get_raw_plan(int(patient_id))
-        if not raw_plan:
-            patient = user_repo.get_user_by_id(int(patient_id))
-            patient_name = patient.username if patient else f"Patient {patient_id}"
-            doctor = user_repo.get_user_by_id(doctor_id)
-            doctor_name = doctor.username if doctor else None
-            
-            raw_plan = plan_repo.create_plan(
-                patient_id=int(patient_id),
-                doctor_id=doctor_id,
-                name=f"Treatment Plan for {patient_name}",
-                description=None,
-                doctor_name=doctor_name,
-                patient_name=patient_name,
-            )
-        plan_id = raw_plan.id
-    else:
-        plan_id = plan.id
-    
+        patient = user_repo.get_user_by_id(int(patient_id))
+        patient_name = patient.username if patient else f"Patient {patient_id}"
+        doctor = user_repo.get_user_by_id(doctor_id)
+        doctor_name = doctor.username if doctor else None
+
+        plan = plan_repo.create_plan(
+            patient_id=int(patient_id),
+            doctor_id=doctor_id,
+            name=f"Treatment Plan for {patient_name}",
+            description=None,
+            doctor_name=doctor_name,
+            patient_name=patient_name,
+        )
+    plan_id = plan.id
+
     patient = user_repo.get_user_by_id(patient_id)
     patient_name = patient.username if patient else f"Patient {patient_id}"
     return render_template(
@@ -217,7 +215,8 @@ def doctor_plan_item_edit():
     if not patient_id:
         return "Missing patient_id", 400
 
-    plan = plan_service.get_user_plan(int(patient_id), None, None)
+    # The item as stored (with its rule), not its expanded occurrences
+    plan = plan_service.get_raw_plan(int(patient_id))
     if not plan:
         return "No plan found for this patient", 404
 
@@ -386,56 +385,21 @@ def doctor_feedback_page():
         return "Not logged in", 401
     
     patients = user_repo.get_patients_by_doctor_id(doctor_id)
-    
+
+    # Every patient's stats from a fixed number of queries
+    stats = patient_stats_service.get_patients_stats([p.id for p in patients])
+
     patients_with_stats = []
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    yesterday_str = yesterday.isoformat()
-    
     for patient in patients:
-        plan = plan_repo.get_plan_by_user_id(patient.id)
-        if not plan:
-            continue
-        
-        plan_items = plan_repo.get_all_plan_items_by_plan_id(plan.id)
-        if not plan_items or len(plan_items) == 0:
-            continue
-        
-        yesterday_plan = plan_service.get_user_plan(patient.id, yesterday, yesterday)
-        yesterday_records = drug_record_repo.get_drug_records_by_date_range(
-            user_id=patient.id,
-            start=yesterday,
-            end=yesterday
-        )
-        
-        yesterday_completion = 0
-        if yesterday_plan and yesterday_plan.plan_items:
-            total_tasks = len(yesterday_plan.plan_items)
-            completed_tasks = len([r for r in yesterday_records if r.status == "TAKEN" and r.updated_at])
-            if total_tasks > 0:
-                yesterday_completion = round((completed_tasks / total_tasks) * 100)
-        
-        today_plan = plan_service.get_user_plan(patient.id, today, today)
-        today_tasks = len(today_plan.plan_items) if today_plan and today_plan.plan_items else 0
-        
-        if yesterday_completion < 70:
-            risk_level = "High"
-        elif yesterday_completion < 85:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
-        
-        feedback = feedback_repo.get_feedback_by_date(patient.id, yesterday)
-        has_feedback_today = feedback is not None
-        
+        patient_stats = stats.get(patient.id)
+        if not patient_stats:
+            continue  # no plan, or a plan without items
+
         patients_with_stats.append({
             "id": patient.id,
             "username": patient.username,
             "email": patient.email,
-            "yesterday_completion": yesterday_completion,
-            "today_tasks": today_tasks,
-            "risk_level": risk_level,
-            "has_feedback_today": has_feedback_today
+            **patient_stats,
         })
     
     return render_template("doctor_feedback.html", 
@@ -473,35 +437,39 @@ def get_patient_stats():
     if not plan or plan.doctor_id != doctor_id:
         return jsonify({"error": "You don't have permission to view stats for this patient"}), 403
     
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    
-    yesterday_plan = plan_service.get_user_plan(patient_id, yesterday, yesterday)
-    yesterday_records = drug_record_repo.get_drug_records_by_date_range(
-        user_id=patient_id,
-        start=yesterday,
-        end=yesterday
-    )
-    
-    yesterday_completion = 0
-    if yesterday_plan and yesterday_plan.plan_items:
-        total_tasks = len(yesterday_plan.plan_items)
-        completed_tasks = len([r for r in yesterday_records if r.status == "TAKEN" and r.updated_at])
-        if total_tasks > 0:
-            yesterday_completion = round((completed_tasks / total_tasks) * 100)
-    
-    today_plan = plan_service.get_user_plan(patient_id, today, today)
-    today_tasks = len(today_plan.plan_items) if today_plan and today_plan.plan_items else 0
-    
-    if yesterday_completion < 70:
-        risk_level = "High"
-    elif yesterday_completion < 85:
-        risk_level = "Medium"
-    else:
-        risk_level = "Low"
-    
+    # One read of the adherence rollup; a plan without items has no stats
+    stats = patient_stats_service.get_patients_stats([patient_id]).get(patient_id)
+    if not stats:
+        stats = {"yesterday_completion": 0, "today_tasks": 0,
+                 "risk_level": patient_stats_service.risk_level(0)}
+
+    return jsonify({
+        "yesterday_completion": stats["yesterday_completion"],
+        "today_tasks": stats["today_tasks"],
+        "risk_level": stats["risk_level"]
+    }), 200
+
+
+@doctor_page_bp.route("/doctor/patient_adherence", methods=["GET"])
+def get_patient_adherence():
+    """Daily adherence of one patient over the last `days` days (default 28), oldest first."""
+    doctor_id = session.get("user_id")
+    if not doctor_id:
+        return jsonify({"error": "Not logged in"}), 401
+
+    try:
+        patient_id = int(request.args.get("patient_id", ""))
+        days = int(request.args.get("days", 28))
+    except ValueError:
+        return jsonify({"error": "patient_id and days must be integers"}), 400
+    if not 1 <= days <= MAX_TREND_DAYS:
+        return jsonify({"error": f"days must be between 1 and {MAX_TREND_DAYS}"}), 400
+
+    plan = plan_repo.get_plan_by_user_id(patient_id)
+    if not plan or plan.doctor_id != doctor_id:
+        return jsonify({"error": "You don't have permission to view stats for this patient"}), 403
+
     return jsonify({
-        "yesterday_completion": yesterday_completion,
-        "today_tasks": today_tasks,
-        "risk_level": risk_level
-    }), 200
\ No newline at end of file
+        "patient_id": patient_id,
+        "days": patient_stats_service.get_adherence_trend(patient_id, days),
+    }), 200
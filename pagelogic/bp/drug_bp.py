@@ -1,6 +1,7 @@
 from flask import jsonify, Blueprint, request
 
 from pagelogic.repo import drug_repo
+from utils.text_index import MAX_LIMIT, MAX_OFFSET
 
 drug_bp = Blueprint('drug_bp', __name__)
 
@@ -34,6 +35,7 @@ def get_sample_drugs_locally():
 
 #search_drug?name="aspirin amazon"
 # if multiple drugs match, return the first 100 drugs
+# page with &limit=20&offset=40 (limit at most 100, offset at most 1000)
 @drug_bp.route('/search_drug', methods=['GET'])
 def search_drug_locally():
     name = request.args.get("name", "")
@@ -44,7 +46,15 @@ def search_drug_locally():
     if len(name) < 2:
         return jsonify({"error": "Name too short, must be at least 2 characters"}), 400
 
-    drugs = drug_repo.search_drugs_by_keywords_locally(names)
+    try:
+        limit = int(request.args.get("limit", 100))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be int"}), 400
+    if not 1 <= limit <= MAX_LIMIT or not 0 <= offset <= MAX_OFFSET:
+        return jsonify({"error": f"limit must be 1-{MAX_LIMIT} and offset 0-{MAX_OFFSET}"}), 400
+
+    drugs = drug_repo.search_drugs_by_keywords_locally(names, limit=limit, offset=offset)
     if not drugs:
         return jsonify([]), 404
 
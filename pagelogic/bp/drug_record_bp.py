@@ -2,6 +2,7 @@ import datetime
 from flask import jsonify, Blueprint, request
 from datetime import date, time as dt_time
 from pagelogic.repo import drug_record_repo
+from utils import keyset
 
 drug_record_bp = Blueprint('drug_record_bp', __name__)
 
@@ -38,6 +39,30 @@ def get_drug_records_by_user_id():
 
     return jsonify(record_dicts), 200
 
+# ----------------------------------------
+# GET /get_drug_records_page?user_id=2&limit=50&cursor=...&start=2025-01-01&end=2025-01-31
+# Newest first; pass next_cursor back as cursor for the following page.
+# ----------------------------------------
+@drug_record_bp.route('/get_drug_records_page', methods=['GET'])
+def get_drug_records_page():
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+
+    try:
+        user_id = int(user_id)
+        limit, after, start, end = keyset.parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    records, next_key = drug_record_repo.get_drug_records_page(
+        user_id, limit, after=after, start=start, end=end)
+
+    return jsonify({
+        "records": [rec.to_dict() for rec in records],
+        "next_cursor": keyset.encode_cursor(next_key) if next_key else None,
+    }), 200
+
 # ----------------------------------------
 # GET /delete_drug_record?id=5
 # ----------------------------------------
@@ -173,6 +198,17 @@ def create_drug_record():
 
 
 
+def _parse_time(value):
+    """'HH[:MM[:SS]]' -> time, None/'' -> None; raises ValueError/IndexError."""
+    if not value:
+        return None
+    parts = value.split(':')
+    hour = int(parts[0])
+    minute = int(parts[1]) if len(parts) > 1 else 0
+    second = int(parts[2]) if len(parts) > 2 else 0
+    return dt_time(hour, minute, second)
+
+
 @drug_record_bp.route('/mark_drug_taken', methods=['POST'])
 def mark_drug_taken():
     data = request.get_json() or {}
@@ -201,60 +237,110 @@ def mark_drug_taken():
     except ValueError:
         return jsonify({"error": "Invalid expected_date"}), 400
 
-    expected_time = None
-    if expected_time_str:
-        try:
-            parts = expected_time_str.split(':')
-            hour = int(parts[0])
-            minute = int(parts[1]) if len(parts) > 1 else 0
-            second = int(parts[2]) if len(parts) > 2 else 0
-            expected_time = dt_time(hour, minute, second)
-        except (ValueError, IndexError):
-            return jsonify({"error": "Invalid expected_time"}), 400
-
-    # Check for duplicate: same plan_item + expected_date + expected_time
-    existing = drug_record_repo.get_drug_record_by_unique(
+    try:
+        expected_time = _parse_time(expected_time_str)
+    except (ValueError, IndexError):
+        return jsonify({"error": "Invalid expected_time"}), 400
+
+    # Toggle in one statement: delete the dose's record if it exists,
+    # otherwise create it (only with a valid status)
+    can_create = status in ("ON_TIME", "EARLY", "LATE")
+
+    # Use TAKEN for DB status to avoid enum errors
+    action, record_id = drug_record_repo.toggle_drug_taken(
         user_id=user_id,
+        drug_id=drug_id,
         plan_item_id=plan_item_id,
         expected_date=expected_date,
-        expected_time=expected_time
+        expected_time=expected_time,
+        status="TAKEN",
+        allow_create=can_create,
     )
-    
-    # If record exists, delete it (toggle functionality)
-    if existing:
-        success = drug_record_repo.delete_drug_record(existing.id)
-        if not success:
-            return jsonify({"error": "Failed to delete existing record"}), 500
-        
+
+    if action == "deleted":
         return jsonify({
             "message": "Record deleted",
-            "id": existing.id,
+            "id": record_id,
             "action": "deleted"
         }), 200
 
-    # Create new record
-    if not status or status not in ("ON_TIME", "EARLY", "LATE"):
-        return jsonify({"error": "Invalid status (required for creating new record)"}), 400
-
-    # Use TAKEN for DB status to avoid enum errors
-    db_status = "TAKEN"
-
-    new_id = drug_record_repo.create_drug_record(
-        user_id=user_id,
-        drug_id=drug_id,
-        expected_date=expected_date,
-        expected_time=expected_time,
-        dosage_numeric=None,
-        unit=None,
-        plan_item_id=plan_item_id,
-        status=db_status,
-        notes=None
-    )
+    if action == "unchanged":
+        if not can_create:
+            return jsonify({"error": "Invalid status (required for creating new record)"}), 400
+        # A concurrent request (e.g. a double click) recorded it first
+        return jsonify({
+            "message": "Already recorded",
+            "id": None,
+            "action": "unchanged"
+        }), 200
 
     return jsonify({
         "message": "Recorded",
-        "id": new_id,
+        "id": record_id,
         "status": status,
         "timing_flag": timing_flag,
         "action": "created"
-    }), 200
\ No newline at end of file
+    }), 200
+
+
+# ----------------------------------------
+# POST /mark_drugs_taken - mark a whole time slot at once
+# {"user_id": 2, "doses": [{"plan_item_id": 3, "expected_date": "2025-01-01",
+#                           "expected_time": "08:00", "status": "ON_TIME"}, ...]}
+# ----------------------------------------
+MAX_BULK_DOSES = 200
+
+
+@drug_record_bp.route('/mark_drugs_taken', methods=['POST'])
+def mark_drugs_taken():
+    data = request.get_json() or {}
+
+    user_id = data.get("user_id")
+    doses = data.get("doses")
+    if not user_id or not isinstance(doses, list) or not doses:
+        return jsonify({"error": "user_id and a non-empty doses list are required"}), 400
+    if len(doses) > MAX_BULK_DOSES:
+        return jsonify({"error": f"At most {MAX_BULK_DOSES} doses per request"}), 400
+
+    try:
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid user_id"}), 400
+
+    # Validate every dose first; only the valid ones are written
+    results = []
+    valid = []
+    for dose in doses:
+        dose = dose if isinstance(dose, dict) else {}
+        result = {
+            "plan_item_id": dose.get("plan_item_id"),
+            "expected_date": dose.get("expected_date"),
+            "expected_time": dose.get("expected_time"),
+        }
+        results.append(result)
+        try:
+            parsed = (
+                int(dose["plan_item_id"]),
+                date.fromisoformat(dose["expected_date"]),
+                _parse_time(dose.get("expected_time")),
+            )
+        except (KeyError, ValueError, IndexError, TypeError, AttributeError):
+            result["error"] = "Invalid plan_item_id, expected_date or expected_time"
+            continue
+        if dose.get("status") not in ("ON_TIME", "EARLY", "LATE"):
+            result["error"] = "Invalid status"
+            continue
+        result["status"] = dose["status"]
+        valid.append((result, parsed))
+
+    # One transaction for the whole batch; TAKEN in the DB like /mark_drug_taken
+    written = drug_record_repo.mark_doses_taken(
+        user_id, [parsed for _, parsed in valid], status="TAKEN")
+    for (result, _), (action, record_id) in zip(valid, written):
+        result["action"] = action
+        result["id"] = record_id
+
+    return jsonify({
+        "results": results,
+        "created": sum(1 for action, _ in written if action == "created"),
+    }), 200
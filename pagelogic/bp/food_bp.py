@@ -1,6 +1,7 @@
 from flask import jsonify, Blueprint, request
 
 from pagelogic.repo import food_repo
+from utils.text_index import MAX_LIMIT, MAX_OFFSET
 from utils.bing_api import GoogleImagesAPI
 from config import BING_IMAGES_API_KEY
 
@@ -40,7 +41,8 @@ def get_sample_foods_locally():
 
 @food_bp.route('/search_food', methods=['GET'])
 def search_foods_locally():
-    """Search foods by name (description includes name). Name must be at least 2 characters."""
+    """Search foods by name (description includes name). Name must be at least 2 characters.
+    Optional limit (1-100, default 100) and offset (0-1000, default 0) page through the ranked results."""
     name = request.args.get("name", "")
     names = name.split(" ")
 
@@ -50,7 +52,15 @@ def search_foods_locally():
     if len(name) < 2:
         return jsonify({"error": "Name too short, must be at least 2 characters"}), 400
 
-    foods = food_repo.search_foods_by_keywords_locally(names)
+    try:
+        limit = int(request.args.get("limit", 100))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be int"}), 400
+    if not 1 <= limit <= MAX_LIMIT or not 0 <= offset <= MAX_OFFSET:
+        return jsonify({"error": f"limit must be 1-{MAX_LIMIT} and offset 0-{MAX_OFFSET}"}), 400
+
+    foods = food_repo.search_foods_by_keywords_locally(names, limit=limit, offset=offset)
     if not foods:
         return jsonify([]), 404
 
@@ -3,6 +3,7 @@ from flask import jsonify, Blueprint, request
 
 
 from pagelogic.repo import food_record_repo
+from utils import keyset
 
 
 food_record_bp = Blueprint('food_record_bp', __name__)
@@ -94,6 +95,28 @@ def get_food_records_by_user_id_handler():
 
     return jsonify(record_dicts), 200
 
+# GET /get_food_records_page?user_id=2&limit=50&cursor=...&start=2025-01-01&end=2025-01-31
+# Newest first; pass next_cursor back as cursor for the following page.
+@food_record_bp.route('/get_food_records_page', methods=['GET'])
+def get_food_records_page_handler():
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+
+    try:
+        user_id = int(user_id)
+        limit, after, start, end = keyset.parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    records, next_key = food_record_repo.get_food_records_page(
+        user_id, limit, after=after, start=start, end=end)
+
+    return jsonify({
+        "records": [record.to_dict() for record in records],
+        "next_cursor": keyset.encode_cursor(next_key) if next_key else None,
+    }), 200
+
 @food_record_bp.route('/delete_food_record', methods=['GET'])
 def delete_food_record_handler():
     record_id = int(request.args.get("id", 1))
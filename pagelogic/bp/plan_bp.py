@@ -18,6 +18,9 @@ def get_user_plan_handler():
     to_when = date.fromisoformat(to_str) if to_str else None
 
     plan = plan_service.get_user_plan(user_id, from_when, to_when)
+    if not plan:
+        return jsonify({"error": f"No plan found for user {user_id}"}), 404
+
     return jsonify(plan.to_dict()), 200
 
 @plan_bp.route("/get_raw_plan", methods=["GET"])
@@ -67,6 +67,8 @@ def magic_login():
         (user['id'], session['session_token'], request.headers.get('User-Agent'), request.remote_addr)
     )
     mydb.commit()
+    cur.close()
+    mydb.close()
     flash('Login successful', 'success')
     return redirect_by_role(user['role'])
 
@@ -116,6 +118,8 @@ def oauth_authorize():
         (user['id'], session['session_token'], request.headers.get('User-Agent'), request.remote_addr)
     )
     mydb.commit()
+    cur.close()
+    mydb.close()
     return redirect_by_role(user['role'])
 
 def redirect_by_role(role):
@@ -2,9 +2,12 @@ from flask import render_template, Blueprint, request, session, jsonify
 from datetime import date, datetime, time as dt_time, timedelta
 from pagelogic.repo import food_repo, drug_repo, food_record_repo, drug_record_repo, feedback_repo
 from pagelogic.service import plan_service
+from utils import keyset
 
 patient_home_bp = Blueprint('patient_home', __name__)
 
+FOOD_HISTORY_PAGE_SIZE = 100
+
 
 @patient_home_bp.route('/patient', methods=['GET', 'POST'])
 def patient_home():
@@ -178,18 +181,24 @@ def patient_food_history_page():
         return render_template('patient_food_history.html', food_records=[])
     
     period = request.args.get('period', 'all')
-    records = food_record_repo.get_food_records_by_user_id(user_id)
-    
-    # Filter by time period
+
+    # Time period as date bounds, applied in SQL
     today = date.today()
+    start, end = None, None
     if period == 'today':
-        records = [r for r in records if r.eaten_date == today]
+        start, end = today, today
     elif period == 'week':
-        week_start = today - timedelta(days=today.weekday())
-        records = [r for r in records if r.eaten_date >= week_start and r.eaten_date <= today]
+        start, end = today - timedelta(days=today.weekday()), today
     elif period == 'month':
-        month_start = date(today.year, today.month, 1)
-        records = [r for r in records if r.eaten_date >= month_start and r.eaten_date <= today]
+        start, end = date(today.year, today.month, 1), today
+
+    # One page at a time, continuing after ?cursor= (see utils/keyset.py)
+    try:
+        after = keyset.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        after = None
+    records, next_key = food_record_repo.get_food_records_page(
+        user_id, FOOD_HISTORY_PAGE_SIZE, after=after, start=start, end=end)
     
     # Join with food table to get food_name
     food_records_with_name = []
@@ -213,7 +222,8 @@ def patient_food_history_page():
     return render_template('patient_food_history.html', 
                           food_records=food_records_with_name, 
                           user_id=user_id,
-                          current_period=period)
+                          current_period=period,
+                          next_cursor=keyset.encode_cursor(next_key) if next_key else None)
 
 
 @patient_home_bp.route('/patient/get_feedback', methods=['GET'])
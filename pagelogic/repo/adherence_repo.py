@@ -0,0 +1,156 @@
+from dataclasses import dataclass, asdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import mydb
+
+# adherence_daily holds one row per (patient, day): how many doses the plan
+# scheduled and how many drug_records were taken, late or early. The record
+# counts are refreshed inside the same transaction as every drug_records
+# write; `scheduled` comes from expanding the plan in Python, so plan
+# changes only reset it to NULL and the next reader recomputes it.
+
+# ===================== dataclass model =====================
+
+@dataclass
+class adherence_day:
+    patient_id: int
+    day: date
+    scheduled: Optional[int]    # NULL until computed / after a plan change
+    taken: int
+    late: int
+    early: int
+
+    def to_dict(self):
+        d = asdict(self)
+        d["day"] = self.day.isoformat()
+        return d
+
+
+# Counts for one (user, day) computed from drug_records. A dose is LATE /
+# EARLY when it was marked an hour or more after / before its expected time,
+# the same rule the patient plan page uses.
+_COUNTS_SQL = """
+    SELECT
+        COUNT(*) FILTER (WHERE status = 'TAKEN' AND updated_at IS NOT NULL),
+        COUNT(*) FILTER (
+            WHERE status = 'TAKEN' AND updated_at IS NOT NULL AND expected_time IS NOT NULL
+              AND updated_at >= expected_date + expected_time + INTERVAL '1 hour'
+        ),
+        COUNT(*) FILTER (
+            WHERE status = 'TAKEN' AND updated_at IS NOT NULL AND expected_time IS NOT NULL
+              AND updated_at <= expected_date + expected_time - INTERVAL '1 hour'
+        )
+    FROM drug_records
+    WHERE user_id = %(user_id)s AND expected_date = %(day)s
+"""
+
+
+# ===================== maintenance (caller's transaction) =====================
+
+def refresh_day_counts(cur, user_id: int, day: date) -> None:
+    """
+    Recount the taken / late / early columns of (user_id, day) from
+    drug_records. Runs on the caller's cursor so the rollup commits (or
+    rolls back) together with the record change that caused it.
+    """
+    cur.execute(
+        f"""
+        INSERT INTO adherence_daily (patient_id, day, scheduled, taken, late, early, updated_at)
+        SELECT %(user_id)s, %(day)s, NULL, c.*, NOW()
+        FROM ({_COUNTS_SQL}) AS c
+        ON CONFLICT (patient_id, day) DO UPDATE
+        SET taken = EXCLUDED.taken,
+            late = EXCLUDED.late,
+            early = EXCLUDED.early,
+            updated_at = NOW()
+        """,
+        {"user_id": user_id, "day": day},
+    )
+
+
+def invalidate_scheduled(cur, plan_ids: List[int], today: Optional[date] = None) -> None:
+    """
+    Forget the scheduled counts of the plans' patients from yesterday on;
+    earlier days are history and keep what was scheduled at the time.
+    "Yesterday" is the app's (date.today()), like every other rollup day,
+    not the database's CURRENT_DATE.
+    """
+    if not plan_ids:
+        return
+    since = (today or date.today()) - timedelta(days=1)
+    cur.execute(
+        """
+        UPDATE adherence_daily
+        SET scheduled = NULL, updated_at = NOW()
+        WHERE patient_id IN (SELECT patient_id FROM plan WHERE id = ANY(%s))
+          AND day >= %s
+        """,
+        (list(plan_ids), since),
+    )
+
+
+# ===================== read / fill =====================
+
+def get_adherence(
+    patient_ids: List[int],
+    from_day: date,
+    to_day: date,
+) -> Dict[Tuple[int, date], adherence_day]:
+    """{(patient_id, day): row} for the rows that exist in the range."""
+    if not patient_ids:
+        return {}
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    cur.execute(
+        """
+        SELECT patient_id, day, scheduled, taken, late, early
+        FROM adherence_daily
+        WHERE patient_id = ANY(%s)
+          AND day BETWEEN %s AND %s
+        """,
+        (list(patient_ids), from_day, to_day),
+    )
+    rows = cur.fetchall()
+
+    cur.close()
+    conn.close()
+    return {(r[0], r[1]): adherence_day(*r) for r in rows}
+
+
+def upsert_days(rows: Iterable[Tuple[int, date, int]]) -> None:
+    """
+    Store freshly computed (patient_id, day, scheduled) rows, recounting
+    their records as well, in one transaction.
+    """
+    rows = [{"user_id": pid, "day": day, "scheduled": scheduled} for pid, day, scheduled in rows]
+    if not rows:
+        return
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.executemany(
+            f"""
+            INSERT INTO adherence_daily (patient_id, day, scheduled, taken, late, early, updated_at)
+            SELECT %(user_id)s, %(day)s, %(scheduled)s, c.*, NOW()
+            FROM ({_COUNTS_SQL}) AS c
+            ON CONFLICT (patient_id, day) DO UPDATE
+            SET scheduled = EXCLUDED.scheduled,
+                taken = EXCLUDED.taken,
+                late = EXCLUDED.late,
+                early = EXCLUDED.early,
+                updated_at = NOW()
+            """,
+            rows,
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("upsert_days ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
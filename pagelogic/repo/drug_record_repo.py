@@ -1,7 +1,9 @@
 from dataclasses import dataclass, asdict
-from typing import Optional, List
-from datetime import date, datetime, time as dt_time, timedelta
+from typing import Optional, List, Tuple
+from datetime import date, datetime, time as dt_time
 from config import mydb
+from pagelogic.repo import adherence_repo
+from utils import keyset
 
 # ===================== dataclass model =====================
 
@@ -96,6 +98,7 @@ def create_drug_record(
     ))
 
     new_id = cur.fetchone()[0]
+    adherence_repo.refresh_day_counts(cur, user_id, expected_date)
     conn.commit()
 
     cur.close()
@@ -144,6 +147,59 @@ def get_drug_records_by_user_id(user_id: int) -> List[drug_record]:
     return records
 
 
+# ---------- KEYSET PAGE (newest first), optionally date-bounded ----------
+def get_drug_records_page(
+    user_id: int,
+    limit: int,
+    after: Optional[keyset.Key] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Tuple[List[drug_record], Optional[keyset.Key]]:
+    """
+    Up to `limit` records of the user within [start, end], ordered by
+    (expected_date, expected_time, id) descending, untimed records first
+    within a day as in get_drug_records_by_user_id, and strictly after the
+    key `after` (the key of the previous page's last record). Returns the
+    records and the key to pass as `after` for the next page, or None on
+    the last page.
+    """
+    conn = mydb()
+    cur = conn.cursor()
+
+    clauses = ["user_id = %s"]
+    params = [user_id]
+    if start is not None:
+        clauses.append("expected_date >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("expected_date <= %s")
+        params.append(end)
+    if after is not None:
+        clauses.append(
+            "(expected_date, expected_time IS NULL, COALESCE(expected_time, TIME '00:00'), id) < (%s, %s, %s, %s)")
+        params.extend(keyset.seek_params(after))
+
+    query = f"""
+        SELECT *
+        FROM drug_records
+        WHERE {' AND '.join(clauses)}
+        ORDER BY expected_date DESC, expected_time IS NULL DESC, COALESCE(expected_time, TIME '00:00') DESC, id DESC
+        LIMIT %s
+    """
+    cur.execute(query, (*params, limit + 1))
+    rows = cur.fetchall()
+
+    records = [_row_to_drug_record(cur, row) for row in rows[:limit]]
+
+    cur.close()
+    conn.close()
+
+    if len(rows) <= limit:
+        return records, None
+    last = records[-1]
+    return records, keyset.key(last.expected_date, last.expected_time, last.id)
+
+
 # ---------- GET by DATE RANGE ----------
 def get_drug_records_by_date_range(
     user_id: int,
@@ -176,8 +232,14 @@ def delete_drug_record(record_id: int) -> bool:
     conn = mydb()
     cur = conn.cursor()
 
-    cur.execute("DELETE FROM drug_records WHERE id = %s", (record_id,))
+    cur.execute(
+        "DELETE FROM drug_records WHERE id = %s RETURNING user_id, expected_date",
+        (record_id,),
+    )
     deleted = cur.rowcount > 0
+    row = cur.fetchone()
+    if deleted and row:
+        adherence_repo.refresh_day_counts(cur, row[0], row[1])
 
     conn.commit()
     cur.close()
@@ -206,6 +268,7 @@ def update_drug_record(
             notes = %s,
             updated_at = NOW()
         WHERE id = %s
+        RETURNING user_id, expected_date
     """
 
     cur.execute(query, (
@@ -215,6 +278,9 @@ def update_drug_record(
     ))
 
     updated = cur.rowcount > 0
+    row = cur.fetchone()
+    if updated and row:
+        adherence_repo.refresh_day_counts(cur, row[0], row[1])
 
     conn.commit()
     cur.close()
@@ -304,28 +370,188 @@ def get_drug_record_by_unique(
     conn.close()
     return record
 
-# Get recent completed drug records within given days
-def get_recent_completed_drug_records(
-    days: int,
-    now: datetime
-) -> List[drug_record]:
+# ---------- TOGGLE a planned dose (mark / unmark as taken) ----------
+# One statement: delete the dose's record if there is one, otherwise insert
+# it. Relies on uq_drug_records_dose (utils/migrations.py, version 2), so a
+# double click racing itself cannot create a duplicate: the second insert
+# waits for the first and then does nothing.
+_TOGGLE_SQL = """
+    WITH deleted AS (
+        DELETE FROM drug_records
+        WHERE user_id = %(user_id)s
+          AND plan_item_id = %(plan_item_id)s
+          AND expected_date = %(expected_date)s
+          AND expected_time IS NOT DISTINCT FROM %(expected_time)s::time
+        RETURNING id
+    ), inserted AS (
+        INSERT INTO drug_records (
+            user_id, drug_id, expected_date, expected_time,
+            plan_item_id, status
+        )
+        SELECT %(user_id)s, %(drug_id)s, %(expected_date)s, %(expected_time)s::time,
+               %(plan_item_id)s, %(status)s
+        WHERE %(allow_create)s AND NOT EXISTS (SELECT 1 FROM deleted)
+        ON CONFLICT (user_id, plan_item_id, expected_date, expected_time)
+            WHERE plan_item_id IS NOT NULL
+            DO NOTHING
+        RETURNING id
+    )
+    SELECT 'deleted', id FROM deleted
+    UNION ALL
+    SELECT 'created', id FROM inserted
+"""
+
+
+def toggle_drug_taken(
+    user_id: int,
+    drug_id: int,
+    plan_item_id: int,
+    expected_date: date,
+    expected_time: Optional[dt_time],
+    status: str = "TAKEN",
+    allow_create: bool = True,
+) -> Tuple[str, Optional[int]]:
+    """
+    Delete the record of this dose if it exists, else create it with
+    `status` (only if allow_create). Returns (action, record id) with
+    action "deleted", "created" or "unchanged" (nothing to delete and
+    creating not allowed, or a concurrent toggle created it first).
+    """
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(_TOGGLE_SQL, {
+            "user_id": user_id,
+            "drug_id": drug_id,
+            "plan_item_id": plan_item_id,
+            "expected_date": expected_date,
+            "expected_time": expected_time,
+            "status": status,
+            "allow_create": allow_create,
+        })
+        row = cur.fetchone()
+        if row:
+            adherence_repo.refresh_day_counts(cur, user_id, expected_date)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("toggle_drug_taken ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    if not row:
+        return "unchanged", None
+    return row[0], row[1]
+
+
+# ---------- BULK mark planned doses as taken ----------
+# Always returns one row per dose: (new record id or NULL, whether the plan
+# item exists and belongs to the user). NULL id + TRUE = already recorded.
+_MARK_TAKEN_SQL = """
+    WITH item AS (
+        SELECT pi.id, pi.drug_id
+        FROM plan_item pi
+        JOIN plan p ON p.id = pi.plan_id
+        WHERE pi.id = %(plan_item_id)s AND p.patient_id = %(user_id)s
+    ), inserted AS (
+        INSERT INTO drug_records (
+            user_id, drug_id, expected_date, expected_time,
+            plan_item_id, status
+        )
+        SELECT %(user_id)s, item.drug_id, %(expected_date)s, %(expected_time)s::time,
+               item.id, %(status)s
+        FROM item
+        ON CONFLICT (user_id, plan_item_id, expected_date, expected_time)
+            WHERE plan_item_id IS NOT NULL
+            DO NOTHING
+        RETURNING id
+    )
+    SELECT (SELECT id FROM inserted), EXISTS (SELECT 1 FROM item)
+"""
+
+
+def mark_doses_taken(
+    user_id: int,
+    doses: List[Tuple[int, date, Optional[dt_time]]],
+    status: str = "TAKEN",
+) -> List[Tuple[str, Optional[int]]]:
+    """
+    Record each (plan_item_id, expected_date, expected_time) dose of the
+    user as taken, in one transaction and one batched statement. Returns
+    (action, record id) per dose, in order: "created", "exists" (already
+    recorded) or "not_found" (no such plan item for this user).
+    """
+    if not doses:
+        return []
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.executemany(_MARK_TAKEN_SQL, [
+            {
+                "user_id": user_id,
+                "plan_item_id": plan_item_id,
+                "expected_date": expected_date,
+                "expected_time": expected_time,
+                "status": status,
+            }
+            for plan_item_id, expected_date, expected_time in doses
+        ], returning=True)
+
+        results = []
+        while True:
+            new_id, item_exists = cur.fetchone()
+            if new_id is not None:
+                results.append(("created", new_id))
+            else:
+                results.append(("exists" if item_exists else "not_found", None))
+            if not cur.nextset():
+                break
+
+        created_days = {d[1] for d, (action, _) in zip(doses, results) if action == "created"}
+        for day in sorted(created_days):
+            adherence_repo.refresh_day_counts(cur, user_id, day)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("mark_doses_taken ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    return results
+
+
+# Keys (user_id, plan_item_id, expected_date, expected_time) of TAKEN records
+# for a few users over a date range; used to drop doses already taken before
+# a reminder goes out.
+def get_taken_dose_keys(
+    user_ids: List[int],
+    from_date: date,
+    to_date: date,
+) -> set:
+    if not user_ids:
+        return set()
+
     conn = mydb()
     cur = conn.cursor()
 
     query = """
-        SELECT *
+        SELECT user_id, plan_item_id, expected_date, expected_time
         FROM drug_records
         WHERE status = 'TAKEN'
-          AND expected_date >= %s
-        ORDER BY expected_date DESC, expected_time DESC
+          AND user_id = ANY(%s)
+          AND expected_date BETWEEN %s AND %s
     """
-
-    start_date = now.date() - timedelta(days=days)
-    cur.execute(query, (start_date,))
+    cur.execute(query, (list(user_ids), from_date, to_date))
     rows = cur.fetchall()
 
-    records = [_row_to_drug_record(cur, row) for row in rows]
-
     cur.close()
     conn.close()
-    return records
+    return {tuple(row) for row in rows}
+
@@ -1,9 +1,13 @@
-from dataclasses import dataclass, asdict
+import threading
+from array import array
+from dataclasses import dataclass, asdict, fields
 from typing import List, Optional
 from config import mydb
 import config
+from utils.snapshot import StringColumn, read_snapshot, string_sections, write_snapshot
+from utils.text_index import NgramIndex, top_ranked
 
-drugs = []  # TODO: optimize if query is slow
+drugs = []  # the published DrugCatalogue's list; see _current()
 
 # =============== dataclass model ===============
 
@@ -62,8 +66,86 @@ def _row_to_drug(cur, row) -> drug:
     )
 
 
+# =============== in-memory catalogue ===============
+
+class DrugCatalogue:
+    """
+    One generation of the in-memory catalogue and its indexes.
+
+    A published catalogue is never modified: refreshes build a new one
+    (see extended()) and swap it in, so a request that grabbed the current
+    catalogue sees the drugs list, id / ndc dicts and search index of the
+    same generation even while a refresh runs.
+    """
+
+    def __init__(self, items: List[drug], version=None, search_index=None):
+        self.drugs = items
+        self.size = len(items)
+        self.version = version  # (row count, max id) it was loaded at
+        self.by_id = {}
+        self.by_ndc = {}
+        self._index(items)
+        if search_index is None:
+            search_index = NgramIndex((d.brand_name, d.generic_name) for d in items)
+        self.search_index = search_index
+
+    def _index(self, items: List[drug]) -> None:
+        for d in items:
+            self.by_id.setdefault(d.id, d)
+            if d.product_ndc:
+                self.by_ndc.setdefault(d.product_ndc, d)
+
+    def extended(self, new: List[drug], version) -> "DrugCatalogue":
+        """A new catalogue with `new` appended; self is left as it was."""
+        cat = DrugCatalogue.__new__(DrugCatalogue)
+        cat.drugs = self.drugs + new
+        cat.size = len(cat.drugs)
+        cat.version = version
+        cat.by_id = dict(self.by_id)
+        cat.by_ndc = dict(self.by_ndc)
+        cat._index(new)
+        cat.search_index = self.search_index.extended((d.brand_name, d.generic_name) for d in new)
+        return cat
+
+
+_catalogue = DrugCatalogue([])
+_swap_lock = threading.Lock()
+
+
+def _publish(cat: DrugCatalogue) -> None:
+    global _catalogue, drugs
+    with _swap_lock:
+        drugs = cat.drugs
+        _catalogue = cat
+
+
+def _current() -> DrugCatalogue:
+    """The published catalogue, re-indexed if `drugs` was replaced or edited directly."""
+    global _catalogue
+    cat = _catalogue
+    if cat.drugs is drugs and cat.size == len(drugs):
+        return cat
+    with _swap_lock:
+        cat = _catalogue
+        if cat.drugs is not drugs or cat.size != len(drugs):
+            cat = _catalogue = DrugCatalogue(drugs)
+        return cat
+
+
+def loaded_drugs_version() -> Optional[tuple]:
+    """(row count, max id) the in-memory catalogue was loaded at, if known."""
+    return _current().version
+
+
+def _version_after(cat: DrugCatalogue, new: List[drug]) -> tuple:
+    count, max_id = cat.version or (cat.size, 0)
+    return (count + len(new), max([max_id] + [d.id for d in new]))
+
+
 # =============== repo functions ===============
+
 def get_drugs():
+    """Load the whole catalogue from the database and publish it."""
     conn = mydb()
     cur = conn.cursor()
 
@@ -74,19 +156,65 @@ def get_drugs():
             marketing_category, product_type, application_number,
             marketing_start_date, listing_expiration_date, finished
         FROM drugs
+        ORDER BY id
     """
     if config.FLASK_ENV == "dev":
         query += " LIMIT 100"
 
     cur.execute(query)
     rows = cur.fetchall()
-    for row in rows:
-        d = _row_to_drug(cur, row)
-        drugs.append(d)
+    loaded = [_row_to_drug(cur, row) for row in rows]
     cur.close()
     conn.close()
 
-    pass
+    _publish(DrugCatalogue(loaded, version=(len(loaded), max((d.id for d in loaded), default=0))))
+
+
+def load_drugs_since(after_id: int) -> int:
+    """
+    Append rows with id > after_id to the catalogue (ids only grow), and
+    publish the result as a new generation. Returns the number of rows added.
+    """
+    conn = mydb()
+    cur = conn.cursor()
+    query = """
+        SELECT
+            id, product_ndc, brand_name, brand_name_base,
+            generic_name, labeler_name, dosage_form, route,
+            marketing_category, product_type, application_number,
+            marketing_start_date, listing_expiration_date, finished
+        FROM drugs
+        WHERE id > %s
+        ORDER BY id
+    """
+    if config.FLASK_ENV == "dev":
+        query += " LIMIT 100"
+    cur.execute(query, (after_id,))
+    rows = cur.fetchall()
+    new = [_row_to_drug(cur, row) for row in rows]
+    cur.close()
+    conn.close()
+
+    if new:
+        cat = _current()
+        _publish(cat.extended(new, _version_after(cat, new)))
+    return len(new)
+
+
+def get_drugs_version() -> tuple:
+    """(row count, max id) of the rows get_drugs() would load right now."""
+    conn = mydb()
+    cur = conn.cursor()
+
+    query = "SELECT id FROM drugs ORDER BY id"
+    if config.FLASK_ENV == "dev":
+        query += " LIMIT 100"
+
+    cur.execute(f"SELECT count(*), coalesce(max(id), 0) FROM ({query}) t")
+    count, max_id = cur.fetchone()
+    cur.close()
+    conn.close()
+    return (count, max_id)
 
 
 def get_drug_by_id(id: int) -> Optional[drug]:
@@ -151,39 +279,81 @@ def get_drugs_by_ids(ids: List[int]) -> List[drug]:
     return drugs
 
 
+# =============== snapshot ===============
+
+_STR_FIELDS = [f.name for f in fields(drug) if f.name not in ("id", "finished")]
+
+
+def save_drugs_snapshot(path: str) -> None:
+    """Write the loaded catalogue and its search index to `path`."""
+    cat = _current()
+    drugs = cat.drugs
+    sections = {
+        "id": array("q", (d.id for d in drugs)),
+        # 0 / 1, or 2 for NULL
+        "finished": bytes(2 if d.finished is None else int(d.finished) for d in drugs),
+    }
+    for name in _STR_FIELDS:
+        sections.update(string_sections(name, (getattr(d, name) for d in drugs)))
+    sections.update(cat.search_index.to_sections("index"))
+    meta = {"table": "drugs", "version": list(cat.version or (len(drugs), 0))}
+    write_snapshot(path, meta, sections)
+
+
+def load_drugs_snapshot(path: str) -> bool:
+    """Publish the catalogue from a snapshot file; False if there is none."""
+    snap = read_snapshot(path)
+    if snap is None or snap.meta.get("table") != "drugs":
+        return False
+
+    ids = snap.section("id")
+    finished = snap.section("finished")
+    cols = [StringColumn(snap, name) for name in _STR_FIELDS]
+    loaded = []
+    for i in range(len(ids)):
+        kw = {name: col[i] for name, col in zip(_STR_FIELDS, cols)}
+        loaded.append(drug(id=ids[i], finished=None if finished[i] == 2 else bool(finished[i]), **kw))
+
+    index = NgramIndex.from_snapshot(snap, "index", rows=len(loaded), width=2)
+    _publish(DrugCatalogue(loaded, version=tuple(snap.meta["version"]), search_index=index))
+    return True
+
+
 def get_drug_by_id_locally(id: int) -> Optional[drug]:
-    for d in drugs:
-        if d.id == id:
-            return d
-    return None
+    return _current().by_id.get(id)
 
 
 def get_drugs_by_ids_locally(ids: List[int]) -> List[drug]:
-    return [d for d in drugs if d.id in ids]
+    drugs_by_id = _current().by_id
+    res = []
+    for i in dict.fromkeys(ids):
+        d = drugs_by_id.get(i)
+        if d is not None:
+            res.append(d)
+    return res
 
 def get_drug_by_ndc_locally(ndc: str) -> Optional[drug]:
-    for d in drugs:
-        if d.product_ndc and d.product_ndc == ndc:
-            return d
-    return None
+    return _current().by_ndc.get(ndc)
 
 
 def get_sample_drugs_locally() -> List[drug]:
     return drugs[:100]
 
+def _drug_rank(drugs: List[drug]):
+    """Search rank of a catalogue position: branded first, then shorter names."""
+    def rank(pos: int):
+        x = drugs[pos]
+        return (x.brand_name is None,
+                x.generic_name is None,
+                len(x.brand_name) if x.brand_name else float('inf'),
+                len(x.generic_name) if x.generic_name else float('inf'))
+    return rank
+
+
 # Retrieve drugs whose brand_name or generic_name contain all the provided names (case-insensitive)
-def search_drugs_by_keywords_locally(names: List[str]) -> List[drug]:
+def search_drugs_by_keywords_locally(names: List[str], limit: int = 100, offset: int = 0) -> List[drug]:
+    cat = _current()
     if not names or all(name == "" for name in names):
-        return drugs[:100]  # Return first 100 drugs as default if name is empty
-    res = []
-    names = [name.lower() for name in names]
-    
-    for drug in drugs:
-        if drug.brand_name and all(name in drug.brand_name.lower() for name in names):
-            res.append(drug)
-        elif drug.generic_name and all(name in drug.generic_name.lower() for name in names):
-            res.append(drug)
-    return sorted(res, key=lambda x: (x.brand_name is None, 
-                                      x.generic_name is None, 
-                                      len(x.brand_name) if x.brand_name else float('inf'),
-                                      len(x.generic_name) if x.generic_name else float('inf')))[:100]
\ No newline at end of file
+        return cat.drugs[offset:offset + limit]  # Return first drugs as default if name is empty
+    top = top_ranked(cat.search_index.search(names), _drug_rank(cat.drugs), limit, offset)
+    return [cat.drugs[pos] for pos in top]
@@ -103,6 +103,29 @@ def get_feedback_by_date(
     return feedback
 
 
+# ---------- PATIENTS WITH FEEDBACK ON A DAY (bulk) ----------
+def get_patient_ids_with_feedback(
+    patient_ids: List[int],
+    feedback_date: date
+) -> set:
+    """Which of `patient_ids` have feedback for `feedback_date`, in one query."""
+    if not patient_ids:
+        return set()
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    query = """
+        SELECT patient_id FROM doctor_feedbacks
+        WHERE patient_id = ANY(%s) AND feedback_date = %s
+    """
+    cur.execute(query, (list(patient_ids), feedback_date))
+    rows = cur.fetchall()
+
+    cur.close()
+    conn.close()
+    return {row[0] for row in rows}
+
 # ---------- GET BY DATE RANGE ----------
 def get_feedbacks_by_date_range(
     patient_id: int,
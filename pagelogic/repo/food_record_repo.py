@@ -1,7 +1,8 @@
 from dataclasses import dataclass, asdict
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import date, time as dt_time, datetime
 from config import mydb
+from utils import keyset
 
 @dataclass
 class food_record:
@@ -141,6 +142,57 @@ def get_food_records_by_user_id(user_id: int) -> List[food_record]:
     conn.close()
     return records
 
+# ---- KEYSET PAGE (newest first), optionally date-bounded ----
+def get_food_records_page(
+    user_id: int,
+    limit: int,
+    after: Optional[keyset.Key] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Tuple[List[food_record], Optional[keyset.Key]]:
+    """
+    Up to `limit` records of the user within [start, end], ordered by
+    (eaten_date, eaten_time, id) descending, untimed records first within
+    a day, and strictly after the key `after` (the key of the previous page's last record). Returns the
+    records and the key to pass as `after` for the next page, or None on
+    the last page.
+    """
+    conn = mydb()
+    cur = conn.cursor()
+
+    clauses = ["user_id = %s"]
+    params = [user_id]
+    if start is not None:
+        clauses.append("eaten_date >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("eaten_date <= %s")
+        params.append(end)
+    if after is not None:
+        clauses.append(
+            "(eaten_date, eaten_time IS NULL, COALESCE(eaten_time, TIME '00:00'), id) < (%s, %s, %s, %s)")
+        params.extend(keyset.seek_params(after))
+
+    query = f"""
+        SELECT *
+        FROM food_records
+        WHERE {' AND '.join(clauses)}
+        ORDER BY eaten_date DESC, eaten_time IS NULL DESC, COALESCE(eaten_time, TIME '00:00') DESC, id DESC
+        LIMIT %s
+    """
+    cur.execute(query, (*params, limit + 1))
+    rows = cur.fetchall()
+
+    records = [_row_to_food_record(cur, row) for row in rows[:limit]]
+
+    cur.close()
+    conn.close()
+
+    if len(rows) <= limit:
+        return records, None
+    last = records[-1]
+    return records, keyset.key(last.eaten_date, last.eaten_time, last.id)
+
 # ---- GET by DATE RANGE ----
 def get_food_records_by_date_range(
     user_id: int,
@@ -1,10 +1,16 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left
 from dataclasses import dataclass, asdict
-from typing import List, Optional
+from typing import Iterable, List, Optional, Sequence
 from unicodedata import name
 from config import mydb
 import config
+from utils.snapshot import read_snapshot, write_snapshot
+from utils.text_index import NgramIndex, top_ranked
 
-foods = []
+foods = []  # the published FoodCatalogue's table; plain lists are converted on first use
 
 @dataclass
 class food:
@@ -60,68 +66,442 @@ def _row_to_food(cur, row):
     )
 
 
+
+# =============== columnar storage ===============
+
+_INT_NULL = -(2 ** 63)  # stands in for NULL in the int64 columns
+
+# Column order matches the `food` dataclass fields
+FOOD_COLUMNS = (
+    "id", "fdc_id", "description", "fat", "carbonhydrate", "calories",
+    "data_type", "food_category_id", "publication_date", "food_category_num",
+)
+
+
+def _copy(typecode: str, data) -> array:
+    a = array(typecode)
+    a.frombytes(memoryview(data).cast("B"))
+    return a
+
+
+class _InternedColumn:
+    """Low-cardinality strings stored once, referenced by a uint32 code per row."""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes_by_value = {}
+        self.codes = array("I")
+
+    def append(self, value: Optional[str]) -> None:
+        code = self._codes_by_value.get(value)
+        if code is None:
+            code = self._codes_by_value[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    @classmethod
+    def from_values(cls, values: List[Optional[str]], codes) -> "_InternedColumn":
+        col = cls()
+        col.values = list(values)
+        col._codes_by_value = {v: i for i, v in enumerate(col.values)}
+        col.codes = codes
+        return col
+
+    def code_of(self, value: Optional[str]) -> Optional[int]:
+        return self._codes_by_value.get(value)
+
+    def __getitem__(self, pos: int) -> Optional[str]:
+        return self.values[self.codes[pos]]
+
+
+class FoodTable:
+    """
+    Column-oriented food catalogue.
+
+    Numbers live in typed arrays, repeated strings (data_type, category,
+    publication_date) are interned, and all descriptions share one UTF-8
+    buffer. Indexing returns a freshly built `food`, so callers keep using
+    the dataclass API while the table itself holds no per-row objects.
+    """
+
+    def __init__(self, rows: Iterable[Sequence] = ()):
+        self.ids = array("q")
+        self.fdc_ids = array("q")
+        self.fat = array("d")
+        self.carbonhydrate = array("d")
+        self.calories = array("d")
+        self.food_category_num = array("q")
+        self.data_type = _InternedColumn()
+        self.food_category_id = _InternedColumn()
+        self.publication_date = _InternedColumn()
+
+        self._desc_buf = bytearray()
+        self._desc_offsets = array("q", [0])
+        self._desc_null = bytearray()  # 1 where description IS NULL
+        self.desc_len = array("I")      # character length, for ranking
+
+        for row in rows:
+            self._append(row)
+
+        # ids normally arrive sorted (ORDER BY id); otherwise fall back to a dict
+        ids = self.ids
+        self._ids_sorted = all(ids[i] < ids[i + 1] for i in range(len(ids) - 1))
+        self._pos_by_id = None if self._ids_sorted else {v: i for i, v in enumerate(ids)}
+
+    @classmethod
+    def from_foods(cls, items: Iterable[food]) -> "FoodTable":
+        return cls(
+            (f.id, f.fdc_id, f.description, f.fat, f.carbonhydrate, f.calories,
+             f.data_type, f.food_category_id, f.publication_date, f.food_category_num)
+            for f in items
+        )
+
+    # Typed columns, in snapshot section order
+    _ARRAYS = ("ids", "fdc_ids", "fat", "carbonhydrate", "calories", "food_category_num",
+               "_desc_offsets", "desc_len")
+    _INTERNED = ("data_type", "food_category_id", "publication_date")
+
+    def to_sections(self):
+        """(meta, sections) for utils.snapshot.write_snapshot()."""
+        sections = {name: getattr(self, name) for name in self._ARRAYS}
+        sections["_desc_buf"] = bytes(self._desc_buf)
+        sections["_desc_null"] = bytes(self._desc_null)
+        meta = {"ids_sorted": self._ids_sorted}
+        for name in self._INTERNED:
+            col = getattr(self, name)
+            sections[f"{name}.codes"] = col.codes
+            meta[f"{name}.values"] = col.values
+        return meta, sections
+
+    @classmethod
+    def from_snapshot(cls, snap) -> "FoodTable":
+        """A table backed by memoryviews over a mapped snapshot (read-only)."""
+        table = cls.__new__(cls)
+        for name in cls._ARRAYS:
+            setattr(table, name, snap.section(name))
+        table._desc_buf = snap.section("_desc_buf")
+        table._desc_null = snap.section("_desc_null")
+        for name in cls._INTERNED:
+            setattr(table, name, _InternedColumn.from_values(
+                snap.meta[f"{name}.values"], snap.section(f"{name}.codes")))
+        table._ids_sorted = snap.meta["ids_sorted"]
+        table._pos_by_id = None if table._ids_sorted else {v: i for i, v in enumerate(table.ids)}
+        return table
+
+    def extended(self, rows: Iterable[Sequence]) -> "FoodTable":
+        """
+        A new table with `rows` (FOOD_COLUMNS order) appended. Columns are
+        copied, so this table - possibly backed by a read-only snapshot -
+        is left untouched for readers still using it.
+        """
+        table = FoodTable.__new__(FoodTable)
+        for name in self._ARRAYS:
+            col = getattr(self, name)
+            setattr(table, name, _copy(memoryview(col).format, col))
+        table._desc_buf = bytearray(self._desc_buf)
+        table._desc_null = bytearray(self._desc_null)
+        for name in self._INTERNED:
+            col = getattr(self, name)
+            setattr(table, name, _InternedColumn.from_values(col.values, _copy("I", col.codes)))
+
+        old_len = len(self)
+        for row in rows:
+            table._append(row)
+
+        ids = table.ids
+        new_sorted = all(ids[i] < ids[i + 1] for i in range(max(old_len - 1, 0), len(ids) - 1))
+        table._ids_sorted = self._ids_sorted and new_sorted
+        table._pos_by_id = None if table._ids_sorted else {v: i for i, v in enumerate(ids)}
+        return table
+
+    def _append(self, row: Sequence) -> None:
+        (id_, fdc_id, description, fat, carbonhydrate, calories,
+         data_type, food_category_id, publication_date, food_category_num) = row
+
+        self.ids.append(id_)
+        self.fdc_ids.append(_INT_NULL if fdc_id is None else fdc_id)
+        self.fat.append(math.nan if fat is None else fat)
+        self.carbonhydrate.append(math.nan if carbonhydrate is None else carbonhydrate)
+        self.calories.append(math.nan if calories is None else calories)
+        self.food_category_num.append(_INT_NULL if food_category_num is None else food_category_num)
+        self.data_type.append(data_type)
+        self.food_category_id.append(food_category_id)
+        self.publication_date.append(publication_date)
+
+        self._desc_null.append(description is None)
+        description = description or ""
+        self._desc_buf += description.encode("utf-8")
+        self._desc_offsets.append(len(self._desc_buf))
+        self.desc_len.append(len(description))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def description(self, pos: int) -> Optional[str]:
+        if self._desc_null[pos]:
+            return None
+        start, end = self._desc_offsets[pos], self._desc_offsets[pos + 1]
+        return str(self._desc_buf[start:end], "utf-8")
+
+    def row(self, pos: int) -> food:
+        """Materialise one row as a `food` dataclass."""
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("FoodTable index out of range")
+
+        def num(v):
+            return None if v != v else v  # NaN -> NULL
+
+        def integer(v):
+            return None if v == _INT_NULL else v
+
+        return food(
+            id=self.ids[pos],
+            fdc_id=integer(self.fdc_ids[pos]),
+            description=self.description(pos),
+            fat=num(self.fat[pos]),
+            carbonhydrate=num(self.carbonhydrate[pos]),
+            calories=num(self.calories[pos]),
+            data_type=self.data_type[pos],
+            food_category_id=self.food_category_id[pos],
+            publication_date=self.publication_date[pos],
+            food_category_num=integer(self.food_category_num[pos]),
+        )
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.row(i) for i in range(*key.indices(len(self)))]
+        return self.row(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def position_of(self, id: int) -> Optional[int]:
+        if self._pos_by_id is not None:
+            return self._pos_by_id.get(id)
+        i = bisect_left(self.ids, id)
+        if i < len(self.ids) and self.ids[i] == id:
+            return i
+        return None
+
+    def filter_positions(
+        self,
+        max_calories: Optional[float] = None,
+        max_fat: Optional[float] = None,
+        max_carbonhydrate: Optional[float] = None,
+    ) -> List[int]:
+        """
+        Positions whose nutrients are all <= the given bounds, scanning only
+        the needed columns (NULL/NaN never matches a bound). The arrays also
+        expose the buffer protocol, e.g. numpy.frombuffer(table.calories).
+        """
+        bounds = [(col, limit) for col, limit in (
+            (self.calories, max_calories),
+            (self.fat, max_fat),
+            (self.carbonhydrate, max_carbonhydrate),
+        ) if limit is not None]
+        positions = range(len(self))
+        for col, limit in bounds:
+            positions = [i for i in positions if col[i] <= limit]
+        return list(positions)
+
+
+# =============== in-memory catalogue ===============
+
+class FoodCatalogue:
+    """
+    One generation of the in-memory catalogue: the table, its search index
+    and the (row count, max id) it was loaded at. Never modified once
+    published; refreshes build a new one and swap it in.
+    """
+
+    def __init__(self, table: FoodTable, version=None, search_index=None):
+        self.table = table
+        self.size = len(table)
+        self.version = version
+        if search_index is None:
+            search_index = NgramIndex((table.description(i),) for i in range(len(table)))
+        self.search_index = search_index
+
+    def extended(self, rows: List[Sequence], version) -> "FoodCatalogue":
+        """A new catalogue with `rows` appended; self is left as it was."""
+        table = self.table.extended(rows)
+        index = self.search_index.extended((table.description(i),) for i in range(self.size, len(table)))
+        return FoodCatalogue(table, version=version, search_index=index)
+
+
+_catalogue = FoodCatalogue(FoodTable())
+_swap_lock = threading.Lock()
+
+
+def _publish(cat: FoodCatalogue) -> None:
+    global _catalogue, foods
+    with _swap_lock:
+        foods = cat.table
+        _catalogue = cat
+
+
+def _current() -> FoodCatalogue:
+    """The published catalogue; `foods` replaced directly is converted and indexed here."""
+    global _catalogue, foods
+    cat = _catalogue
+    if cat.table is foods and cat.size == len(foods):
+        return cat
+    with _swap_lock:
+        cat = _catalogue
+        if cat.table is not foods or cat.size != len(foods):
+            if not isinstance(foods, FoodTable):
+                foods = FoodTable.from_foods(foods)
+            cat = _catalogue = FoodCatalogue(foods)
+        return cat
+
+
+def _table() -> FoodTable:
+    return _current().table
+
+
+def loaded_foods_version() -> Optional[tuple]:
+    """(row count, max id) the in-memory catalogue was loaded at, if known."""
+    return _current().version
+
+
+def _rows_from_cursor(cur) -> List[tuple]:
+    columns = [desc[0] for desc in cur.description]
+    picks = [columns.index(c) for c in FOOD_COLUMNS]
+    return [tuple(row[i] for i in picks) for row in cur.fetchall()]
+
+
 def get_foods():
-    global foods
     conn = mydb()
     cur = conn.cursor()
 
 
     try:
-        sql_message = "SELECT * FROM foods"
+        sql_message = "SELECT * FROM foods ORDER BY id"
         if config.FLASK_ENV == "dev":
             sql_message += " LIMIT 100"
 
         cur.execute(sql_message)
-        
-        rows = cur.fetchall()
-        foods = [_row_to_food(cur, row) for row in rows]
-        return foods
+
+        table = FoodTable(_rows_from_cursor(cur))
+        _publish(FoodCatalogue(table, version=(len(table), max(table.ids, default=0))))
+        return table
+    finally:
+        cur.close()
+        conn.close()
+
+def get_foods_version() -> tuple:
+    """(row count, max id) of the rows get_foods() would load right now."""
+    conn = mydb()
+    cur = conn.cursor()
+    try:
+        sql_message = "SELECT id FROM foods ORDER BY id"
+        if config.FLASK_ENV == "dev":
+            sql_message += " LIMIT 100"
+        cur.execute(f"SELECT count(*), coalesce(max(id), 0) FROM ({sql_message}) t")
+        count, max_id = cur.fetchone()
+        return (count, max_id)
+    finally:
+        cur.close()
+        conn.close()
+
+
+def load_foods_since(after_id: int) -> int:
+    """
+    Append rows with id > after_id to the catalogue (ids only grow), and
+    publish the result as a new generation. Returns the number of rows added.
+    """
+    conn = mydb()
+    cur = conn.cursor()
+    try:
+        sql_message = "SELECT * FROM foods WHERE id > %s ORDER BY id"
+        if config.FLASK_ENV == "dev":
+            sql_message += " LIMIT 100"
+        cur.execute(sql_message, (after_id,))
+        rows = _rows_from_cursor(cur)
     finally:
         cur.close()
         conn.close()
 
+    if rows:
+        cat = _current()
+        count, max_id = cat.version or (cat.size, 0)
+        version = (count + len(rows), max([max_id] + [r[0] for r in rows]))
+        _publish(cat.extended(rows, version))
+    return len(rows)
+
+
+def save_foods_snapshot(path: str) -> None:
+    """Write the loaded table and its search index to `path`."""
+    cat = _current()
+    meta, sections = cat.table.to_sections()
+    sections.update(cat.search_index.to_sections("index"))
+    meta.update(table="foods", version=list(cat.version or (cat.size, 0)))
+    write_snapshot(path, meta, sections)
+
+
+def load_foods_snapshot(path: str) -> bool:
+    """Publish the catalogue from a snapshot file; False if there is none."""
+    snap = read_snapshot(path)
+    if snap is None or snap.meta.get("table") != "foods":
+        return False
+    table = FoodTable.from_snapshot(snap)
+    index = NgramIndex.from_snapshot(snap, "index", rows=len(table), width=1)
+    _publish(FoodCatalogue(table, version=tuple(snap.meta["version"]), search_index=index))
+    return True
+
+
 def get_food_by_id(id: int) -> Optional[food]:
-    for f in foods:
-        if f.id == id:
-            return f
-    return None
+    return get_food_by_id_locally(id)
 
 def get_foods_by_ids(ids: List[int]) -> List[food]:
-    return [f for f in foods if f.id in ids]
+    return get_foods_by_ids_locally(ids)
 
 def get_foods_locally() -> List[food]:
-    return foods
+    return _table()
 
 def get_food_by_id_locally(id: int) -> Optional[food]:
-    for f in foods:
-        if f.id == id:
-            return f
-    return None
+    table = _table()
+    pos = table.position_of(id)
+    return None if pos is None else table[pos]
 
 def get_foods_by_name_locally(name: str) -> Optional[food]:
+    # Case-sensitive substring match; the (lowercase) index narrows candidates
+    cat = _current()
+    table = cat.table
     res = []
-    for food in foods:
-        if name in food.description:
-            res.append(food)
+    for pos in cat.search_index.search([name]) if name else range(len(table)):
+        if name in (table.description(pos) or ""):
+            res.append(table[pos])
     return res
 
 
 def get_sample_foods_locally() -> List[food]:
-    return foods[:100]
+    return _table()[:100]
+
+def _food_rank(table: FoodTable):
+    """Search rank of a table position: non-branded first, then shorter descriptions."""
+    branded = table.data_type.code_of("branded_food")
+    codes, desc_len = table.data_type.codes, table.desc_len
+
+    def rank(pos: int):
+        return codes[pos] == branded, desc_len[pos]
+    return rank
+
 
 # Retrieve foods whose descriptions contain all the provided names (case-insensitive)
-def search_foods_by_keywords_locally(names: List[str]) -> List[food]:
+def search_foods_by_keywords_locally(names: List[str], limit: int = 100, offset: int = 0) -> List[food]:
+    cat = _current()
+    table = cat.table
     if not names or all(name == "" for name in names):
-        return foods[:100]  # Return first 100 foods as default if name is empty
-    
-    names = [name.lower() for name in names]
-    res = []
-    for food in foods:
-        if all(name in food.description.lower() for name in names):
-            res.append(food)
-
-    #decrease priority for foods with data_type of "branded_food"
-    return sorted(res, key=lambda x: (x.data_type == "branded_food", len(x.description)))[:100]
+        return table[offset:offset + limit]  # Return first foods as default if name is empty
+    top = top_ranked(cat.search_index.search(names), _food_rank(table), limit, offset)
+    return [table[pos] for pos in top]
 
 def get_foods_by_ids_locally(ids: List[int]) -> List[food]:
-    return [f for f in foods if f.id in ids]
\ No newline at end of file
+    table = _table()
+    positions = {table.position_of(i) for i in ids}
+    positions.discard(None)
+    return [table[pos] for pos in sorted(positions)]
@@ -1,8 +1,11 @@
+import threading
 from dataclasses import dataclass, field
 from datetime import date, time as dt_time
 from typing import List, Optional, Dict
 from config import mydb
+import config
 import utils.serializer as serializer
+from pagelogic.repo import adherence_repo
 
 
 @dataclass
@@ -71,6 +74,64 @@ class plan_item:
         )
 
 
+def _item_field(name):
+    return property(lambda self: getattr(self.item, name), doc=f"plan_item.{name}")
+
+
+class plan_occurrence:
+    """
+    One dated dose of a plan_item, as produced by plan expansion.
+
+    Reads and serialises exactly like a plan_item with date, time and
+    plan_item_rule filled in, but only holds a reference to the item, so an
+    expanded week does not copy drug_name, note, ... into every dose.
+    """
+    __slots__ = ("item", "date", "time", "plan_item_rule")
+
+    id = _item_field("id")
+    plan_id = _item_field("plan_id")
+    drug_id = _item_field("drug_id")
+    drug_name = _item_field("drug_name")
+    dosage = _item_field("dosage")
+    unit = _item_field("unit")
+    amount_literal = _item_field("amount_literal")
+    note = _item_field("note")
+
+    def __init__(self, item, date, time, plan_item_rule):
+        self.item = item
+        self.date = date
+        self.time = time
+        self.plan_item_rule = plan_item_rule
+
+    def to_dict(self) -> dict:
+        # Same keys, order and values as plan_item.to_dict()
+        item = self.item
+        return {
+            "id": item.id,
+            "plan_id": item.plan_id,
+            "drug_id": item.drug_id,
+            "drug_name": item.drug_name,
+            "dosage": item.dosage,
+            "unit": item.unit,
+            "amount_literal": item.amount_literal,
+            "note": item.note,
+            "date": serializer.serialize_for_json(self.date),
+            "time": serializer.serialize_for_json(self.time),
+            "plan_item_rule": serializer.serialize_for_json(self.plan_item_rule),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"PlanOccurrence("
+            f"id={self.id}, "
+            f"drug_name='{self.drug_name}', "
+            f"date={self.date}, "
+            f"time={self.time}, "
+            f"rule_id={self.plan_item_rule.id if self.plan_item_rule else None}"
+            f")"
+        )
+
+
 @dataclass
 class plan:
     id: int
@@ -117,6 +178,7 @@ def get_plan_by_user_id(user_id: int) -> Optional[plan]:
                doctor_name, patient_name
         FROM plan
         WHERE patient_id = %s
+        ORDER BY id
         LIMIT 1
     """
     cur.execute(query, (user_id,))
@@ -143,7 +205,7 @@ def get_plan_by_user_id(user_id: int) -> Optional[plan]:
     )
 
 def get_plans_by_user_ids(user_ids: List[int]) -> List[plan]:
-    """Get plan list for a group of patient_ids."""
+    """Get plan list for a group of patient_ids (lowest plan id per patient)."""
     if not user_ids:
         return []
 
@@ -152,10 +214,12 @@ def get_plans_by_user_ids(user_ids: List[int]) -> List[plan]:
 
     placeholders = ",".join(["%s"] * len(user_ids))
     query = f"""
-        SELECT id, patient_id, doctor_id, name, description,
+        SELECT DISTINCT ON (patient_id)
+               id, patient_id, doctor_id, name, description,
                doctor_name, patient_name
         FROM plan
         WHERE patient_id IN ({placeholders})
+        ORDER BY patient_id, id
     """
     cur.execute(query, tuple(user_ids))
     rows = cur.fetchall()
@@ -179,6 +243,29 @@ def get_plans_by_user_ids(user_ids: List[int]) -> List[plan]:
     return plans
 
 
+def get_patient_ids_with_items(user_ids: List[int]) -> List[int]:
+    """The patients in `user_ids` whose plan has at least one item, in input order."""
+    if not user_ids:
+        return []
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    query = """
+        SELECT DISTINCT ON (p.patient_id) p.patient_id,
+               EXISTS (SELECT 1 FROM plan_item pi WHERE pi.plan_id = p.id)
+        FROM plan p
+        WHERE p.patient_id = ANY(%s)
+        ORDER BY p.patient_id, p.id
+    """
+    cur.execute(query, (list(user_ids),))
+    found = {row[0] for row in cur.fetchall() if row[1]}
+
+    cur.close()
+    conn.close()
+    return [uid for uid in user_ids if uid in found]
+
+
 def get_plan_by_id(plan_id: int) -> Optional[plan]:
     """Get a plan instance by plan.id."""
     conn = mydb()
@@ -354,6 +441,242 @@ def get_plan_item_rules_by_plan_id(plan_id: int) -> Dict[int, List[plan_item_rul
     return item_id_to_rules
 
 
+# ==================== bulk loaders (notification cron) ====================
+# These load every plan with a constant number of queries, instead of the
+# three-per-user round-trips of the functions above.
+
+def get_all_plans() -> Dict[int, plan]:
+    """Return {patient_id: plan} for every patient with a plan (lowest plan id wins)."""
+    conn = mydb()
+    cur = conn.cursor()
+
+    query = """
+        SELECT DISTINCT ON (p.patient_id)
+               p.id, p.patient_id, p.doctor_id, p.name, p.description,
+               p.doctor_name, p.patient_name
+        FROM plan p
+        JOIN users u ON u.id = p.patient_id
+        ORDER BY p.patient_id, p.id
+    """
+    cur.execute(query)
+    rows = cur.fetchall()
+
+    plans = dict()
+    for row in rows:
+        rd = _row_to_dict(cur, row)
+        plans[rd["patient_id"]] = plan(
+            id=rd["id"],
+            patient_id=rd["patient_id"],
+            doctor_id=rd["doctor_id"],
+            name=rd["name"],
+            description=rd.get("description"),
+            doctor_name=rd.get("doctor_name"),
+            patient_name=rd.get("patient_name"),
+        )
+
+    cur.close()
+    conn.close()
+    return plans
+
+
+def get_plan_items_by_plan_ids(plan_ids: List[int]) -> Dict[int, List[plan_item]]:
+    """Return {plan_id: [plan_item, ...]} for a group of plans in one query."""
+    if not plan_ids:
+        return {}
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    # One array parameter rather than a placeholder per id: the list can be long
+    query = """
+        SELECT id, plan_id, drug_id, dosage, unit,
+               amount_literal, note
+        FROM plan_item
+        WHERE plan_id = ANY(%s)
+        ORDER BY plan_id, id
+    """
+    cur.execute(query, (list(plan_ids),))
+    rows = cur.fetchall()
+
+    items: Dict[int, List[plan_item]] = {}
+    for row in rows:
+        rd = _row_to_dict(cur, row)
+        items.setdefault(rd["plan_id"], []).append(plan_item(
+            id=rd["id"],
+            plan_id=rd["plan_id"],
+            drug_id=rd["drug_id"],
+            drug_name=None,
+            dosage=rd["dosage"],
+            unit=rd["unit"],
+            amount_literal=rd.get("amount_literal"),
+            note=rd.get("note"),
+        ))
+
+    cur.close()
+    conn.close()
+    return items
+
+
+def get_plan_item_rules_by_plan_ids(plan_ids: List[int]) -> Dict[int, List[plan_item_rule]]:
+    """Return {plan_item_id: [plan_item_rule, ...]} for every item of a group of plans."""
+    if not plan_ids:
+        return {}
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    query = """
+        SELECT pir.id, pir.plan_item_id, pir.start_date, pir.end_date,
+               pir.repeat_type, pir.interval_value,
+               pir.mon, pir.tue, pir.wed, pir.thu, pir.fri, pir.sat, pir.sun,
+               pir.times
+        FROM plan_item_rule pir
+        JOIN plan_item pi ON pi.id = pir.plan_item_id
+        WHERE pi.plan_id = ANY(%s)
+        ORDER BY pir.plan_item_id, pir.id
+    """
+    cur.execute(query, (list(plan_ids),))
+    rows = cur.fetchall()
+
+    item_id_to_rules: Dict[int, List[plan_item_rule]] = {}
+    for row in rows:
+        rd = _row_to_dict(cur, row)
+        item_id_to_rules.setdefault(rd["plan_item_id"], []).append(plan_item_rule(
+            id=rd["id"],
+            plan_item_id=rd["plan_item_id"],
+            start_date=rd["start_date"],
+            end_date=rd["end_date"],
+            repeat_type=rd["repeat_type"],
+            interval_value=rd["interval_value"],
+            mon=rd["mon"],
+            tue=rd["tue"],
+            wed=rd["wed"],
+            thu=rd["thu"],
+            fri=rd["fri"],
+            sat=rd["sat"],
+            sun=rd["sun"],
+            times=rd["times"],
+        ))
+
+    cur.close()
+    conn.close()
+    return item_id_to_rules
+
+
+# ==================== single-round-trip loader (plan views) ====================
+
+def get_full_plan_by_user_id(user_id: int):
+    """
+    Load a patient's plan, its items and their rules in one query.
+
+    Returns (plan, {plan_item_id: [plan_item_rule, ...]}) with plan.plan_items
+    holding the raw (unexpanded) items, or None if the patient has no plan.
+    Every item has an entry in the rule map, possibly an empty list, like
+    get_plan_item_rules_by_plan_id().
+    """
+    conn = mydb()
+    cur = conn.cursor()
+
+    # Flat LEFT JOINs rather than json_agg so rule times keep their time type
+    query = """
+        WITH p AS (
+            SELECT id, patient_id, doctor_id, name, description,
+                   doctor_name, patient_name
+            FROM plan
+            WHERE patient_id = %s
+            ORDER BY id
+            LIMIT 1
+        )
+        SELECT
+            p.id, p.patient_id, p.doctor_id, p.name, p.description,
+            p.doctor_name, p.patient_name,
+            pi.id AS item_id,
+            pi.drug_id AS item_drug_id,
+            pi.dosage AS item_dosage,
+            pi.unit AS item_unit,
+            pi.amount_literal AS item_amount_literal,
+            pi.note AS item_note,
+            pir.id AS rule_id,
+            pir.start_date AS rule_start_date,
+            pir.end_date AS rule_end_date,
+            pir.repeat_type AS rule_repeat_type,
+            pir.interval_value AS rule_interval_value,
+            pir.mon AS rule_mon,
+            pir.tue AS rule_tue,
+            pir.wed AS rule_wed,
+            pir.thu AS rule_thu,
+            pir.fri AS rule_fri,
+            pir.sat AS rule_sat,
+            pir.sun AS rule_sun,
+            pir.times AS rule_times
+        FROM p
+        LEFT JOIN plan_item pi ON pi.plan_id = p.id
+        LEFT JOIN plan_item_rule pir ON pir.plan_item_id = pi.id
+        ORDER BY pi.id, pir.id
+    """
+    cur.execute(query, (user_id,))
+    rows = cur.fetchall()
+    columns = [desc[0] for desc in cur.description]
+
+    cur.close()
+    conn.close()
+
+    if not rows:
+        return None
+
+    rd = dict(zip(columns, rows[0]))
+    result = plan(
+        id=rd["id"],
+        patient_id=rd["patient_id"],
+        doctor_id=rd["doctor_id"],
+        name=rd["name"],
+        description=rd.get("description"),
+        doctor_name=rd.get("doctor_name"),
+        patient_name=rd.get("patient_name"),
+    )
+
+    item_id_to_rules: Dict[int, List[plan_item_rule]] = {}
+    for row in rows:
+        rd = dict(zip(columns, row))
+        item_id = rd["item_id"]
+        if item_id is None:
+            continue  # plan without items
+
+        # Rows come grouped by item: the first row of each item creates it
+        if item_id not in item_id_to_rules:
+            result.plan_items.append(plan_item(
+                id=item_id,
+                plan_id=result.id,
+                drug_id=rd["item_drug_id"],
+                drug_name=None,
+                dosage=rd["item_dosage"],
+                unit=rd["item_unit"],
+                amount_literal=rd.get("item_amount_literal"),
+                note=rd.get("item_note"),
+            ))
+            item_id_to_rules[item_id] = []
+
+        if rd["rule_id"] is None:
+            continue
+        item_id_to_rules[item_id].append(plan_item_rule(
+            id=rd["rule_id"],
+            plan_item_id=item_id,
+            start_date=rd["rule_start_date"],
+            end_date=rd["rule_end_date"],
+            repeat_type=rd["rule_repeat_type"],
+            interval_value=rd["rule_interval_value"],
+            mon=rd["rule_mon"],
+            tue=rd["rule_tue"],
+            wed=rd["rule_wed"],
+            thu=rd["rule_thu"],
+            fri=rd["rule_fri"],
+            sat=rd["rule_sat"],
+            sun=rd["rule_sun"],
+            times=rd["rule_times"],
+        ))
+
+    return result, item_id_to_rules
+
 from typing import Any
 
 # ====== Internal helper: parse time string ======
@@ -365,6 +688,54 @@ def _parse_time_str(t: str) -> dt_time:
     return dt_time(hour, minute, second)
 
 
+# ====== Internal helper: announce changed schedules ======
+def _queue_reminder_change(cur, plan_id: Optional[int] = None, item_id: Optional[int] = None) -> List[int]:
+    """
+    Notify the reminder index and plan caches which patient's doses changed:
+    the owner of `plan_id` and/or of the plan `item_id` currently belongs
+    to. NOTIFY is transactional, so nothing is sent if the caller rolls
+    back. Returns the affected plan ids, for bump_plan_versions() once the
+    caller has committed.
+    """
+    cur.execute(
+        """
+        SELECT p.id, pg_notify(%s, p.patient_id::text)
+        FROM plan p
+        WHERE p.id = %s
+           OR p.id = (SELECT plan_id FROM plan_item WHERE id = %s)
+        """,
+        (config.REMINDER_CHANNEL, plan_id, item_id),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+# ====== Plan versions ======
+# Process-local counters bumped after this process commits a change to a
+# plan's items or rules, so caches keyed on (plan_id, version) stop serving
+# the old expansion immediately. Other workers learn about the change from
+# the REMINDER_CHANNEL notification instead.
+_plan_versions: Dict[int, int] = {}
+_change_seq = 0
+_version_lock = threading.Lock()
+
+
+def get_plan_version(plan_id: int) -> int:
+    return _plan_versions.get(plan_id, 0)
+
+
+def get_change_seq() -> int:
+    """Total number of version bumps so far; unchanged means no plan changed."""
+    return _change_seq
+
+
+def bump_plan_versions(plan_ids: List[int]) -> None:
+    global _change_seq
+    with _version_lock:
+        for pid in plan_ids:
+            _plan_versions[pid] = _plan_versions.get(pid, 0) + 1
+            _change_seq += 1
+
+
 # ====== CREATE: new plan_item + corresponding rules ======
 def create_plan_item_with_rules(
     plan_id: int,
@@ -380,6 +751,8 @@ def create_plan_item_with_rules(
     cur = conn.cursor()
 
     try:
+        changed_plans = _queue_reminder_change(cur, plan_id=plan_id)
+
         # Insert plan_item first
         insert_item_sql = """
             INSERT INTO plan_item (plan_id, drug_id, dosage, unit, amount_literal, note)
@@ -431,7 +804,9 @@ def create_plan_item_with_rules(
                 ),
             )
 
+        adherence_repo.invalidate_scheduled(cur, changed_plans)
         conn.commit()
+        bump_plan_versions(changed_plans)
         return new_item_id
     except Exception as e:
         conn.rollback()
@@ -458,6 +833,9 @@ def update_plan_item_with_rules(
     cur = conn.cursor()
 
     try:
+        # Both the item's current plan and the one it moves to
+        changed_plans = _queue_reminder_change(cur, plan_id=plan_id, item_id=item_id)
+
         # Update plan_item
         update_item_sql = """
             UPDATE plan_item
@@ -520,7 +898,9 @@ def update_plan_item_with_rules(
                 ),
             )
 
+        adherence_repo.invalidate_scheduled(cur, changed_plans)
         conn.commit()
+        bump_plan_versions(changed_plans)
         return True
     except Exception as e:
         conn.rollback()
@@ -536,12 +916,16 @@ def delete_plan_item_and_rules(item_id: int) -> bool:
     conn = mydb()
     cur = conn.cursor()
     try:
+        changed_plans = _queue_reminder_change(cur, item_id=item_id)
+
         # Delete rule first
         cur.execute("DELETE FROM plan_item_rule WHERE plan_item_id = %s", (item_id,))
         # Then delete item
         cur.execute("DELETE FROM plan_item WHERE id = %s", (item_id,))
         deleted = cur.rowcount > 0
+        adherence_repo.invalidate_scheduled(cur, changed_plans)
         conn.commit()
+        bump_plan_versions(changed_plans)
         return deleted
     except Exception as e:
         conn.rollback()
@@ -0,0 +1,214 @@
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, time as dt_time
+from typing import Iterable, List, Optional
+from config import mydb
+
+# reminder_outbox holds one row per reminder to send: a (dose, notify offset)
+# pair, unique on that key so enqueueing the same reminder again (a second
+# worker, a retried tick) is a no-op. Dispatchers claim PENDING rows with
+# FOR UPDATE SKIP LOCKED, so any number of them can run side by side without
+# sending a row twice. A claim is a lease: it pushes next_attempt_at out and
+# commits at once, so a dispatcher that dies mid-send only delays its rows
+# until the lease runs out. A row whose last attempt's lease ran out cannot
+# be claimed again; the next claim marks it FAILED instead.
+#
+# Times are the app's reference time (notify_service.get_now()), not the
+# database clock.
+
+# ===================== dataclass model =====================
+
+@dataclass
+class outbox_entry:
+    id: Optional[int]           # None until stored
+    user_id: int
+    plan_item_id: int
+    expected_date: date
+    expected_time: Optional[dt_time]
+    notify_offset: int          # minutes relative to the dose, as in notify_minutes
+    trigger_at: datetime
+    drug_name: Optional[str]
+    dosage: Optional[int]
+    unit: Optional[str]
+    attempts: int = 0
+
+
+_COLUMNS = """id, user_id, plan_item_id, expected_date, expected_time, notify_offset,
+              trigger_at, drug_name, dosage, unit, attempts"""
+
+
+# ===================== producer =====================
+
+def enqueue(entries: Iterable[outbox_entry], now: datetime) -> int:
+    """Store new reminders, skipping those already queued; returns how many were new."""
+    rows = [asdict(e) for e in entries]
+    if not rows:
+        return 0
+    for row in rows:
+        row["now"] = now
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.executemany(
+            """
+            INSERT INTO reminder_outbox (user_id, plan_item_id, expected_date, expected_time,
+                                         notify_offset, trigger_at, drug_name, dosage, unit,
+                                         status, next_attempt_at)
+            VALUES (%(user_id)s, %(plan_item_id)s, %(expected_date)s, %(expected_time)s,
+                    %(notify_offset)s, %(trigger_at)s, %(drug_name)s, %(dosage)s, %(unit)s,
+                    'PENDING', %(now)s)
+            ON CONFLICT (user_id, plan_item_id, expected_date, expected_time, notify_offset)
+            DO NOTHING
+            """,
+            rows,
+        )
+        inserted = cur.rowcount
+        conn.commit()
+        return inserted
+    except Exception as e:
+        conn.rollback()
+        print("enqueue ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ===================== dispatcher =====================
+
+def claim_batch(now: datetime, limit: int, lease_seconds: int, max_attempts: int) -> List[outbox_entry]:
+    """
+    Lease up to `limit` due PENDING rows, oldest trigger first, skipping
+    rows another dispatcher holds. Each claim counts as an attempt; rows
+    out of attempts whose lease expired are failed first.
+    """
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            """
+            UPDATE reminder_outbox
+            SET status = 'FAILED',
+                last_error = COALESCE(last_error, 'lease expired on the last attempt')
+            WHERE status = 'PENDING'
+              AND next_attempt_at <= %(now)s
+              AND attempts >= %(max_attempts)s
+            """,
+            {"now": now, "max_attempts": max_attempts},
+        )
+        cur.execute(
+            f"""
+            UPDATE reminder_outbox
+            SET attempts = attempts + 1,
+                next_attempt_at = %(now)s + make_interval(secs => %(lease)s)
+            WHERE id IN (
+                SELECT id FROM reminder_outbox
+                WHERE status = 'PENDING'
+                  AND next_attempt_at <= %(now)s
+                  AND attempts < %(max_attempts)s
+                ORDER BY next_attempt_at, id
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {_COLUMNS}
+            """,
+            {"now": now, "lease": lease_seconds, "max_attempts": max_attempts, "limit": limit},
+        )
+        rows = cur.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("claim_batch ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    entries = [outbox_entry(*r) for r in rows]
+    entries.sort(key=lambda e: (e.trigger_at, e.id))
+    return entries
+
+
+def _finish(ids: List[int], status: str, now: datetime, error: Optional[str] = None) -> None:
+    if not ids:
+        return
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            """
+            UPDATE reminder_outbox
+            SET status = %s, sent_at = %s, last_error = %s
+            WHERE id = ANY(%s)
+            """,
+            (status, now, error, list(ids)),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("_finish ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def mark_sent(ids: List[int], now: datetime) -> None:
+    _finish(ids, "SENT", now)
+
+
+def mark_skipped(ids: List[int], now: datetime, reason: str) -> None:
+    """Done without sending (dose taken meanwhile, no email address)."""
+    _finish(ids, "SKIPPED", now, reason)
+
+
+def release_failed(ids: List[int], retry_at: datetime, error: str, max_attempts: int) -> None:
+    """Give the rows back for another attempt at `retry_at`, or fail those out of attempts."""
+    if not ids:
+        return
+
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            """
+            UPDATE reminder_outbox
+            SET status = CASE WHEN attempts >= %s THEN 'FAILED' ELSE 'PENDING' END,
+                next_attempt_at = %s,
+                last_error = %s
+            WHERE id = ANY(%s)
+            """,
+            (max_attempts, retry_at, error, list(ids)),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("release_failed ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+
+def purge(before: datetime) -> int:
+    """Delete reminders triggered before `before`, whatever their status."""
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DELETE FROM reminder_outbox WHERE trigger_at < %s", (before,))
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
+    except Exception as e:
+        conn.rollback()
+        print("purge ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
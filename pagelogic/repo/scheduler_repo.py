@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Optional
+from config import mydb
+
+# scheduler_watermarks records, per periodic job, the time up to which its
+# work is done, so a job run after a restart, a leader change or a late
+# tick resumes exactly where the previous run stopped. Times are the app's
+# reference time (notify_service.get_now()), not the database clock.
+
+
+def get_watermark(job: str) -> Optional[datetime]:
+    conn = mydb()
+    cur = conn.cursor()
+
+    cur.execute("SELECT processed_until FROM scheduler_watermarks WHERE job = %s", (job,))
+    row = cur.fetchone()
+
+    cur.close()
+    conn.close()
+    return row[0] if row else None
+
+
+def set_watermark(job: str, processed_until: datetime) -> None:
+    """Advance the job's watermark; it never moves backwards."""
+    conn = mydb()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            """
+            INSERT INTO scheduler_watermarks (job, processed_until, updated_at)
+            VALUES (%s, %s, NOW())
+            ON CONFLICT (job) DO UPDATE
+            SET processed_until = GREATEST(scheduler_watermarks.processed_until,
+                                           EXCLUDED.processed_until),
+                updated_at = NOW()
+            """,
+            (job, processed_until),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print("set_watermark ERROR:", e)
+        raise
+    finally:
+        cur.close()
+        conn.close()
@@ -2,6 +2,7 @@
 from dataclasses import dataclass, asdict
 from typing import List, Optional, Dict
 from config import mydb
+import config
 
 
 # ================== dataclass model ==================
@@ -68,6 +69,11 @@ def default_notification_config(user_id: int) -> NotificationConfig:
     )
 
 
+def _queue_reminder_change(cur, user_id: int) -> None:
+    """Tell the reminder index (on commit) that this user's settings changed."""
+    cur.execute("SELECT pg_notify(%s, %s)", (config.REMINDER_CHANNEL, str(user_id)))
+
+
 # ================== repo functions ==================
 
 def get_notification_config(user_id: int) -> Optional[NotificationConfig]:
@@ -140,6 +146,7 @@ def create_notification_config(cfg: NotificationConfig) -> None:
 
     conn = mydb()
     cur = conn.cursor()
+    _queue_reminder_change(cur, cfg.user_id)
 
     query = """
         INSERT INTO user_med_notification_settings
@@ -169,6 +176,7 @@ def update_notification_config(cfg: NotificationConfig) -> None:
 
     conn = mydb()
     cur = conn.cursor()
+    _queue_reminder_change(cur, cfg.user_id)
 
     query = """
         UPDATE user_med_notification_settings
@@ -203,6 +211,7 @@ def upsert_notification_config(cfg: NotificationConfig) -> None:
 
     conn = mydb()
     cur = conn.cursor()
+    _queue_reminder_change(cur, cfg.user_id)
 
     query = """
         INSERT INTO user_med_notification_settings
@@ -0,0 +1,158 @@
+"""
+Loading and refreshing the in-memory drug and food catalogues.
+
+At startup each catalogue comes from its snapshot file when one exists, so
+the app can serve without scanning the tables (or while the database is
+slow). Without a snapshot the first load goes to the database and writes one.
+
+refresh_catalogues() then runs periodically in the background. It compares
+the loaded (row count, max id) with the database: if only new ids appeared
+it fetches just those rows, otherwise (rows deleted) it reloads the table.
+Rows edited in place do not change either number, so reload_catalogues()
+also does a full reload on a longer interval. Each refresh publishes a new
+catalogue generation in the repo and rewrites the snapshot.
+
+Under gunicorn only one worker (the leader, see app.py) refreshes and
+reloads; the others call sync_catalogues(), which remaps a snapshot file
+once the leader has replaced it. That keeps the catalogue pages shared
+through the OS cache and the database load independent of the worker count.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+
+import config
+from pagelogic.repo import drug_repo
+from pagelogic.repo import food_repo
+
+
+class Catalogue(NamedTuple):
+    name: str
+    load_db: Callable[[], object]
+    load_since: Callable[[int], int]
+    db_version: Callable[[], tuple]
+    loaded_version: Callable[[], tuple]
+    load_snapshot: Callable[[str], bool]
+    save_snapshot: Callable[[str], None]
+
+
+CATALOGUES = (
+    Catalogue("drugs", drug_repo.get_drugs, drug_repo.load_drugs_since,
+              drug_repo.get_drugs_version, drug_repo.loaded_drugs_version,
+              drug_repo.load_drugs_snapshot, drug_repo.save_drugs_snapshot),
+    Catalogue("foods", food_repo.get_foods, food_repo.load_foods_since,
+              food_repo.get_foods_version, food_repo.loaded_foods_version,
+              food_repo.load_foods_snapshot, food_repo.save_foods_snapshot),
+)
+
+# Refresh and reload run as separate scheduler jobs; never let them overlap
+_refresh_lock = threading.Lock()
+
+# Identity of the snapshot file each catalogue was last loaded from or
+# written to; a replaced file (renamed into place) has a new one
+_stamps: Dict[str, tuple] = {}
+
+
+def snapshot_path(name: str):
+    if not config.CATALOGUE_SNAPSHOT_DIR:
+        return None
+    return os.path.join(config.CATALOGUE_SNAPSHOT_DIR, f"{name}.snap")
+
+
+def _stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _save(cat: Catalogue) -> None:
+    path = snapshot_path(cat.name)
+    if path is None:
+        return
+    try:
+        cat.save_snapshot(path)
+        _stamps[cat.name] = _stamp(path)
+    except OSError as e:
+        print(f"[catalogue] could not write {path}: {e}")
+
+
+def _load_from_db(cat: Catalogue) -> None:
+    start = time.perf_counter()
+    cat.load_db()
+    print(f"[catalogue] {cat.name}: loaded {cat.loaded_version()} from the database "
+          f"in {time.perf_counter() - start:.2f}s")
+    _save(cat)
+
+
+def load_catalogues() -> None:
+    """Load every catalogue, preferring its snapshot file."""
+    for cat in CATALOGUES:
+        path = snapshot_path(cat.name)
+        start = time.perf_counter()
+        stamp = _stamp(path) if path is not None else None
+        if path is not None and cat.load_snapshot(path):
+            _stamps[cat.name] = stamp
+            print(f"[catalogue] {cat.name}: loaded {cat.loaded_version()} from {path} "
+                  f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        else:
+            _load_from_db(cat)
+
+
+def _refresh(cat: Catalogue) -> None:
+    current = cat.db_version()
+    loaded = cat.loaded_version()
+    if current == loaded:
+        return
+
+    if loaded is not None and current[0] > loaded[0] and current[1] > loaded[1]:
+        added = cat.load_since(loaded[1])
+        # Rows may have been inserted meanwhile; compare against the DB again
+        # rather than `current` so only a real mismatch forces a full reload.
+        if cat.loaded_version() == cat.db_version():
+            print(f"[catalogue] {cat.name}: added {added} new rows")
+            _save(cat)
+            return
+
+    _load_from_db(cat)
+
+
+def refresh_catalogues() -> None:
+    """Pick up rows added (or deleted) since each catalogue was loaded."""
+    with _refresh_lock:
+        for cat in CATALOGUES:
+            try:
+                _refresh(cat)
+            except Exception as e:
+                # Keep serving what we have; the next refresh will try again.
+                print(f"[catalogue] {cat.name}: refresh failed: {e}")
+
+
+def reload_catalogues() -> None:
+    """Reload every catalogue in full, picking up rows edited in place."""
+    with _refresh_lock:
+        for cat in CATALOGUES:
+            try:
+                _load_from_db(cat)
+            except Exception as e:
+                print(f"[catalogue] {cat.name}: reload failed: {e}")
+
+
+def sync_catalogues() -> None:
+    """Remap every snapshot file replaced since this process last loaded it."""
+    with _refresh_lock:
+        for cat in CATALOGUES:
+            path = snapshot_path(cat.name)
+            if path is None:
+                continue
+            stamp = _stamp(path)
+            if stamp is None or stamp == _stamps.get(cat.name):
+                continue
+            try:
+                if cat.load_snapshot(path):
+                    _stamps[cat.name] = stamp
+                    print(f"[catalogue] {cat.name}: remapped {cat.loaded_version()} from {path}")
+            except Exception as e:
+                print(f"[catalogue] {cat.name}: remap failed: {e}")
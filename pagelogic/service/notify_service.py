@@ -1,16 +1,21 @@
+import heapq
+import itertools
 import logging
+import threading
 from dataclasses import dataclass
 from datetime import date, datetime, time as dt_time, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
+import config
 from pagelogic.service import plan_service
 from pagelogic.repo import drug_record_repo
 import pagelogic.repo.plan_repo as plan_repo
+import pagelogic.repo.reminder_outbox_repo as reminder_outbox_repo
+import pagelogic.repo.scheduler_repo as scheduler_repo
 import pagelogic.repo.user_repo as user_repo
 import pagelogic.repo.user_notification_repo as user_notification_repo
-from utils.emailsender import send_email_ses
-
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.change_listener import ChangeListener
+from utils.emailsender import EmailMessage, get_mailer
 
 # Always use the same reference time zone
 UTC_MINUS_5 = timezone(timedelta(hours=-5))
@@ -36,31 +41,14 @@ class ScheduledDose:
 # Step 1 — Collect scheduled doses
 # ----------------------------------------------------
 
-def get_scheduled_doses_within(days: int, now: datetime) -> List[ScheduledDose]:
-    window_start = now
-    window_end = now + timedelta(days=days)
-
-    users = user_repo.get_all_users()
-    user_ids = [u.id for u in users]
-
-    plans = plan_repo.get_plans_by_user_ids(user_ids)
-    users_with_plans = [u for u in users if u.id in plans]
-
-    def expand_user_plan(user) -> List[ScheduledDose]:
-        plan = plan_service.get_user_plan(
-            id=user.id,
-            from_when=window_start,
-            to_when=window_end,
-        )
-        if not plan or not plan.plan_items:
-            return []
-
-        result: List[ScheduledDose] = []
+def _plan_doses(plans) -> Iterable[ScheduledDose]:
+    """ScheduledDose for every dated item of expanded {user_id: plan}."""
+    for user_id, plan in plans.items():
         for item in plan.plan_items:
             if item.date is None:
                 continue
-            sd = ScheduledDose(
-                user_id=user.id,
+            yield ScheduledDose(
+                user_id=user_id,
                 plan_item_id=item.id,
                 expected_date=item.date,
                 expected_time=item.time,
@@ -68,89 +56,218 @@ def get_scheduled_doses_within(days: int, now: datetime) -> List[ScheduledDose]:
                 dosage=getattr(item, "dosage", None),
                 unit=getattr(item, "unit", None),
             )
-            result.append(sd)
-        return result
-
-    scheduled: List[ScheduledDose] = []
 
-    max_workers = min(8, len(users_with_plans)) or 1
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_uid = {
-            executor.submit(expand_user_plan, user): user.id
-            for user in users_with_plans
-        }
 
-        for future in as_completed(future_to_uid):
-            try:
-                scheduled.extend(future.result())
-            except Exception as e:
-                print(f"[STEP1] Error expanding plan: {e}")
-
-    return scheduled
+def _dose_key(dose: ScheduledDose):
+    return (dose.user_id, dose.plan_item_id, dose.expected_date, dose.expected_time)
 
 
 # ----------------------------------------------------
-# Step 2 — Find missed doses
+# Reminder index — precomputed trigger times
 # ----------------------------------------------------
 
-def find_missed_doses(
-    scheduled: List[ScheduledDose],
-    recent_records: List[drug_record_repo.drug_record],
-) -> List[ScheduledDose]:
-
-    completed = {
-        (r.user_id, r.plan_item_id, r.expected_date, r.expected_time)
-        for r in recent_records
-    }
-
-    missed: List[ScheduledDose] = []
-    for dose in scheduled:
-        key = (dose.user_id, dose.plan_item_id, dose.expected_date, dose.expected_time)
-        if key not in completed:
-            missed.append(dose)
-
-    return missed
+DEFAULT_DOSE_TIME = dt_time(9, 0)
+_MAX_OFFSET = timedelta(minutes=1440)  # notify_minutes is limited to +-1440
+
+
+class ReminderIndex:
+    """
+    Every (dose, notify offset) a user will be reminded about, as a min-heap
+    keyed by trigger time. A tick pops only the entries due in its window
+    (start, end], so it costs O(due) instead of re-expanding every plan and
+    scanning every offset of every missed dose.
+
+    Triggers after `valid_from` are expanded up to `built_until`, one
+    `horizon` at a time. plan_repo and user_notification_repo announce
+    changed users on the config.REMINDER_CHANNEL LISTEN/NOTIFY channel (this
+    works across gunicorn workers); those users' entries are invalidated by
+    bumping their generation and re-expanded from the window start to
+    built_until. If the listener connection is lost, or a window starts
+    before what is still in the heap (a tick whose work was not committed,
+    another leader's watermark), the whole index is rebuilt.
+    """
+
+    def __init__(self, horizon: timedelta = timedelta(days=1), listen: bool = True):
+        self.horizon = horizon
+        self._changes = ChangeListener(config.REMINDER_CHANNEL, enabled=listen)
+        self._heap = []             # (target_dt, seq, user_id, generation, dose)
+        self._seq = itertools.count()
+        self._generation: Dict[int, int] = {}
+        self._changed: Set[int] = set()
+        self._valid_from: Optional[datetime] = None
+        self._built_until: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    # ---------- building ----------
+
+    def _expand(self, start: datetime, end: datetime, user_ids=None) -> None:
+        """Push triggers in (start, end] for all users (or just `user_ids`)."""
+        # A trigger can be up to a day before or after its dose
+        plans = plan_service.get_all_user_plans(
+            (start - _MAX_OFFSET).date(), (end + _MAX_OFFSET).date(), user_ids=user_ids)
+        configs = user_notification_repo.get_notification_configs_by_user_ids(list(plans))
+
+        for dose in _plan_doses(plans):
+            cfg = configs.get(dose.user_id)
+            if not cfg or not cfg.enabled or not cfg.email_enabled:
+                continue
+            scheduled_dt = datetime.combine(dose.expected_date, dose.expected_time or DEFAULT_DOSE_TIME)
+            generation = self._generation.get(dose.user_id, 0)
+            for offset in set(cfg.notify_minutes):
+                target_dt = scheduled_dt + timedelta(minutes=offset)
+                if start < target_dt <= end:
+                    heapq.heappush(self._heap, (target_dt, next(self._seq), dose.user_id, generation, dose))
+
+    def _rebuild(self, start: datetime) -> None:
+        self._heap = []
+        self._generation.clear()
+        self._changed.clear()
+        self._valid_from = start
+        self._built_until = start + self.horizon
+        self._expand(start, self._built_until)
+
+    def _sync(self, start: datetime, end: datetime) -> None:
+        # Drain before loading anything so a change committed meanwhile is
+        # seen on the next tick. Rebuild from scratch on first use, after
+        # missed changes, when the window starts before the triggers still
+        # held, or when the scheduler was stopped for longer than what was
+        # built.
+        changes = self._changes.drain()
+        if changes is not None:
+            self._changed.update(int(uid) for uid in changes)
+        if (self._built_until is None or changes is None
+                or start < self._valid_from or self._built_until < start):
+            self._rebuild(start)
+        elif self._changed:
+            changed, self._changed = self._changed, set()
+            for uid in changed:
+                self._generation[uid] = self._generation.get(uid, 0) + 1
+            self._expand(start, self._built_until, user_ids=changed)
+
+        while self._built_until < end:
+            start, self._built_until = self._built_until, self._built_until + self.horizon
+            self._expand(start, self._built_until)
+
+    # ---------- tick ----------
+
+    def pop_due(
+        self,
+        start: datetime,
+        end: datetime,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[ScheduledDose], datetime]:
+        """
+        Remove and return the doses with a trigger in (start, end], one per
+        dose even if several of its offsets fall in the window, and the time
+        up to which the window was covered. With a `limit`, stops after about
+        that many doses (never between two triggers at the same minute) and
+        the rest of the window is left for the next call.
+        """
+        with self._lock:
+            self._sync(start, end)
+
+            due: Dict[tuple, ScheduledDose] = {}
+            heap = self._heap
+            reached, last = end, start
+            while heap and heap[0][0] <= end:
+                if limit is not None and len(due) >= limit and heap[0][0] > last:
+                    reached = last
+                    break
+                target_dt, _, user_id, generation, dose = heapq.heappop(heap)
+                if target_dt <= start or generation != self._generation.get(user_id, 0):
+                    continue  # already processed, or superseded by a plan change
+                due.setdefault(_dose_key(dose), dose)
+                last = target_dt
+            self._valid_from = reached
+            return list(due.values()), reached
+
+
+_reminder_index: Optional[ReminderIndex] = None
+
+
+def get_reminder_index(days: int = 1) -> ReminderIndex:
+    global _reminder_index
+    if _reminder_index is None:
+        _reminder_index = ReminderIndex(horizon=timedelta(days=days))
+    return _reminder_index
 
 
 # ----------------------------------------------------
-# Step 3 — Main job entry
+# Step 2 — Main job entry
 # ----------------------------------------------------
 
+NOTIFY_JOB = "notify_jobs"
+
+
 def notify_jobs(days: int, interval: int) -> None:
+    """
+    Queue the reminders triggered since the last run: exactly the window
+    (watermark, now], however late this tick started or however many ticks
+    were missed. A first run looks back one interval, and after a long
+    downtime only the last NOTIFY_MAX_CATCHUP_SECONDS are caught up on.
+    At most NOTIFY_MAX_PER_TICK doses are handled per run; the watermark
+    then stops where the work stopped and the next tick carries on from
+    there. The watermark only advances once the reminders are queued, so
+    a failed tick is retried whole.
+    """
     now = get_now()
     print(f"[STEP0] notify_jobs started at {now.isoformat()}")
 
-    scheduled = get_scheduled_doses_within(days, now)
-    print(f"[STEP1] Retrieved {len(scheduled)} scheduled doses within {days} days.")
-
-    recent = drug_record_repo.get_recent_completed_drug_records(days, now)
-    print(f"[STEP2] Retrieved {len(recent)} recent completed drug records within {days} days.")
-
-    missed = find_missed_doses(scheduled, recent)
-    print(f"[STEP3] Found {len(missed)} missed doses to notify.")
+    start = scheduler_repo.get_watermark(NOTIFY_JOB) or now - timedelta(seconds=interval)
+    oldest = now - timedelta(seconds=config.NOTIFY_MAX_CATCHUP_SECONDS)
+    if start < oldest:
+        print(f"[STEP0] Skipping reminders due {start.isoformat()} – {oldest.isoformat()} (too old)")
+        start = oldest
+    if start >= now:
+        return
 
+    due, reached = get_reminder_index(days).pop_due(start, now, limit=config.NOTIFY_MAX_PER_TICK)
+    print(f"[STEP1] {len(due)} doses have a reminder due in ({start.isoformat()}, {reached.isoformat()}].")
+    if reached < now:
+        print(f"[STEP1] Capped at {config.NOTIFY_MAX_PER_TICK} doses; the rest is left for the next tick.")
+
+    missed = due
+    if due:
+        taken = drug_record_repo.get_taken_dose_keys(
+            list({d.user_id for d in due}),
+            min(d.expected_date for d in due),
+            max(d.expected_date for d in due),
+        )
+        missed = [d for d in due if _dose_key(d) not in taken]
+    print(f"[STEP2] Found {len(missed)} of them not taken yet.")
 
+    queued = enqueue_reminders(missed, start, reached, now)
+    print(f"[STEP3] Queued {queued} new reminders.")
 
-    send_notifications(missed, interval, now)
+    scheduler_repo.set_watermark(NOTIFY_JOB, reached)
 
 
 # ----------------------------------------------------
-# Step 4 — Notifications
+# Step 3 — Outbox
 # ----------------------------------------------------
 
-def send_notifications(missed_doses: List[ScheduledDose], interval: int, now: datetime) -> None:
+def enqueue_reminders(
+    missed_doses: List[ScheduledDose],
+    start: datetime,
+    end: datetime,
+    now: datetime,
+) -> int:
+    """
+    Queue a reminder in reminder_outbox for each dose with a notify offset
+    in (start, end]; the dispatcher sends them. Returns how many were new:
+    a reminder another worker or an earlier run already queued is not
+    queued (nor sent) twice.
+    """
     if not missed_doses:
-        return
+        return 0
 
-    interval_seconds = interval
-    user_ids = {d.user_id for d in missed_doses}
-
-    users = user_repo.get_users_by_ids(list(user_ids))
-    user_email = {u.id: u.email for u in users}
-    user_name = {u.id: u.username for u in users}
-
-    configs = user_notification_repo.get_notification_configs_by_user_ids(list(user_ids))
+    configs = user_notification_repo.get_notification_configs_by_user_ids(
+        list({d.user_id for d in missed_doses}))
 
+    entries = []
     for dose in missed_doses:
         cfg = configs.get(dose.user_id)
         if not cfg or not cfg.enabled or not cfg.email_enabled:
@@ -159,52 +276,183 @@ def send_notifications(missed_doses: List[ScheduledDose], interval: int, now: da
         scheduled_time = dose.expected_time or dt_time(9, 0)
         scheduled_dt = datetime.combine(dose.expected_date, scheduled_time)
 
-        should_send = False
-
         for offset in cfg.notify_minutes:
             target_dt = scheduled_dt + timedelta(minutes=offset)
-            diff_seconds = (target_dt - now).total_seconds()
 
             # Trigger exactly once for each target time window
-            if 0 <= diff_seconds < interval_seconds:
-                should_send = True
+            if start < target_dt <= end:
+                entries.append(reminder_outbox_repo.outbox_entry(
+                    id=None,
+                    user_id=dose.user_id,
+                    plan_item_id=dose.plan_item_id,
+                    expected_date=dose.expected_date,
+                    expected_time=dose.expected_time,
+                    notify_offset=offset,
+                    trigger_at=target_dt,
+                    drug_name=dose.drug_name,
+                    dosage=dose.dosage,
+                    unit=dose.unit,
+                ))
                 break
 
-        if not should_send:
-            continue
+    return reminder_outbox_repo.enqueue(entries, now)
 
-        email = user_email.get(dose.user_id)
+
+# ----------------------------------------------------
+# Step 4 — Notifications (outbox dispatcher)
+# ----------------------------------------------------
+
+def _entry_dose(entry: reminder_outbox_repo.outbox_entry) -> ScheduledDose:
+    return ScheduledDose(
+        user_id=entry.user_id,
+        plan_item_id=entry.plan_item_id,
+        expected_date=entry.expected_date,
+        expected_time=entry.expected_time,
+        drug_name=entry.drug_name,
+        dosage=entry.dosage,
+        unit=entry.unit,
+    )
+
+
+def send_notifications(entries: List[reminder_outbox_repo.outbox_entry], now: datetime) -> int:
+    """
+    Send one claimed batch of reminders, one digest email per user, and
+    record the outcome of every row. Returns the number of emails sent.
+    """
+    if not entries:
+        return 0
+
+    doses = {e.id: _entry_dose(e) for e in entries}
+
+    # Taken since it was queued: nothing to remind about
+    taken = drug_record_repo.get_taken_dose_keys(
+        list({e.user_id for e in entries}),
+        min(e.expected_date for e in entries),
+        max(e.expected_date for e in entries),
+    )
+    done = [e.id for e in entries if _dose_key(doses[e.id]) in taken]
+    reminder_outbox_repo.mark_skipped(done, now, "taken")
+    entries = [e for e in entries if _dose_key(doses[e.id]) not in taken]
+
+    users = user_repo.get_users_by_ids(list({e.user_id for e in entries}))
+    user_email = {u.id: u.email for u in users}
+    user_name = {u.id: u.username for u in users}
+
+    # One digest per user; a dose reminded at two offsets appears once
+    digests: Dict[int, Dict[tuple, ScheduledDose]] = {}
+    digest_ids: Dict[int, List[int]] = {}
+    for entry in entries:
+        dose = doses[entry.id]
+        digests.setdefault(entry.user_id, {}).setdefault(_dose_key(dose), dose)
+        digest_ids.setdefault(entry.user_id, []).append(entry.id)
+
+    no_email = [i for uid, ids in digest_ids.items() if not user_email.get(uid) for i in ids]
+    reminder_outbox_repo.mark_skipped(no_email, now, "no email address")
+
+    messages, message_ids = [], []
+    for user_id, by_key in digests.items():
+        email = user_email.get(user_id)
         if not email:
             continue
 
+        user_doses = list(by_key.values())
         subject = "DineDose Medication Reminder"
-        body = build_email_body(dose, user_name.get(dose.user_id, ""))
+        if len(user_doses) > 1:
+            subject += f" ({len(user_doses)} doses)"
+        body = build_email_body(user_doses, user_name.get(user_id, ""))
+        messages.append(EmailMessage(email, subject, body))
+        message_ids.append(digest_ids[user_id])
+
+    # Sent in parallel, within the SES rate limit (utils/emailsender.py)
+    sent = get_mailer().send_bulk(messages) if messages else []
+
+    sent_ids = [i for ok, ids in zip(sent, message_ids) if ok for i in ids]
+    failed_ids = [i for ok, ids in zip(sent, message_ids) if not ok for i in ids]
+    reminder_outbox_repo.mark_sent(sent_ids, now)
+    if failed_ids:
+        failed = set(failed_ids)
+        attempts = max(e.attempts for e in entries if e.id in failed)
+        reminder_outbox_repo.release_failed(
+            failed_ids,
+            now + timedelta(seconds=config.OUTBOX_RETRY_SECONDS * attempts),
+            "send failed",
+            config.OUTBOX_MAX_ATTEMPTS,
+        )
+
+    print(f"[Reminder] Sent {sum(sent)}/{len(messages)} reminder emails")
+    return sum(sent)
+
 
-        send_email_ses(email, subject, body)
+def dispatch_reminders(batch_size: Optional[int] = None) -> int:
+    """
+    Send every reminder due in reminder_outbox, one claimed batch at a
+    time; safe to run in any number of processes at once. Returns the
+    number of emails sent.
+    """
+    batch_size = batch_size or config.OUTBOX_BATCH_SIZE
+    total = 0
+    while True:
+        now = get_now()
+        batch = reminder_outbox_repo.claim_batch(
+            now, batch_size, config.OUTBOX_LEASE_SECONDS, config.OUTBOX_MAX_ATTEMPTS)
+        total += send_notifications(batch, now)
+        if len(batch) < batch_size:
+            return total
+
+
+def purge_reminders() -> int:
+    """Drop outbox rows older than OUTBOX_RETENTION_DAYS."""
+    return reminder_outbox_repo.purge(get_now() - timedelta(days=config.OUTBOX_RETENTION_DAYS))
 
 
 # ----------------------------------------------------
 # Email body
 # ----------------------------------------------------
 
-def build_email_body(dose: ScheduledDose, user_name: str) -> str:
-    scheduled_time = dose.expected_time or dt_time(9, 0)
-    scheduled_dt = datetime.combine(dose.expected_date, scheduled_time)
-    scheduled_str = scheduled_dt.strftime("%Y-%m-%d %H:%M")
+def _dose_sort_key(dose: ScheduledDose):
+    return dose.expected_date, dose.expected_time or dt_time(9, 0), dose.drug_name or ""
 
+
+def _dose_line(dose: ScheduledDose) -> str:
     drug_name = dose.drug_name or "your medication"
+    if dose.dosage and dose.unit:
+        return f"{drug_name} (Dosage: {dose.dosage} {dose.unit})"
+    return drug_name
+
+
+def _scheduled_str(dose: ScheduledDose) -> str:
+    scheduled_time = dose.expected_time or dt_time(9, 0)
+    return datetime.combine(dose.expected_date, scheduled_time).strftime("%Y-%m-%d %H:%M")
+
+
+def build_email_body(doses: Union[ScheduledDose, List[ScheduledDose]], user_name: str) -> str:
+    """
+    Reminder text for one dose, or a digest listing several doses of the
+    same user in scheduled order.
+    """
+    if isinstance(doses, ScheduledDose):
+        doses = [doses]
+    doses = sorted(doses, key=_dose_sort_key)
     display_name = user_name or "User"
 
-    dosage_part = ""
-    if dose.dosage and dose.unit:
-        dosage_part = f" (Dosage: {dose.dosage} {dose.unit})"
+    if len(doses) == 1:
+        dose = doses[0]
+        return (
+            f"Hello {display_name},\n\n"
+            f"This is your reminder from DineDose:\n"
+            f"- Medication: {_dose_line(dose)}\n"
+            f"- Scheduled time: {_scheduled_str(dose)}\n\n"
+            f"Please confirm whether you have taken this dose.\n"
+            f"If you have already taken it, you may ignore this email.\n\n"
+            f"— DineDose Team"
+        )
 
+    lines = "".join(f"- {_scheduled_str(d)}  {_dose_line(d)}\n" for d in doses)
     return (
         f"Hello {display_name},\n\n"
-        f"This is your reminder from DineDose:\n"
-        f"- Medication: {drug_name}{dosage_part}\n"
-        f"- Scheduled time: {scheduled_str}\n\n"
-        f"Please confirm whether you have taken this dose.\n"
-        f"If you have already taken it, you may ignore this email.\n\n"
+        f"This is your reminder from DineDose. You have {len(doses)} doses due:\n"
+        f"{lines}\n"
+        f"Please confirm whether you have taken these doses.\n"
+        f"If you have already taken them, you may ignore this email.\n\n"
         f"— DineDose Team"
-    )
\ No newline at end of file
+    )
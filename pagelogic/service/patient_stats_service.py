@@ -0,0 +1,125 @@
+"""
+Adherence statistics for the doctor dashboard (/doctor/feedback) and the
+per-patient stats and trend endpoints.
+
+Everything reads the adherence_daily rollup (see adherence_repo): one row
+per patient and day with the doses scheduled and taken, kept current by
+the drug_records writes. Rows that do not exist yet, or whose scheduled
+count was reset by a plan change, are filled here by expanding the plans
+in bulk and stored, so the next request is again a single indexed read
+however many patients or weeks it covers.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pagelogic.repo import adherence_repo, feedback_repo, plan_repo
+from pagelogic.service import plan_service
+
+
+def risk_level(completion: int) -> str:
+    """Risk bucket for a completion percentage."""
+    if completion < 70:
+        return "High"
+    if completion < 85:
+        return "Medium"
+    return "Low"
+
+
+def completion(row: Optional[adherence_repo.adherence_day]) -> int:
+    """% of the day's scheduled doses recorded as TAKEN (0 when none were due)."""
+    if row is None or not row.scheduled:
+        return 0
+    return round((row.taken / row.scheduled) * 100)
+
+
+def _count(items, rules, day: date) -> int:
+    return sum(1 for _ in plan_service.iter_plan_items(items, rules, day, day))
+
+
+def _fill(missing: List[Tuple[int, date]]) -> None:
+    """Compute and store the scheduled counts of (patient_id, day) pairs."""
+    patient_ids = sorted({pid for pid, _ in missing})
+    plans = plan_repo.get_plans_by_user_ids(patient_ids) or {}
+    plan_ids = [p.id for p in plans.values()]
+    items_by_plan = plan_repo.get_plan_items_by_plan_ids(plan_ids)
+    item_ids_to_rules = plan_repo.get_plan_item_rules_by_plan_ids(plan_ids)
+
+    rows = []
+    for pid, day in missing:
+        plan = plans.get(pid)
+        items = items_by_plan.get(plan.id) if plan else None
+        rows.append((pid, day, _count(items, item_ids_to_rules, day) if items else 0))
+    adherence_repo.upsert_days(rows)
+
+
+def get_adherence(
+    patient_ids: List[int],
+    from_day: date,
+    to_day: date,
+) -> Dict[Tuple[int, date], adherence_repo.adherence_day]:
+    """{(patient_id, day): rollup row} for every patient and day in the range."""
+    if not patient_ids:
+        return {}
+
+    days = [from_day + timedelta(days=i) for i in range((to_day - from_day).days + 1)]
+    rows = adherence_repo.get_adherence(patient_ids, from_day, to_day)
+    missing = [
+        (pid, day)
+        for pid in patient_ids
+        for day in days
+        if (pid, day) not in rows or rows[(pid, day)].scheduled is None
+    ]
+    if missing:
+        _fill(missing)
+        rows = adherence_repo.get_adherence(patient_ids, from_day, to_day)
+    return rows
+
+
+def get_patients_stats(patient_ids: List[int], today: Optional[date] = None) -> Dict[int, dict]:
+    """
+    {patient_id: stats} for the patients whose plan has at least one item.
+
+    stats = {
+        "yesterday_completion": % of yesterday's doses recorded as TAKEN,
+        "today_tasks": number of doses scheduled today,
+        "risk_level": "High" | "Medium" | "Low" (from yesterday_completion),
+        "has_feedback_today": whether yesterday already has doctor feedback,
+    }
+    """
+    today = today or date.today()
+    yesterday = today - timedelta(days=1)
+
+    with_items = plan_repo.get_patient_ids_with_items(list(patient_ids))
+    rollup = get_adherence(with_items, yesterday, today)
+    with_feedback = feedback_repo.get_patient_ids_with_feedback(with_items, yesterday)
+
+    stats = {}
+    for patient_id in with_items:
+        yesterday_completion = completion(rollup.get((patient_id, yesterday)))
+        today_row = rollup.get((patient_id, today))
+
+        stats[patient_id] = {
+            "yesterday_completion": yesterday_completion,
+            "today_tasks": (today_row.scheduled or 0) if today_row else 0,
+            "risk_level": risk_level(yesterday_completion),
+            "has_feedback_today": patient_id in with_feedback,
+        }
+    return stats
+
+
+def get_adherence_trend(patient_id: int, days: int, today: Optional[date] = None) -> List[dict]:
+    """
+    The last `days` days up to today, oldest first:
+    [{day, scheduled, taken, late, early, completion}, ...]
+    """
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+    rollup = get_adherence([patient_id], start, today)
+
+    trend = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = rollup.get((patient_id, day)) or adherence_repo.adherence_day(
+            patient_id, day, 0, 0, 0, 0)
+        trend.append({**row.to_dict(), "completion": completion(row)})
+    return trend
@@ -1,18 +1,29 @@
 # Get a patient's plan within a time range and return plan for frontend display
+import copy
+import heapq
+import threading
+from collections import OrderedDict
+import config
 from pagelogic.repo import drug_repo, plan_repo
 from datetime import datetime, date, time as dt_time, timedelta
+from utils.change_listener import ChangeListener
+
+# How far past today an open-ended rule is expanded when the caller gives
+# no end date either (e.g. get_user_plan(id, None, None)).
+OPEN_ENDED_DAYS = 366
+
+_WEEKDAY_FLAGS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
 
 def get_raw_plan(user_id: int):
     """
     For doctor editing: get raw plan + items + rules without expanding schedule,
     and fill in drug_name.
     """
-    plan = plan_repo.get_plan_by_user_id(user_id)
-    if not plan:
+    loaded = plan_repo.get_full_plan_by_user_id(user_id)
+    if not loaded:
         return None
-
-    items = plan_repo.get_all_plan_items_by_plan_id(plan.id)
-    rules_map = plan_repo.get_plan_item_rules_by_plan_id(plan.id)
+    plan, rules_map = loaded
+    items = plan.plan_items
 
     # Fill in drug_name
     drug_ids = [it.drug_id for it in items]
@@ -41,7 +52,7 @@ def get_user_plan(
     """
     Fetches a user's medication plan, expands plan items by their repeat rules
     into actual date/time entries, attaches drug info, and returns a sorted plan
-    for frontend display.
+    for frontend display, or None if the user has no plan.
 
     Params:
         id: user_id to get plan for
@@ -54,11 +65,26 @@ def get_user_plan(
             from_when=date(2025, 11, 1),
             to_when=date(2025, 12, 31)
         )
+
+    Expanded plans are cached per (plan, version, window), see PlanCache.
+    Open-ended windows (no to_when) are not cached: they run a year past
+    today and are rarely asked for twice.
     """
-    plan = plan_repo.get_plan_by_user_id(id)
-    plan_items = plan_repo.get_all_plan_items_by_plan_id(plan.id)
-    item_ids_to_rules = plan_repo.get_plan_item_rules_by_plan_id(plan.id)
-    
+    window = _window(from_when, to_when)
+    if window is not None:
+        cached = _plan_cache.get(id, window)
+        if cached is not None:
+            return cached
+    seq = plan_repo.get_change_seq()
+
+    # Plan, items and rules in one round-trip
+    loaded = plan_repo.get_full_plan_by_user_id(id)
+    if not loaded:
+        return None
+    plan, item_ids_to_rules = loaded
+    plan_items = plan.plan_items
+
+
     drug_ids = [item.drug_id for item in plan_items]
     drugs = drug_repo.get_drugs_by_ids_locally(drug_ids)
     drug_id_to_names = {drug.id: drug.generic_name for drug in drugs}
@@ -70,37 +96,263 @@ def get_user_plan(
     # Expand plan items with dates/times based on rules
     plan_items = fill_date_and_time(plan_items, item_ids_to_rules, from_when, to_when)
     plan.plan_items = plan_items
-    
+
+    if window is None:
+        return plan
+    return _plan_cache.put(plan, window, seq)
+
+
+def _copy_plan(plan):
+    plan = copy.copy(plan)
+    plan.plan_items = list(plan.plan_items)
     return plan
 
 
-def fill_date_and_time(plan_items, item_ids_to_rules, from_when, to_when):
+def _window(from_when, to_when):
+    # The cache key of a bounded window; None for an open-ended one
+    end = _to_date(to_when, None)
+    if end is None:
+        return None
+    return _to_date(from_when, date.min), end
+
+
+class PlanCache:
     """
-    Expand plan items based on plan_item_rules within [from_when, to_when],
-    returning new plan_items list with specific date, time, and plan_item_rule.
+    LRU of expanded plans keyed by (plan_id, plan_version, window), so the
+    pages that expand the same plan over and over (reminders, the weekly
+    plan view, the doctor dashboard) skip both the query and the expansion.
+
+    plan_version comes from plan_repo, which bumps it when this process
+    changes the plan's items or rules; changes made by other workers arrive
+    as patient ids on config.REMINDER_CHANNEL and bump it here. If the
+    listener is lost, everything is dropped. Callers get a shallow copy of
+    the plan so reassigning plan_items never touches the cached one.
     """
 
-    # Normalize from_when / to_when to date
-    if isinstance(from_when, datetime):
-        start_date = from_when.date()
-    elif isinstance(from_when, date):
-        start_date = from_when
-    elif from_when is None:
-        start_date = date.min
-    else:
-        start_date = datetime.fromisoformat(from_when).date()
-
-    if isinstance(to_when, datetime):
-        end_date = to_when.date()
-    elif isinstance(to_when, date):
-        end_date = to_when
-    elif to_when is None:
-        end_date = date.max
+    def __init__(self, maxsize: int, listen: bool = True):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._plan_ids = {}        # patient_id -> plan_id
+        self._changes = ChangeListener(config.REMINDER_CHANNEL, enabled=listen and maxsize > 0)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _sync(self) -> None:
+        changes = self._changes.drain()
+        if changes is None:
+            self._entries.clear()
+            self._plan_ids.clear()
+            return
+        changed = [self._plan_ids[int(uid)] for uid in changes if int(uid) in self._plan_ids]
+        if changed:
+            plan_repo.bump_plan_versions(changed)
+
+    def get(self, patient_id: int, window):
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            self._sync()
+            plan_id = self._plan_ids.get(patient_id)
+            key = (plan_id, plan_repo.get_plan_version(plan_id), window)
+            plan = self._entries.get(key) if plan_id is not None else None
+            if plan is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copy_plan(plan)
+
+    def put(self, plan, window, seq: int):
+        """Cache a copy of `plan`, loaded when get_change_seq() was `seq`."""
+        if self.maxsize <= 0:
+            return plan
+        with self._lock:
+            # A plan changed in this process while we were loading: the
+            # result may predate it, so don't keep it
+            if plan_repo.get_change_seq() != seq:
+                return plan
+            self._plan_ids[plan.patient_id] = plan.id
+            self._entries[(plan.id, plan_repo.get_plan_version(plan.id), window)] = _copy_plan(plan)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return plan
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._plan_ids.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_plan_cache = PlanCache(config.PLAN_CACHE_SIZE)
+
+
+def get_plan_cache_stats() -> dict:
+    """Hit/miss counters of this process's expanded-plan cache."""
+    return _plan_cache.stats()
+
+
+def get_all_user_plans(from_when, to_when, user_ids=None):
+    """
+    Bulk version of get_user_plan for every patient with a plan (or just
+    `user_ids`), used by the notification cron. Plans, items and rules come
+    from three queries in total, and drug names from the in-memory
+    catalogue, so the cost grows with the number of rules rather than with
+    users x DB round-trips.
+
+    Returns {patient_id: plan} with plan_items expanded over [from_when, to_when].
+    """
+    if user_ids is None:
+        plans = plan_repo.get_all_plans()
     else:
-        end_date = datetime.fromisoformat(to_when).date()
+        plans = plan_repo.get_plans_by_user_ids(list(user_ids)) or {}
+    plan_ids = [p.id for p in plans.values()]
+    items_by_plan = plan_repo.get_plan_items_by_plan_ids(plan_ids)
+    item_ids_to_rules = plan_repo.get_plan_item_rules_by_plan_ids(plan_ids)
+
+    drug_ids = {item.drug_id for items in items_by_plan.values() for item in items}
+    drugs = drug_repo.get_drugs_by_ids_locally(list(drug_ids))
+    drug_id_to_names = {drug.id: drug.generic_name for drug in drugs}
+
+    for plan in plans.values():
+        plan_items = items_by_plan.get(plan.id, [])
+        for item in plan_items:
+            item.drug_name = drug_id_to_names.get(item.drug_id)
+        plan.plan_items = fill_date_and_time(plan_items, item_ids_to_rules, from_when, to_when)
 
-    result_items = []
+    return plans
 
+
+def _to_date(when, default):
+    if isinstance(when, datetime):
+        return when.date()
+    if isinstance(when, date):
+        return when
+    if when is None:
+        return default
+    return datetime.fromisoformat(when).date()
+
+
+def _time_key(t):
+    """Sort key for a rule time, which may be a time or an 'HH:MM[:SS]' string."""
+    if isinstance(t, str):
+        try:
+            h, m, *rest = t.split(":")
+            s = rest[0] if rest else "00"
+            return dt_time(int(h), int(m), int(s))
+        except Exception:
+            return dt_time.min
+    if isinstance(t, dt_time):
+        return t
+    return dt_time.min
+
+
+def _weekday_steps(rule):
+    """
+    steps[wd] = days from weekday wd to the next weekday whose flag is set
+    (0 if wd itself is set), or None if the rule has no weekday at all.
+    """
+    mask = 0
+    for wd, flag in enumerate(_WEEKDAY_FLAGS):
+        if getattr(rule, flag):
+            mask |= 1 << wd
+    if not mask:
+        return None
+    steps = []
+    for wd in range(7):
+        k = 0
+        while not mask & (1 << ((wd + k) % 7)):
+            k += 1
+        steps.append(k)
+    return steps
+
+
+def iter_rule_dates(rule, start_date: date, end_date: date):
+    """
+    Dates on which `rule` fires within [start_date, end_date], ascending.
+
+    The first date is found arithmetically and each next one is a fixed
+    step away, so the cost is one iteration per occurrence no matter how
+    far the window is from the rule's start. PRN rules have no dates.
+    """
+    first = max(rule.start_date, start_date)
+    last = min(rule.end_date or end_date, end_date)
+    if first > last:
+        return
+
+    if rule.repeat_type == 'ONCE':
+        # first == start_date of the rule iff it lies in the window
+        if first == rule.start_date:
+            yield first
+
+    # DAILY: every interval_value days counted from the rule's start date
+    elif rule.repeat_type == 'DAILY':
+        interval = rule.interval_value or 1  # 1 = daily, 2 = every other day
+        n, end = first.toordinal(), last.toordinal()
+        n += -(n - rule.start_date.toordinal()) % interval
+        while n <= end:
+            yield date.fromordinal(n)
+            n += interval
+
+    # WEEKLY: the days whose weekday flag is set
+    elif rule.repeat_type == 'WEEKLY':
+        steps = _weekday_steps(rule)
+        if steps is None:
+            return
+        n, end = first.toordinal(), last.toordinal()
+        n += steps[first.weekday()]
+        while n <= end:
+            yield date.fromordinal(n)
+            n += 1
+            n += steps[(n - 1) % 7]  # date.fromordinal(n).weekday() == (n - 1) % 7
+
+
+def _occurrence(item, rule, d, t):
+    return plan_repo.plan_occurrence(item, d, t, rule)
+
+
+def _rule_occurrences(item, rule, start_date, end_date):
+    """(sort key, occurrence) pairs for one rule, in sort-key order."""
+    if rule.repeat_type == 'PRN':
+        # As needed: one undated entry while the rule is active
+        if max(rule.start_date, start_date) <= min(rule.end_date or end_date, end_date):
+            yield (date.min, dt_time.min, item.id), _occurrence(item, rule, None, None)
+        return
+
+    times = sorted(rule.times or [None], key=_time_key)  # stable, like the old sort
+    keyed = [(_time_key(t), t) for t in times]
+    for d in iter_rule_dates(rule, start_date, end_date):
+        for key, t in keyed:
+            yield (d, key, item.id), _occurrence(item, rule, d, t)
+
+
+def iter_plan_items(plan_items, item_ids_to_rules, from_when, to_when):
+    """
+    Lazily expand plan items by their plan_item_rules within
+    [from_when, to_when], yielding plan_occurrence views (the item plus a
+    specific date, time and plan_item_rule), ordered by (date, time, item id).
+
+    Rules are merged rather than collected and sorted, so a caller that
+    only needs the next dose or a count can stop early. With no end date
+    (to_when None), rules without an end_date stop OPEN_ENDED_DAYS after
+    today instead of running to date.max.
+    """
+    start_date = _to_date(from_when, date.min)
+    end_date = _to_date(to_when, None)
+
+    streams = []
     for item in plan_items:
         rules = item_ids_to_rules.get(item.id)
         if not rules:
@@ -110,183 +362,19 @@ def fill_date_and_time(plan_items, item_ids_to_rules, from_when, to_when):
             rules = [rules]
 
         for rule in rules:
-            rule_start = rule.start_date
-            rule_end = rule.end_date or end_date
-
-            # Actual time range = intersection of rule range and query range
-            cur_start = max(rule_start, start_date)
-            cur_end = min(rule_end, end_date)
-
-            if cur_start > cur_end:
-                continue
-
-            times = rule.times or []  # List of times per day (time or str)
-
-            # ONCE: execute only once
-            if rule.repeat_type == 'ONCE':
-                if start_date <= rule.start_date <= end_date:
-                    if times:
-                        for t in times:
-                            result_items.append(
-                                plan_repo.plan_item(
-                                    id=item.id,
-                                    plan_id=item.plan_id,
-                                    drug_id=item.drug_id,
-                                    drug_name=item.drug_name,
-                                    dosage=item.dosage,
-                                    unit=item.unit,
-                                    amount_literal=item.amount_literal,
-                                    note=item.note,
-                                    date=rule.start_date,
-                                    time=t,
-                                    plan_item_rule=rule
-                                )
-                            )
-                    else:
-                        result_items.append(
-                            plan_repo.plan_item(
-                                id=item.id,
-                                plan_id=item.plan_id,
-                                drug_id=item.drug_id,
-                                drug_name=item.drug_name,
-                                dosage=item.dosage,
-                                unit=item.unit,
-                                amount_literal=item.amount_literal,
-                                note=item.note,
-                                date=rule.start_date,
-                                time=None,
-                                plan_item_rule=rule
-                            )
-                        )
-
-            # DAILY: repeat daily with interval_value
-            elif rule.repeat_type == 'DAILY':
-                interval = rule.interval_value or 1  # 1 = daily, 2 = every other day
-                d = cur_start
-                while d <= cur_end:
-                    if times:
-                        for t in times:
-                            result_items.append(
-                                plan_repo.plan_item(
-                                    id=item.id,
-                                    plan_id=item.plan_id,
-                                    drug_id=item.drug_id,
-                                    drug_name=item.drug_name,
-                                    dosage=item.dosage,
-                                    unit=item.unit,
-                                    amount_literal=item.amount_literal,
-                                    note=item.note,
-                                    date=d,
-                                    time=t,
-                                    plan_item_rule=rule
-                                )
-                            )
-                    else:
-                        result_items.append(
-                            plan_repo.plan_item(
-                                id=item.id,
-                                plan_id=item.plan_id,
-                                drug_id=item.drug_id,
-                                drug_name=item.drug_name,
-                                dosage=item.dosage,
-                                unit=item.unit,
-                                amount_literal=item.amount_literal,
-                                note=item.note,
-                                date=d,
-                                time=None,
-                                plan_item_rule=rule
-                            )
-                        )
-                    d += timedelta(days=interval)
-
-            # WEEKLY: repeat weekly with weekday flags
-            elif rule.repeat_type == 'WEEKLY':
-                d = cur_start
-                while d <= cur_end:
-                    wd = d.weekday()  # 0=Mon, 6=Sun
-
-                    should_take = (
-                        (wd == 0 and rule.mon) or
-                        (wd == 1 and rule.tue) or
-                        (wd == 2 and rule.wed) or
-                        (wd == 3 and rule.thu) or
-                        (wd == 4 and rule.fri) or
-                        (wd == 5 and rule.sat) or
-                        (wd == 6 and rule.sun)
-                    )
-
-                    if should_take:
-                        if times:
-                            for t in times:
-                                result_items.append(
-                                    plan_repo.plan_item(
-                                        id=item.id,
-                                        plan_id=item.plan_id,
-                                        drug_id=item.drug_id,
-                                        drug_name=item.drug_name,
-                                        dosage=item.dosage,
-                                        unit=item.unit,
-                                        amount_literal=item.amount_literal,
-                                        note=item.note,
-                                        date=d,
-                                        time=t,
-                                        plan_item_rule=rule
-                                    )
-                                )
-                        else:
-                            result_items.append(
-                                plan_repo.plan_item(
-                                    id=item.id,
-                                    plan_id=item.plan_id,
-                                    drug_id=item.drug_id,
-                                    drug_name=item.drug_name,
-                                    dosage=item.dosage,
-                                    unit=item.unit,
-                                    amount_literal=item.amount_literal,
-                                    note=item.note,
-                                    date=d,
-                                    time=None,
-                                    plan_item_rule=rule
-                                )
-                            )
-
-                    d += timedelta(days=1)
-
-            # PRN: as needed
-            elif rule.repeat_type == 'PRN':
-                result_items.append(
-                    plan_repo.plan_item(
-                        id=item.id,
-                        plan_id=item.plan_id,
-                        drug_id=item.drug_id,
-                        drug_name=item.drug_name,
-                        dosage=item.dosage,
-                        unit=item.unit,
-                        amount_literal=item.amount_literal,
-                        note=item.note,
-                        date=None,
-                        time=None,
-                        plan_item_rule=rule
-                    )
-                )
-
-    # Sort results
-    def sort_key(pi: plan_repo.plan_item):
-        d = pi.date if isinstance(pi.date, date) else date.min
-        t = pi.time
-        if isinstance(t, str):
-            try:
-                h, m, *rest = t.split(":")
-                s = rest[0] if rest else "00"
-                t_val = dt_time(int(h), int(m), int(s))
-            except Exception:
-                t_val = dt_time.min
-        elif isinstance(t, dt_time):
-            t_val = t
-        else:
-            t_val = dt_time.min
+            rule_end = end_date
+            if rule_end is None:
+                rule_end = rule.end_date or (
+                    max(rule.start_date, start_date, date.today()) + timedelta(days=OPEN_ENDED_DAYS))
+            streams.append(_rule_occurrences(item, rule, start_date, rule_end))
 
-        return (d, t_val, pi.id)
+    for _, occurrence in heapq.merge(*streams, key=lambda pair: pair[0]):
+        yield occurrence
 
-    result_items.sort(key=sort_key)
-    return result_items
\ No newline at end of file
+
+def fill_date_and_time(plan_items, item_ids_to_rules, from_when, to_when):
+    """
+    Expand plan items based on plan_item_rules within [from_when, to_when],
+    returning a list of plan_occurrence with specific date, time, and plan_item_rule.
+    """
+    return list(iter_plan_items(plan_items, item_ids_to_rules, from_when, to_when))
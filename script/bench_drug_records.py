@@ -0,0 +1,128 @@
+"""
+Benchmark: drug_records hot lookups before and after the migration 1 indexes.
+
+Seeds a synthetic drug_records table in a scratch schema of the database
+configured by DB_* (see config.py), times the lookups the app runs on every
+request, builds the indexes from utils/migrations.py there, and times them
+again. The scratch schema is dropped afterwards; real tables are untouched.
+
+Usage:
+    python script/bench_drug_records.py [num_rows] [num_users]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils.migrations import MIGRATIONS
+
+SCHEMA = "bench_drug_records"
+TODAY = date(2025, 6, 30)
+DAYS = 365
+
+CREATE_TABLE = """
+    CREATE TABLE drug_records (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        drug_id BIGINT NOT NULL,
+        expected_date DATE NOT NULL,
+        expected_time TIME,
+        dosage_numeric DOUBLE PRECISION,
+        unit VARCHAR(32),
+        plan_item_id BIGINT,
+        status VARCHAR(16),
+        notes TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Each user has 3 plan items taken at 08:00 / 20:00; most doses are TAKEN
+SEED = """
+    INSERT INTO drug_records (user_id, drug_id, expected_date, expected_time,
+                              dosage_numeric, unit, plan_item_id, status, updated_at)
+    SELECT u, 1 + n %% 50, %(today)s - (n / 6 %% %(days)s)::int,
+           CASE WHEN n %% 2 = 0 THEN TIME '08:00' ELSE TIME '20:00' END,
+           1, 'mg', u * 10 + n %% 3,
+           CASE WHEN random() < 0.85 THEN 'TAKEN' ELSE 'SKIPPED' END,
+           NOW()
+    FROM generate_series(0, %(rows)s - 1) AS n,
+         LATERAL (SELECT 1 + n / (6 * %(days)s) %% %(users)s AS u) AS x
+"""
+
+# The WHERE clauses of drug_record_repo's lookups
+QUERIES = {
+    "by_unique": (
+        """SELECT * FROM drug_records
+           WHERE user_id = %s AND plan_item_id = %s
+             AND expected_date = %s AND expected_time = %s LIMIT 1""",
+        lambda rnd, users: (u := rnd.randint(1, users), u * 10 + rnd.randint(0, 2),
+                            TODAY - timedelta(days=rnd.randrange(DAYS)), "08:00"),
+    ),
+    "by_date_range": (
+        """SELECT * FROM drug_records
+           WHERE user_id = %s AND expected_date BETWEEN %s AND %s
+           ORDER BY expected_date, expected_time""",
+        lambda rnd, users: (rnd.randint(1, users), TODAY - timedelta(days=6), TODAY),
+    ),
+}
+
+
+def timed(cur, sql, make_params, users, repeat):
+    rnd = random.Random(7)
+    samples = []
+    for _ in range(repeat):
+        params = make_params(rnd, users)
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run_all(cur, users, repeat):
+    return {name: timed(cur, sql, make, users, repeat) for name, (sql, make) in QUERIES.items()}
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, rows // (6 * DAYS))
+
+    conn = config.mydb_direct()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    cur = conn.cursor()
+    try:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        cur.execute(CREATE_TABLE)
+
+        start = time.perf_counter()
+        cur.execute(SEED, {"today": TODAY, "days": DAYS, "rows": rows, "users": users})
+        cur.execute("ANALYZE drug_records")
+        print(f"rows={rows}  users={users}  seed={time.perf_counter() - start:.1f}s")
+
+        before = run_all(cur, users, repeat=20)
+
+        start = time.perf_counter()
+        for statement in MIGRATIONS[0].statements:
+            cur.execute(statement)
+        print(f"index build={time.perf_counter() - start:.1f}s")
+
+        after = run_all(cur, users, repeat=200)
+
+        print(f"{'query':<16}{'before ms':>11}{'after ms':>10}{'speedup':>9}")
+        for name in QUERIES:
+            b, a = before[name], after[name]
+            print(f"{name:<16}{b:>11.2f}{a:>10.3f}{b / max(a, 1e-6):>8.0f}x")
+    finally:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: trigram index vs. the original full scan for keyword search.
+
+Builds a synthetic food catalogue (no database needed) and times both
+search paths over a handful of typical queries.
+
+Usage:
+    python script/bench_search.py [num_rows]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.text_index import NgramIndex
+
+WORDS = [
+    "apple", "banana", "chicken", "beef", "soup", "rice", "brown", "white",
+    "cooked", "raw", "frozen", "canned", "organic", "whole", "milk", "cheese",
+    "bread", "wheat", "oat", "corn", "sweet", "potato", "tomato", "sauce",
+    "spicy", "grilled", "roasted", "salted", "unsalted", "juice", "yogurt",
+    "plain", "vanilla", "chocolate", "peanut", "butter", "salmon", "tuna",
+]
+DATA_TYPES = ["branded_food", "sr_legacy_food", "survey_fndds_food", "foundation_food"]
+QUERIES = [["ac"], ["apple"], ["chicken", "soup"], ["brown", "rice", "cooked"], ["zzz"]]
+
+
+def make_rows(n):
+    rnd = random.Random(42)
+    rows = []
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for _ in range(n):
+        words = [rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))]
+        # Brand / variety names widen the vocabulary like the real USDA data
+        words.append("".join(rnd.choice(letters) for _ in range(rnd.randint(4, 9))))
+        desc = ", ".join(words).title()
+        rows.append((desc, rnd.choice(DATA_TYPES)))
+    return rows
+
+
+def scan_search(rows, names):
+    """The original search_foods_by_keywords_locally loop."""
+    names = [name.lower() for name in names]
+    res = []
+    for desc, data_type in rows:
+        if all(name in desc.lower() for name in names):
+            res.append((desc, data_type))
+    return sorted(res, key=lambda x: (x[1] == "branded_food", len(x[0])))[:100]
+
+
+def index_search(index, rows, names):
+    res = [rows[pos] for pos in index.search(names)]
+    return sorted(res, key=lambda x: (x[1] == "branded_food", len(x[0])))[:100]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(n)
+
+    start = time.perf_counter()
+    index = NgramIndex((desc,) for desc, _ in rows)
+    print(f"rows={n}  index build={time.perf_counter() - start:.2f}s  grams={len(index.postings)}")
+    print(f"{'query':<28}{'scan ms':>10}{'index ms':>10}{'speedup':>9}")
+
+    for q in QUERIES:
+        scan_ms, expected = timed(lambda: scan_search(rows, q), 3)
+        idx_ms, got = timed(lambda: index_search(index, rows, q), 10)
+        assert got == expected, q
+        print(f"{' '.join(q):<28}{scan_ms:>10.2f}{idx_ms:>10.3f}{scan_ms / max(idx_ms, 1e-6):>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
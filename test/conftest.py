@@ -0,0 +1,19 @@
+import pytest
+
+import config
+from utils import db_pool
+
+
+@pytest.fixture(autouse=True, scope="session")
+def short_pool_timeout():
+    """
+    There is no database under test: a request that reaches a real repo
+    query should fail fast instead of waiting DB_POOL_TIMEOUT for a pooled
+    connection that never comes.
+    """
+    saved = config.DB_POOL_TIMEOUT
+    config.DB_POOL_TIMEOUT = 0.5
+    db_pool.close_pool()
+    yield
+    db_pool.close_pool()
+    config.DB_POOL_TIMEOUT = saved
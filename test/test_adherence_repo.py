@@ -0,0 +1,91 @@
+import pytest
+from datetime import date
+
+from pagelogic.repo import adherence_repo
+
+
+# --------------------------
+# Fake DB Objects
+# --------------------------
+class FakeCursor:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.queries = []
+        self.many = None
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def executemany(self, query, params_seq):
+        self.many = (query, list(params_seq))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+def test_get_adherence_keys_rows_by_patient_and_day(monkeypatch):
+    day = date(2025, 3, 9)
+    cur = FakeCursor(rows=[(2, day, 3, 2, 1, 0)])
+    monkeypatch.setattr(adherence_repo, "mydb", lambda: FakeConn(cur))
+
+    rows = adherence_repo.get_adherence([2, 3], day, day)
+
+    assert rows == {(2, day): adherence_repo.adherence_day(2, day, 3, 2, 1, 0)}
+    assert cur.queries[0][1] == ([2, 3], day, day)
+    assert rows[(2, day)].to_dict()["day"] == "2025-03-09"
+
+
+def test_get_adherence_empty_input_skips_db(monkeypatch):
+    monkeypatch.setattr(adherence_repo, "mydb", lambda: pytest.fail("no query expected"))
+    assert adherence_repo.get_adherence([], date(2025, 1, 1), date(2025, 1, 2)) == {}
+
+
+def test_upsert_days_one_transaction(monkeypatch):
+    cur = FakeCursor()
+    conn = FakeConn(cur)
+    monkeypatch.setattr(adherence_repo, "mydb", lambda: conn)
+
+    adherence_repo.upsert_days([(2, date(2025, 3, 9), 2), (2, date(2025, 3, 10), 0)])
+
+    query, params = cur.many
+    assert "ON CONFLICT (patient_id, day)" in query
+    assert params == [
+        {"user_id": 2, "day": date(2025, 3, 9), "scheduled": 2},
+        {"user_id": 2, "day": date(2025, 3, 10), "scheduled": 0},
+    ]
+    assert conn.committed
+
+
+def test_refresh_and_invalidate_use_callers_cursor():
+    cur = FakeCursor()
+
+    adherence_repo.refresh_day_counts(cur, 5, date(2025, 3, 9))
+    adherence_repo.invalidate_scheduled(cur, [])
+    adherence_repo.invalidate_scheduled(cur, [10, 11], today=date(2025, 3, 10))
+
+    assert cur.queries[0][1] == {"user_id": 5, "day": date(2025, 3, 9)}
+    assert len(cur.queries) == 2  # no plans, no update
+    assert cur.queries[1][1] == ([10, 11], date(2025, 3, 9))
+    assert "CURRENT_DATE" not in cur.queries[1][0]
@@ -0,0 +1,143 @@
+import pytest
+from pagelogic.service import catalogue_service
+
+
+class FakeRepo:
+    def __init__(self, name, snapshot_ok=False, db_version=(1, 1)):
+        self.name = name
+        self.snapshot_ok = snapshot_ok
+        self.version = None
+        self._db_version = db_version
+        self.delta_ok = True
+        self.calls = []
+
+    def load_db(self):
+        self.calls.append("db")
+        self.version = self.db_version()
+
+    def db_version(self):
+        if isinstance(self._db_version, Exception):
+            raise self._db_version
+        return self._db_version
+
+    def load_since(self, after_id):
+        self.calls.append(("since", after_id))
+        self.version = self.db_version() if self.delta_ok else (0, 0)
+        return 1
+
+    def load_snapshot(self, path):
+        self.calls.append(("load", path))
+        if self.snapshot_ok:
+            self.version = (1, 1)
+        return self.snapshot_ok
+
+    def save_snapshot(self, path):
+        self.calls.append(("save", path))
+
+    def catalogue(self):
+        return catalogue_service.Catalogue(
+            self.name, self.load_db, self.load_since, self.db_version, lambda: self.version,
+            self.load_snapshot, self.save_snapshot,
+        )
+
+
+@pytest.fixture
+def repos(monkeypatch, tmp_path):
+    monkeypatch.setattr(catalogue_service.config, "CATALOGUE_SNAPSHOT_DIR", str(tmp_path))
+    drugs = FakeRepo("drugs", snapshot_ok=True)
+    foods = FakeRepo("foods", snapshot_ok=False)
+    monkeypatch.setattr(catalogue_service, "CATALOGUES", (drugs.catalogue(), foods.catalogue()))
+    monkeypatch.setattr(catalogue_service, "_stamps", {})
+    return drugs, foods, tmp_path
+
+
+def test_load_prefers_snapshot_and_writes_missing_ones(repos):
+    drugs, foods, tmp_path = repos
+    catalogue_service.load_catalogues()
+
+    assert drugs.calls == [("load", str(tmp_path / "drugs.snap"))]
+    assert foods.calls == [("load", str(tmp_path / "foods.snap")), "db",
+                           ("save", str(tmp_path / "foods.snap"))]
+
+
+def test_snapshots_disabled(repos, monkeypatch):
+    drugs, foods, _ = repos
+    monkeypatch.setattr(catalogue_service.config, "CATALOGUE_SNAPSHOT_DIR", "")
+    catalogue_service.load_catalogues()
+    assert drugs.calls == ["db"]
+    assert foods.calls == ["db"]
+
+
+def test_refresh_fetches_only_new_rows(repos):
+    drugs, foods, tmp_path = repos
+    catalogue_service.load_catalogues()
+    drugs.calls.clear()
+    foods.calls.clear()
+
+    drugs._db_version = (2, 7)
+    catalogue_service.refresh_catalogues()
+    assert drugs.calls == [("since", 1), ("save", str(tmp_path / "drugs.snap"))]
+    assert drugs.version == (2, 7)
+    assert foods.calls == []
+
+
+def test_refresh_falls_back_to_full_reload(repos):
+    drugs, foods, _ = repos
+    catalogue_service.load_catalogues()
+
+    # Rows deleted: fewer rows than loaded
+    drugs.calls.clear()
+    drugs._db_version = (0, 1)
+    catalogue_service.refresh_catalogues()
+    assert drugs.calls[0] == "db" and drugs.version == (0, 1)
+
+    # New ids appeared, but the delta does not add up (e.g. a concurrent delete)
+    drugs.calls.clear()
+    drugs._db_version = (3, 9)
+    drugs.delta_ok = False
+    catalogue_service.refresh_catalogues()
+    assert drugs.calls[:2] == [("since", 1), "db"]
+    assert drugs.version == (3, 9)
+
+
+def test_reload_always_goes_to_the_database(repos):
+    drugs, foods, _ = repos
+    catalogue_service.load_catalogues()
+    drugs.calls.clear()
+    foods.calls.clear()
+
+    catalogue_service.reload_catalogues()
+    assert drugs.calls[0] == "db"
+    assert foods.calls[0] == "db"
+
+
+def test_refresh_keeps_serving_when_db_fails(repos):
+    drugs, foods, _ = repos
+    catalogue_service.load_catalogues()
+    drugs._db_version = RuntimeError("db down")
+
+    catalogue_service.refresh_catalogues()  # does not raise
+    assert drugs.version == (1, 1)
+
+
+def test_sync_remaps_replaced_snapshots_only(repos):
+    drugs, foods, tmp_path = repos
+    (tmp_path / "drugs.snap").write_bytes(b"v1")
+    catalogue_service.load_catalogues()
+    drugs.calls.clear()
+    foods.calls.clear()
+
+    # Nothing replaced since the load: no remap
+    catalogue_service.sync_catalogues()
+    assert drugs.calls == [] and foods.calls == []
+
+    # The leader renamed a new drugs snapshot into place
+    new = tmp_path / "drugs.snap.tmp"
+    new.write_bytes(b"v2, longer")
+    new.replace(tmp_path / "drugs.snap")
+    catalogue_service.sync_catalogues()
+    assert drugs.calls == [("load", str(tmp_path / "drugs.snap"))]
+    assert foods.calls == []
+
+    catalogue_service.sync_catalogues()
+    assert len(drugs.calls) == 1
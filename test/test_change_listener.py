@@ -0,0 +1,84 @@
+import psycopg
+import pytest
+
+from utils import change_listener
+
+
+class Notify:
+    def __init__(self, payload):
+        self.payload = payload
+
+
+class FakeConn:
+    def __init__(self):
+        self.autocommit = False
+        self.executed = []
+        self.pending = []
+        self.broken = False
+        self.closed = False
+
+    def execute(self, query):
+        self.executed.append(query)
+
+    def notifies(self, timeout=None):
+        if self.broken:
+            raise psycopg.OperationalError("connection lost")
+        pending, self.pending = self.pending, []
+        return iter(pending)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def conns(monkeypatch):
+    opened = []
+
+    def connect():
+        conn = FakeConn()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(change_listener.config, "mydb_direct", connect)
+    return opened
+
+
+def test_first_drain_listens_and_reports_missed(conns):
+    listener = change_listener.ChangeListener("chan")
+    assert listener.drain() is None
+    assert len(conns) == 1 and conns[0].autocommit and conns[0].executed
+
+    conns[0].pending = [Notify("1"), Notify("2"), Notify("1")]
+    assert listener.drain() == {"1", "2"}
+    assert listener.drain() == set()
+
+
+def test_lost_connection_reopens(conns):
+    listener = change_listener.ChangeListener("chan")
+    listener.drain()
+    conns[0].broken = True
+
+    assert listener.drain() is None
+    assert conns[0].closed and len(conns) == 2
+    assert listener.drain() == set()
+
+
+def test_open_failure_backs_off(monkeypatch):
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise psycopg.OperationalError("down")
+
+    monkeypatch.setattr(change_listener.config, "mydb_direct", fail)
+    listener = change_listener.ChangeListener("chan", retry_seconds=60)
+
+    assert listener.drain() is None
+    assert listener.drain() is None
+    assert len(calls) == 1
+
+
+def test_disabled_listener_never_connects(monkeypatch):
+    monkeypatch.setattr(change_listener.config, "mydb_direct", lambda: pytest.fail("connected"))
+    listener = change_listener.ChangeListener("chan", enabled=False)
+    assert listener.drain() == set()
@@ -0,0 +1,113 @@
+import pytest
+import psycopg
+from utils import db_pool
+
+
+# ---------- Fake pool / connection ----------
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = psycopg.pq.TransactionStatus.IDLE
+
+
+class FakeConn:
+    def __init__(self):
+        self.info = FakeInfo()
+        self.closed = False
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self, **kwargs):
+        return "cursor"
+
+    def commit(self):
+        self.committed = True
+        self.info.transaction_status = psycopg.pq.TransactionStatus.IDLE
+
+    def rollback(self):
+        self.rolled_back = True
+        self.info.transaction_status = psycopg.pq.TransactionStatus.IDLE
+
+
+class FakePool:
+    def __init__(self):
+        self.out = []
+        self.returned = []
+
+    def getconn(self):
+        conn = FakeConn()
+        self.out.append(conn)
+        return conn
+
+    def putconn(self, conn):
+        self.returned.append(conn)
+
+    def get_stats(self):
+        return {"pool_size": 1}
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(db_pool, "get_pool", lambda: pool)
+    monkeypatch.setattr(db_pool, "_pool", None)
+    db_pool._reset_stats()
+    return pool
+
+
+def test_close_returns_connection_to_pool(fake_pool):
+    conn = db_pool.getconn()
+    assert conn.cursor() == "cursor"
+    conn.close()
+    assert fake_pool.returned == fake_pool.out
+    assert conn.closed
+
+    # Double close is a no-op
+    conn.close()
+    assert len(fake_pool.returned) == 1
+
+
+def test_use_after_close_raises(fake_pool):
+    conn = db_pool.getconn()
+    conn.close()
+    with pytest.raises(psycopg.InterfaceError):
+        conn.cursor()
+
+
+def test_release_rolls_back_open_transaction(fake_pool):
+    conn = db_pool.getconn()
+    raw = fake_pool.out[0]
+    raw.info.transaction_status = psycopg.pq.TransactionStatus.INTRANS
+    conn.close()
+    assert raw.rolled_back
+
+
+def test_context_manager_commits_on_success(fake_pool):
+    with db_pool.connection() as conn:
+        conn.cursor()
+    raw = fake_pool.out[0]
+    assert raw.committed
+    assert fake_pool.returned == [raw]
+
+
+def test_context_manager_rolls_back_on_error(fake_pool):
+    with pytest.raises(ValueError):
+        with db_pool.connection():
+            raise ValueError("boom")
+    raw = fake_pool.out[0]
+    assert raw.rolled_back and not raw.committed
+    assert fake_pool.returned == [raw]
+
+
+def test_leaked_connection_is_reclaimed(fake_pool):
+    db_pool.getconn()  # dropped without close()
+    assert len(fake_pool.returned) == 1
+    assert db_pool.get_pool_stats()["leaked"] == 1
+
+
+def test_pool_stats_count_acquires(fake_pool):
+    for _ in range(3):
+        db_pool.getconn().close()
+    stats = db_pool.get_pool_stats()
+    assert stats["acquired"] == 3
+    assert stats["released"] == 3
+    assert stats["wait_max_ms"] >= 0
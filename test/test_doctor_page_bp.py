@@ -246,8 +246,10 @@ def test_plan_item_create_existing_plan(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
+    monkeypatch.setattr(doctor_bp.plan_repo, "get_plan_by_user_id",
+                        lambda x: DummyPlan(id=3))
     monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan",
-                        lambda *a: DummyPlan(id=3))
+                        lambda *a: pytest.fail("plan should not be expanded"))
     monkeypatch.setattr(doctor_bp.user_repo, "get_user_by_id",
                         lambda x: DummyUser(id=x))
 
@@ -259,8 +261,7 @@ def test_plan_item_create_auto_create_plan(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
-    monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan", lambda *a: None)
-    monkeypatch.setattr(doctor_bp.plan_service, "get_raw_plan", lambda *a: None)
+    monkeypatch.setattr(doctor_bp.plan_repo, "get_plan_by_user_id", lambda x: None)
     monkeypatch.setattr(doctor_bp.plan_repo, "create_plan",
                         lambda **k: DummyPlan(id=10))
     monkeypatch.setattr(doctor_bp.user_repo, "get_user_by_id",
@@ -288,7 +289,7 @@ def test_plan_item_edit_no_plan(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
-    monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan",
+    monkeypatch.setattr(doctor_bp.plan_service, "get_raw_plan",
                         lambda *a: None)
 
     resp = client.get("/doctor/plan_item_edit?item_id=1&patient_id=2")
@@ -300,7 +301,7 @@ def test_plan_item_edit_item_not_found(client, monkeypatch):
         s["user_id"] = 1
 
     plan = DummyPlan(id=5, plan_items=[])
-    monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan", lambda *a: plan)
+    monkeypatch.setattr(doctor_bp.plan_service, "get_raw_plan", lambda *a: plan)
     monkeypatch.setattr(doctor_bp.user_repo, "get_user_by_id",
                         lambda x: DummyUser(id=x))
 
@@ -313,7 +314,9 @@ def test_plan_item_edit_success(client, monkeypatch):
         s["user_id"] = 1
 
     plan = DummyPlan(id=5, plan_items=[DummyPlanItem(id=1)])
-    monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan", lambda *a: plan)
+    monkeypatch.setattr(doctor_bp.plan_service, "get_raw_plan", lambda *a: plan)
+    monkeypatch.setattr(doctor_bp.plan_service, "get_user_plan",
+                        lambda *a: pytest.fail("plan should not be expanded"))
     monkeypatch.setattr(doctor_bp.user_repo, "get_user_by_id",
                         lambda x: DummyUser(id=x))
 
@@ -538,43 +541,34 @@ def test_feedback_page_success(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
-    p = DummyUser(id=2)
+    patients = [DummyUser(id=2), DummyUser(id=3)]
     monkeypatch.setattr(
         doctor_bp.user_repo, "get_patients_by_doctor_id",
-        lambda x: [p]
-    )
-
-    plan = DummyPlan(id=5, doctor_id=1,
-                     plan_items=[DummyPlanItem()])
-    monkeypatch.setattr(
-        doctor_bp.plan_repo, "get_plan_by_user_id",
-        lambda x: plan
-    )
-
-    monkeypatch.setattr(
-        doctor_bp.plan_repo, "get_all_plan_items_by_plan_id",
-        lambda x: plan.plan_items
+        lambda x: patients
     )
 
-    yesterday = date.today() - timedelta(days=1)
+    stats = {"yesterday_completion": 100, "today_tasks": 2,
+             "risk_level": "Low", "has_feedback_today": False}
+    calls = []
 
-    monkeypatch.setattr(
-        doctor_bp.plan_service, "get_user_plan",
-        lambda pid, start, end: DummyPlan(plan_items=[DummyPlanItem(date_=yesterday)])
-    )
+    def fake_stats(ids):
+        calls.append(ids)
+        return {2: stats}  # patient 3 has no plan items
 
     monkeypatch.setattr(
-        doctor_bp.drug_record_repo, "get_drug_records_by_date_range",
-        lambda **k: [DummyRecord(status="TAKEN")]
+        doctor_bp.patient_stats_service, "get_patients_stats", fake_stats
     )
 
-    monkeypatch.setattr(
-        doctor_bp.feedback_repo, "get_feedback_by_date",
-        lambda *a: None
-    )
+    rendered = {}
+    monkeypatch.setattr(doctor_bp, "render_template",
+                        lambda name, **kw: rendered.update(kw) or "OK")
 
     resp = client.get("/doctor/feedback")
     assert resp.status_code == 200
+    assert calls == [[2, 3]]
+    assert rendered["patients"] == [
+        {"id": 2, "username": "u", "email": "u@e.com", **stats}
+    ]
 
 
 # ============================================================================================
@@ -619,37 +613,16 @@ def test_add_patient_triggered_flag(client, monkeypatch):
     assert resp.status_code == 200
 
 
-def test_feedback_page_no_tasks_and_no_records(client, monkeypatch):
+def test_feedback_page_no_patients_with_items(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
-    patient = DummyUser(id=2)
     monkeypatch.setattr(doctor_bp.user_repo,
                         "get_patients_by_doctor_id",
-                        lambda x: [patient])
-
-    base_plan = DummyPlan(id=5, doctor_id=1, plan_items=[])
-    monkeypatch.setattr(doctor_bp.plan_repo,
-                        "get_plan_by_user_id",
-                        lambda x: base_plan)
-
-    monkeypatch.setattr(doctor_bp.plan_repo,
-                        "get_all_plan_items_by_plan_id",
-                        lambda x: [])
-
-    yesterday = date.today() - timedelta(days=1)
-
-    monkeypatch.setattr(doctor_bp.plan_service,
-                        "get_user_plan",
-                        lambda pid, start, end: DummyPlan(plan_items=[]))
-
-    monkeypatch.setattr(doctor_bp.drug_record_repo,
-                        "get_drug_records_by_date_range",
-                        lambda **k: [])
-
-    monkeypatch.setattr(doctor_bp.feedback_repo,
-                        "get_feedback_by_date",
-                        lambda *a, **k: None)
+                        lambda x: [DummyUser(id=2)])
+    monkeypatch.setattr(doctor_bp.patient_stats_service,
+                        "get_patients_stats",
+                        lambda ids: {})
 
     resp = client.get("/doctor/feedback")
     assert resp.status_code == 200
@@ -664,45 +637,67 @@ def test_patient_stats_no_plan_items(client, monkeypatch):
                         "get_plan_by_user_id",
                         lambda x: plan)
 
-    monkeypatch.setattr(doctor_bp.plan_service,
-                        "get_user_plan",
-                        lambda *a: DummyPlan(plan_items=[]))
-
-    monkeypatch.setattr(doctor_bp.drug_record_repo,
-                        "get_drug_records_by_date_range",
-                        lambda **k: [])
+    monkeypatch.setattr(doctor_bp.patient_stats_service,
+                        "get_patients_stats",
+                        lambda ids: {})
 
     resp = client.get("/doctor/patient_stats?patient_id=2")
     assert resp.status_code == 200
-    assert resp.get_json()["risk_level"] == "High"
+    assert resp.get_json() == {"yesterday_completion": 0, "today_tasks": 0, "risk_level": "High"}
 
 
-def test_patient_stats_taken_late_medium_risk(client, monkeypatch):
+def test_patient_stats_reads_rollup(client, monkeypatch):
     with client.session_transaction() as s:
         s["user_id"] = 1
 
-    yesterday = date.today() - timedelta(days=1)
-    items = [DummyPlanItem(date_=yesterday)]
-
-    plan = DummyPlan(id=1, doctor_id=1, patient_id=2, plan_items=items)
-
+    plan = DummyPlan(id=1, doctor_id=1, patient_id=2)
     monkeypatch.setattr(doctor_bp.plan_repo,
                         "get_plan_by_user_id",
                         lambda x: plan)
 
-    y_plan = DummyPlan(plan_items=items)
-    monkeypatch.setattr(doctor_bp.plan_service,
-                        "get_user_plan",
-                        lambda *a: y_plan)
-
-    monkeypatch.setattr(doctor_bp.drug_record_repo,
-                        "get_drug_records_by_date_range",
-                        lambda **k: [DummyRecord(status="TAKEN_LATE")])
+    stats = {"yesterday_completion": 80, "today_tasks": 3,
+             "risk_level": "Medium", "has_feedback_today": False}
+    monkeypatch.setattr(doctor_bp.patient_stats_service,
+                        "get_patients_stats",
+                        lambda ids: {2: stats} if ids == [2] else {})
 
     resp = client.get("/doctor/patient_stats?patient_id=2")
     assert resp.status_code == 200
-    assert resp.get_json()["risk_level"] == "High"
+    assert resp.get_json() == {"yesterday_completion": 80, "today_tasks": 3, "risk_level": "Medium"}
 
 
+# ============================================================================================
+#  /doctor/patient_adherence
+# ============================================================================================
 
+def test_patient_adherence_trend(client, monkeypatch):
+    with client.session_transaction() as s:
+        s["user_id"] = 1
+
+    monkeypatch.setattr(doctor_bp.plan_repo, "get_plan_by_user_id",
+                        lambda x: DummyPlan(doctor_id=1, patient_id=2))
+    calls = []
+    monkeypatch.setattr(doctor_bp.patient_stats_service, "get_adherence_trend",
+                        lambda pid, days: calls.append((pid, days)) or [{"day": "2025-01-01"}])
+
+    resp = client.get("/doctor/patient_adherence?patient_id=2&days=14")
+    assert resp.status_code == 200
+    assert resp.get_json() == {"patient_id": 2, "days": [{"day": "2025-01-01"}]}
+    assert calls == [(2, 14)]
+
+
+@pytest.mark.parametrize("query,status", [
+    ("patient_id=x", 400),
+    ("patient_id=2&days=0", 400),
+    ("patient_id=2&days=1000", 400),
+    ("patient_id=3", 403),
+])
+def test_patient_adherence_rejects(client, monkeypatch, query, status):
+    with client.session_transaction() as s:
+        s["user_id"] = 1
+
+    monkeypatch.setattr(doctor_bp.plan_repo, "get_plan_by_user_id",
+                        lambda x: DummyPlan(doctor_id=9, patient_id=3))
 
+    resp = client.get(f"/doctor/patient_adherence?{query}")
+    assert resp.status_code == status
@@ -99,7 +99,7 @@ def test_search_drug_name_too_short(client):
 
 
 def test_search_drug_no_results(client, monkeypatch):
-    monkeypatch.setattr(drug_repo, "search_drugs_by_keywords_locally", lambda x: [])
+    monkeypatch.setattr(drug_repo, "search_drugs_by_keywords_locally", lambda x, **kw: [])
     resp = client.get("/search_drug?name=aspirin")
     assert resp.status_code == 404
     assert resp.get_json() == []
@@ -129,7 +129,7 @@ def test_search_drug_success(client, monkeypatch):
     monkeypatch.setattr(
         drug_repo,
         "search_drugs_by_keywords_locally",
-        lambda names: [DummyDrug(10), DummyDrug(20)]
+        lambda names, **kw: [DummyDrug(10), DummyDrug(20)]
     )
 
     resp = client.get("/search_drug?name=aspirin test")
@@ -137,6 +137,26 @@ def test_search_drug_success(client, monkeypatch):
     assert resp.get_json()[0]["id"] == 10
 
 
+def test_search_drug_passes_limit_offset(client, monkeypatch):
+    seen = {}
+
+    def fake_search(names, limit, offset):
+        seen.update(limit=limit, offset=offset)
+        return []
+
+    monkeypatch.setattr(drug_repo, "search_drugs_by_keywords_locally", fake_search)
+    client.get("/search_drug?name=aspirin&limit=20&offset=40")
+    assert seen == {"limit": 20, "offset": 40}
+
+
+def test_search_drug_invalid_limit(client):
+    assert client.get("/search_drug?name=aspirin&limit=abc").status_code == 400
+    assert client.get("/search_drug?name=aspirin&limit=0").status_code == 400
+    assert client.get("/search_drug?name=aspirin&limit=101").status_code == 400
+    assert client.get("/search_drug?name=aspirin&offset=-1").status_code == 400
+    assert client.get("/search_drug?name=aspirin&offset=1001").status_code == 400
+
+
 # ============================================================
 # /get_drug_by_ndc
 # ============================================================
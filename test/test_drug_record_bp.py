@@ -224,15 +224,13 @@ def test_mark_invalid_time(client):
 
 
 def test_mark_toggle_existing(client, monkeypatch):
-    dummy = DummyRecord(id=123)
+    calls = []
 
-    monkeypatch.setattr(bp.drug_record_repo,
-                        "get_drug_record_by_unique",
-                        lambda **k: dummy)
+    def fake_toggle(**k):
+        calls.append(k)
+        return "deleted", 123
 
-    monkeypatch.setattr(bp.drug_record_repo,
-                        "delete_drug_record",
-                        lambda rid: True)
+    monkeypatch.setattr(bp.drug_record_repo, "toggle_drug_taken", fake_toggle)
 
     r = client.post("/mark_drug_taken", json={
         "user_id": 1,
@@ -242,12 +240,15 @@ def test_mark_toggle_existing(client, monkeypatch):
     })
     assert r.status_code == 200
     assert r.get_json()["action"] == "deleted"
+    assert r.get_json()["id"] == 123
+    # No valid status: the toggle may only delete
+    assert calls[0]["allow_create"] is False
 
 
 def test_mark_create_invalid_status(client, monkeypatch):
     monkeypatch.setattr(bp.drug_record_repo,
-                        "get_drug_record_by_unique",
-                        lambda **k: None)
+                        "toggle_drug_taken",
+                        lambda **k: ("unchanged", None))
 
     r = client.post("/mark_drug_taken", json={
         "user_id": 1,
@@ -260,21 +261,103 @@ def test_mark_create_invalid_status(client, monkeypatch):
 
 
 def test_mark_create_success(client, monkeypatch):
-    monkeypatch.setattr(bp.drug_record_repo,
-                        "get_drug_record_by_unique",
-                        lambda **k: None)
+    calls = []
 
-    monkeypatch.setattr(bp.drug_record_repo,
-                        "create_drug_record",
-                        lambda **k: 789)
+    def fake_toggle(**k):
+        calls.append(k)
+        return "created", 789
+
+    monkeypatch.setattr(bp.drug_record_repo, "toggle_drug_taken", fake_toggle)
 
     r = client.post("/mark_drug_taken", json={
         "user_id": 1,
         "drug_id": 2,
         "plan_item_id": 3,
         "expected_date": "2024-01-01",
+        "expected_time": "08:30",
         "status": "ON_TIME",
         "timing_flag": "EARLY"
     })
     assert r.status_code == 200
     assert r.get_json()["id"] == 789
+    assert r.get_json()["action"] == "created"
+    assert calls[0]["status"] == "TAKEN"
+    assert calls[0]["allow_create"] is True
+    assert calls[0]["expected_time"] == time(8, 30)
+
+
+def test_mark_concurrent_duplicate_is_unchanged(client, monkeypatch):
+    monkeypatch.setattr(bp.drug_record_repo,
+                        "toggle_drug_taken",
+                        lambda **k: ("unchanged", None))
+
+    r = client.post("/mark_drug_taken", json={
+        "user_id": 1,
+        "drug_id": 2,
+        "plan_item_id": 3,
+        "expected_date": "2024-01-01",
+        "status": "LATE"
+    })
+    assert r.status_code == 200
+    assert r.get_json()["action"] == "unchanged"
+
+
+# =====================================================================================
+# POST /mark_drugs_taken
+# =====================================================================================
+
+def test_mark_bulk_requires_doses(client):
+    assert client.post("/mark_drugs_taken", json={"user_id": 1}).status_code == 400
+    assert client.post("/mark_drugs_taken", json={"user_id": 1, "doses": []}).status_code == 400
+
+
+def test_mark_bulk_too_many(client):
+    doses = [{"plan_item_id": 1, "expected_date": "2024-01-01", "status": "ON_TIME"}] * 201
+    r = client.post("/mark_drugs_taken", json={"user_id": 1, "doses": doses})
+    assert r.status_code == 400
+
+
+def test_mark_bulk_per_item_results(client, monkeypatch):
+    calls = []
+
+    def fake_mark(user_id, doses, status):
+        calls.append((user_id, doses, status))
+        return [("created", 11), ("exists", None)]
+
+    monkeypatch.setattr(bp.drug_record_repo, "mark_doses_taken", fake_mark)
+
+    r = client.post("/mark_drugs_taken", json={"user_id": 1, "doses": [
+        {"plan_item_id": 3, "expected_date": "2024-01-01", "expected_time": "08:00", "status": "ON_TIME"},
+        {"plan_item_id": 4, "expected_date": "2024-01-01", "expected_time": "bad", "status": "ON_TIME"},
+        {"plan_item_id": 5, "expected_date": "2024-01-01", "status": "LATE"},
+        {"plan_item_id": 6, "expected_date": "2024-01-01", "status": "WRONG"},
+    ]})
+
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body["created"] == 1
+    assert [res.get("action") for res in body["results"]] == ["created", None, "exists", None]
+    assert body["results"][0]["id"] == 11
+    assert "error" in body["results"][1] and "error" in body["results"][3]
+
+    # Only the valid doses are written, in one call
+    assert calls == [(1, [(3, date(2024, 1, 1), time(8, 0)), (5, date(2024, 1, 1), None)], "TAKEN")]
+
+
+# =====================================================================================
+# GET /get_drug_records_page
+# =====================================================================================
+
+def test_get_drug_records_page(client, monkeypatch):
+    monkeypatch.setattr(bp.drug_record_repo, "get_drug_records_page",
+                        lambda user_id, limit, after=None, start=None, end=None: ([DummyRecord(id=9)], None))
+
+    r = client.get("/get_drug_records_page?user_id=1&end=2024-01-31")
+    assert r.status_code == 200
+    assert r.get_json()["next_cursor"] is None
+    assert r.get_json()["records"][0]["id"] == 9
+
+
+def test_get_drug_records_page_bad_args(client):
+    assert client.get("/get_drug_records_page").status_code == 400
+    assert client.get("/get_drug_records_page?user_id=1&limit=500").status_code == 400
@@ -14,9 +14,12 @@ class FakeCursor:
         self.rows = rows
         self._idx = 0
         self.rowcount = rowcount
+        self.last_query = None
+        self.params = None
 
-    def execute(self, *args, **kwargs):
-        pass
+    def execute(self, query, params=None):
+        self.last_query = query
+        self.params = params
 
     def fetchone(self):
         if not self.rows:
@@ -243,15 +246,108 @@ def test_get_drug_record_by_unique_not_found(monkeypatch):
     assert result is None
 
 
-def test_get_recent_completed_drug_records(monkeypatch):
-    rows = [
-        sample_row(id=1),
-        sample_row(id=2),
-    ]
+def test_get_taken_dose_keys(monkeypatch):
+    rows = [(1, 10, date(2025, 1, 1), dt_time(9, 0))]
     cursor = FakeCursor(sample_description, rows)
     conn = FakeConn(cursor)
     monkeypatch.setattr(drug_record_repo, "mydb", lambda: conn)
 
-    records = drug_record_repo.get_recent_completed_drug_records(7)
-    assert len(records) == 2
-    assert all(isinstance(r, drug_record) for r in records)
+    keys = drug_record_repo.get_taken_dose_keys([1], date(2025, 1, 1), date(2025, 1, 1))
+    assert keys == {(1, 10, date(2025, 1, 1), dt_time(9, 0))}
+
+
+def test_get_taken_dose_keys_empty(monkeypatch):
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: pytest.fail("no query expected"))
+    assert drug_record_repo.get_taken_dose_keys([], date(2025, 1, 1), date(2025, 1, 1)) == set()
+
+
+def test_record_writes_refresh_adherence_rollup(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(drug_record_repo.adherence_repo, "refresh_day_counts",
+                        lambda cur, user_id, day: refreshed.append((user_id, day)))
+
+    cursor = FakeCursor(sample_description, [(10, date(2025, 1, 2))], rowcount=1)
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+    assert drug_record_repo.delete_drug_record(1) is True
+
+    cursor = FakeCursor(sample_description, [(7,)])
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+    drug_record_repo.create_drug_record(user_id=5, drug_id=1, expected_date=date(2025, 1, 3))
+
+    cursor = FakeCursor(sample_description, [], rowcount=0)
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+    assert drug_record_repo.update_drug_record(1, "TAKEN", None, None, None) is False
+
+    assert refreshed == [(10, date(2025, 1, 2)), (5, date(2025, 1, 3))]
+
+
+@pytest.mark.parametrize("rows,expected,refreshed", [
+    ([("created", 7)], ("created", 7), True),
+    ([("deleted", 3)], ("deleted", 3), True),
+    ([], ("unchanged", None), False),
+])
+def test_toggle_drug_taken(monkeypatch, rows, expected, refreshed):
+    calls = []
+    monkeypatch.setattr(drug_record_repo.adherence_repo, "refresh_day_counts",
+                        lambda cur, user_id, day: calls.append((user_id, day)))
+    cursor = FakeCursor(sample_description, rows)
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+
+    result = drug_record_repo.toggle_drug_taken(
+        user_id=5, drug_id=1, plan_item_id=9,
+        expected_date=date(2025, 1, 2), expected_time=None,
+    )
+
+    assert result == expected
+    assert calls == ([(5, date(2025, 1, 2))] if refreshed else [])
+
+
+class BatchCursor(FakeCursor):
+    """executemany(returning=True): one result set per parameter set."""
+
+    def executemany(self, query, params_seq, returning=False):
+        self.params_seq = list(params_seq)
+        self._idx = 0
+
+    def nextset(self):
+        return self._idx < len(self.rows) or None
+
+
+def test_mark_doses_taken(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(drug_record_repo.adherence_repo, "refresh_day_counts",
+                        lambda cur, user_id, day: refreshed.append((user_id, day)))
+    cursor = BatchCursor(sample_description, [(41, True), (None, True), (None, False)])
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+
+    d1, d2 = date(2025, 1, 2), date(2025, 1, 3)
+    results = drug_record_repo.mark_doses_taken(5, [(1, d1, dt_time(8)), (2, d2, None), (99, d2, None)])
+
+    assert results == [("created", 41), ("exists", None), ("not_found", None)]
+    assert [p["plan_item_id"] for p in cursor.params_seq] == [1, 2, 99]
+    assert refreshed == [(5, d1)]  # only days that gained a record
+
+
+def test_mark_doses_taken_empty(monkeypatch):
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: pytest.fail("no query expected"))
+    assert drug_record_repo.mark_doses_taken(5, []) == []
+
+
+def test_get_drug_records_page(monkeypatch):
+    cursor = FakeCursor(sample_description, [sample_row(id=5), sample_row(id=4, expected_time=None)])
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+
+    records, next_key = drug_record_repo.get_drug_records_page(10, 2)
+    assert [r.id for r in records] == [5, 4]
+    assert next_key is None
+    assert cursor.params == (10, 3)
+
+    cursor = FakeCursor(sample_description, [sample_row(id=5), sample_row(id=4, expected_time=None)])
+    monkeypatch.setattr(drug_record_repo, "mydb", lambda: FakeConn(cursor))
+
+    after = (date(2025, 1, 3), dt_time(9), 8)
+    records, next_key = drug_record_repo.get_drug_records_page(10, 1, after=after, end=date(2025, 1, 5))
+    assert [r.id for r in records] == [5]
+    assert next_key == (date(2025, 1, 2), dt_time(12, 0), 5)
+    assert cursor.params == (10, date(2025, 1, 5), date(2025, 1, 3), False, dt_time(9), 8, 2)
+    assert "ORDER BY expected_date DESC, expected_time IS NULL DESC" in cursor.last_query
@@ -104,3 +104,114 @@ def test_get_drugs_by_ids_locally():
     ]
     res = drug_repo.get_drugs_by_ids_locally([1, 2])
     assert len(res) == 2
+
+
+def test_get_drugs_by_ids_locally_dedupes_and_skips_missing():
+    drug_repo.drugs = [
+        drug_repo.drug(1, "x", "A", "", "", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(2, "y", "B", "", "", "", "", "", "", "", "", "", "", True),
+    ]
+    res = drug_repo.get_drugs_by_ids_locally([2, 2, 99])
+    assert [d.id for d in res] == [2]
+
+
+def test_get_drug_by_ndc_locally():
+    drug_repo.drugs = [
+        drug_repo.drug(1, "", "A", "", "", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(2, "0002", "B", "", "", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(3, "0002", "C", "", "", "", "", "", "", "", "", "", "", True),
+    ]
+    assert drug_repo.get_drug_by_ndc_locally("0002").id == 2
+    assert drug_repo.get_drug_by_ndc_locally("") is None
+    assert drug_repo.get_drug_by_ndc_locally("missing") is None
+
+
+def test_indexes_follow_catalogue_changes():
+    drug_repo.drugs = [
+        drug_repo.drug(1, "x", "A", "", "", "", "", "", "", "", "", "", "", True),
+    ]
+    assert drug_repo.get_drug_by_id_locally(2) is None
+
+    drug_repo.drugs.append(
+        drug_repo.drug(2, "y", "B", "", "", "", "", "", "", "", "", "", "", True)
+    )
+    assert drug_repo.get_drug_by_id_locally(2).brand_name == "B"
+
+    drug_repo.drugs = []
+    assert drug_repo.get_drug_by_id_locally(1) is None
+
+
+def test_search_drugs_by_keywords_locally_ranking():
+    drug_repo.drugs = [
+        drug_repo.drug(1, "a", "Advil Liqui-Gels", "", "Ibuprofen", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(2, "b", None, "", "ibuprofen", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(3, "c", "Advil", "", "Ibuprofen", "", "", "", "", "", "", "", "", True),
+        drug_repo.drug(4, "d", "Tylenol", "", "Acetaminophen", "", "", "", "", "", "", "", "", True),
+    ]
+    res = drug_repo.search_drugs_by_keywords_locally(["ibuprofen"])
+    # branded first, shortest brand_name first
+    assert [d.id for d in res] == [3, 1, 2]
+    assert drug_repo.search_drugs_by_keywords_locally(["advil", "gels"])[0].id == 1
+
+
+def test_search_drugs_by_keywords_locally_limit_offset():
+    drug_repo.drugs = [
+        drug_repo.drug(i, str(i), "Aspirin" + "x" * (i % 5) if i % 4 else None, "",
+                       "aspirin" + "y" * (i % 3), "", "", "", "", "", "", "", "", True)
+        for i in range(200)
+    ]
+    full = [drug_repo.drugs[pos] for pos in
+            sorted(range(200), key=drug_repo._drug_rank(drug_repo.drugs))]
+    assert drug_repo.search_drugs_by_keywords_locally(["asp"]) == full[:100]
+    assert drug_repo.search_drugs_by_keywords_locally(["asp"], limit=30, offset=90) == full[90:120]
+
+
+def test_drugs_snapshot_round_trip(tmp_path):
+    drug_repo._publish(drug_repo.DrugCatalogue([
+        drug_repo.drug(1, "0001", "Tylenol", "", "Acetaminophen", "McNeil", "tablet", "oral",
+                       "OTC", "type", "A1", "2020", "2030", True),
+        drug_repo.drug(2, None, None, None, "Ibuprofen", "", "", "", "", "", "", "", "", None),
+    ], version=(2, 2)))
+    expected = list(drug_repo.drugs)
+    path = str(tmp_path / "drugs.snap")
+    drug_repo.save_drugs_snapshot(path)
+
+    drug_repo.drugs = []
+    assert drug_repo.load_drugs_snapshot(path)
+
+    assert drug_repo.drugs == expected
+    assert drug_repo.loaded_drugs_version() == (2, 2)
+    assert drug_repo.get_drug_by_id_locally(2).generic_name == "Ibuprofen"
+    assert [d.id for d in drug_repo.search_drugs_by_keywords_locally(["ibu"])] == [2]
+
+
+def test_get_drugs_replaces_catalogue(mock_mydb):
+    drug_repo.drugs = []
+    drug_repo.get_drugs()
+    drug_repo.get_drugs()
+    assert len(drug_repo.drugs) == 1
+    assert drug_repo.loaded_drugs_version() == (1, 1)
+
+
+def test_load_drugs_since_publishes_new_generation(monkeypatch):
+    old = [drug_repo.drug(1, "0001", "Advil", "", "Ibuprofen", "", "", "", "", "", "", "", "", True)]
+    drug_repo._publish(drug_repo.DrugCatalogue(old, version=(1, 1)))
+    before = drug_repo._current()
+
+    columns = [(c,) for c in ("id", "product_ndc", "brand_name", "brand_name_base",
+                              "generic_name", "labeler_name", "dosage_form", "route",
+                              "marketing_category", "product_type", "application_number",
+                              "marketing_start_date", "listing_expiration_date", "finished")]
+    rows = [(5, "0005", "Motrin", "", "Ibuprofen", "", "", "", "", "", "", "", "", True)]
+    monkeypatch.setattr(drug_repo, "mydb", lambda: FakeConn(FakeCursor(columns, rows)))
+
+    assert drug_repo.load_drugs_since(1) == 1
+    assert [d.id for d in drug_repo.drugs] == [1, 5]
+    assert drug_repo.loaded_drugs_version() == (2, 5)
+    assert drug_repo.get_drug_by_ndc_locally("0005").brand_name == "Motrin"
+    assert {d.id for d in drug_repo.search_drugs_by_keywords_locally(["ibuprofen"])} == {1, 5}
+
+    # The previous generation is untouched for readers still holding it
+    assert [d.id for d in before.drugs] == [1]
+    assert 5 not in before.by_id
+    assert before.search_index.search(["motrin"]) == []
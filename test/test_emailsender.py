@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from utils import emailsender
+from utils.emailsender import EmailMessage, LocalTransport, Mailer, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter_allows_a_burst_then_throttles():
+    clock = FakeClock()
+    limiter = RateLimiter(2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        limiter.acquire()
+
+    # Two immediately, then one every half second
+    assert clock.now == pytest.approx(1.0)
+    assert len(clock.slept) == 2
+
+
+def test_rate_limiter_unlimited():
+    clock = FakeClock()
+    limiter = RateLimiter(0, clock=clock, sleep=clock.sleep)
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.slept == []
+
+
+def test_send_bulk_uses_worker_pool_and_keeps_order():
+    threads = set()
+
+    class SlowTransport(LocalTransport):
+        def send(self, message):
+            threads.add(threading.current_thread().name)
+            if message.to == "bad@test.com":
+                raise RuntimeError("rejected")
+            return super().send(message)
+
+    mailer = Mailer(SlowTransport(), max_workers=3, rate_per_second=0)
+    messages = [EmailMessage(f"u{i}@test.com", "s", "b") for i in range(5)]
+    messages.insert(2, EmailMessage("bad@test.com", "s", "b"))
+
+    results = mailer.send_bulk(messages)
+    mailer.shutdown()
+
+    assert results == [True, True, False, True, True, True]
+    assert len(mailer.transport.outbox) == 5
+    assert all(name.startswith("mailer") for name in threads)
+
+
+def test_ses_client_is_cached(monkeypatch):
+    created = []
+    monkeypatch.setattr(emailsender.boto3, "client", lambda *a, **k: created.append(a) or object())
+    monkeypatch.setattr(emailsender, "_client", None)
+
+    assert emailsender.get_ses_client() is emailsender.get_ses_client()
+    assert len(created) == 1
+
+
+def test_send_email_ses_through_local_transport(monkeypatch):
+    monkeypatch.setattr(emailsender.config, "MAIL_TRANSPORT", "local")
+    monkeypatch.setattr(emailsender, "_mailer", None)
+
+    assert emailsender.send_email_ses("a@test.com", "Hi", "<p>x</p>") is True
+    [sent] = emailsender.get_mailer().transport.outbox
+    assert sent.to == "a@test.com" and sent.text_body is None
+    emailsender.get_mailer().shutdown()
+    monkeypatch.setattr(emailsender, "_mailer", None)
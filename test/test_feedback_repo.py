@@ -162,3 +162,16 @@ def test_row_to_feedback_parsing(sample_row):
     assert fb.patient_id == 10
     assert fb.feedback == "Good job"
 
+
+
+def test_get_patient_ids_with_feedback(monkeypatch):
+    cursor = FakeCursor(rows=[(10,), (12,)])
+    monkeypatch.setattr(feedback_repo, "mydb", lambda: FakeConn(cursor))
+
+    ids = feedback_repo.get_patient_ids_with_feedback([10, 11, 12], date(2025, 1, 1))
+    assert ids == {10, 12}
+    assert cursor.params == ([10, 11, 12], date(2025, 1, 1))
+
+
+def test_get_patient_ids_with_feedback_empty():
+    assert feedback_repo.get_patient_ids_with_feedback([], date(2025, 1, 1)) == set()
@@ -130,11 +130,17 @@ def test_search_food_name_too_short(client):
     assert r.status_code == 400
 
 
+def test_search_food_invalid_paging(client):
+    assert client.get("/search_food?name=banana&limit=101").status_code == 400
+    assert client.get("/search_food?name=banana&offset=-1").status_code == 400
+    assert client.get("/search_food?name=banana&offset=1001").status_code == 400
+
+
 def test_search_food_not_found(client, monkeypatch):
     monkeypatch.setattr(
         food_bp.food_repo,
         "search_foods_by_keywords_locally",
-        lambda names: []
+        lambda names, **kw: []
     )
 
     r = client.get("/search_food?name=banana juice")
@@ -148,7 +154,7 @@ def test_search_food_success(client, monkeypatch):
     monkeypatch.setattr(
         food_bp.food_repo,
         "search_foods_by_keywords_locally",
-        lambda names: foods
+        lambda names, **kw: foods
     )
 
     r = client.get("/search_food?name=banana juice")
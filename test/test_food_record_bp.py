@@ -195,3 +195,33 @@ def test_update_food_record_success(client, monkeypatch):
     r = client.get("/update_food_record?id=3&notes=hello")
     assert r.status_code == 200
     assert r.get_json()["id"] == 3
+
+
+# ===============================================================
+# get_food_records_page
+# ===============================================================
+
+def test_get_food_records_page(client, monkeypatch):
+    calls = []
+
+    def fake_page(user_id, limit, after=None, start=None, end=None):
+        calls.append((user_id, limit, after, start, end))
+        return [DummyRecord(3)], (date(2025, 1, 2), dt_time(8), 3)
+
+    monkeypatch.setattr(bp.food_record_repo, "get_food_records_page", fake_page)
+
+    resp = client.get("/get_food_records_page?user_id=2&limit=1&start=2025-01-01")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["records"] == [{"id": 3}]
+    assert calls == [(2, 1, None, date(2025, 1, 1), None)]
+
+    # The cursor resumes right after the last record
+    resp = client.get(f"/get_food_records_page?user_id=2&limit=1&cursor={body['next_cursor']}")
+    assert calls[1][2] == (date(2025, 1, 2), dt_time(8), 3)
+
+
+@pytest.mark.parametrize("query", ["", "user_id=x", "user_id=2&limit=0", "user_id=2&cursor=bad"])
+def test_get_food_records_page_bad_args(client, query):
+    resp = client.get(f"/get_food_records_page?{query}")
+    assert resp.status_code == 400
@@ -233,3 +233,35 @@ def test_row_to_food_record(sample_row):
     assert record.food_id == 200
     assert record.amount_literal == "150g rice"
     assert record.status == "TAKEN"
+
+
+# --------------------------
+# KEYSET PAGE
+# --------------------------
+def test_get_food_records_page_has_more(monkeypatch, sample_row):
+    rows = [sample_row, sample_row[:4] + (None,) + sample_row[5:]]
+    fake_cursor = FakeCursor(rows=rows)
+    monkeypatch.setattr(food_record_repo, "mydb", lambda: FakeConn(fake_cursor))
+
+    after = (date(2025, 2, 1), None, 99)
+    records, next_key = food_record_repo.get_food_records_page(
+        10, 1, after=after, start=date(2025, 1, 1), end=date(2025, 1, 31))
+
+    assert len(records) == 1
+    assert next_key == (date(2025, 1, 1), time(12, 30), 1)
+    # Filters and the seek condition are in SQL; one extra row tells there is more
+    assert "eaten_date >= %s" in fake_cursor.last_query
+    assert "< (%s, %s, %s, %s)" in fake_cursor.last_query
+    assert fake_cursor.params == (
+        10, date(2025, 1, 1), date(2025, 1, 31), date(2025, 2, 1), True, time(0, 0), 99, 2)
+
+
+def test_get_food_records_page_last_page(monkeypatch, sample_row):
+    fake_cursor = FakeCursor(rows=[sample_row])
+    monkeypatch.setattr(food_record_repo, "mydb", lambda: FakeConn(fake_cursor))
+
+    records, next_key = food_record_repo.get_food_records_page(10, 5)
+
+    assert len(records) == 1 and next_key is None
+    assert fake_cursor.params == (10, 6)
+    assert "eaten_date >=" not in fake_cursor.last_query
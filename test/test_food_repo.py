@@ -149,4 +149,142 @@ def test_search_foods_by_keywords_locally_multiple_words():
 # ------------------------------------------------------------
 def test_get_foods_locally():
     food_repo.foods = [food_repo.food(1, 0, "A", 0, 0, 0, "x", "01", "2024", 1)]
-    assert len(food_repo.get_foods_locally()) == 1
\ No newline at end of file
+    assert len(food_repo.get_foods_locally()) == 1
+
+def test_search_foods_matches_substrings_and_short_keywords():
+    food_repo.foods = [
+        food_repo.food(1, 0, "Oatmeal, cooked", 0, 0, 0, "sr_legacy_food", "01", "2024", 1),
+        food_repo.food(2, 0, "Boat snack", 0, 0, 0, "branded_food", "01", "2024", 1),
+        food_repo.food(3, 0, "Rice", 0, 0, 0, "sr_legacy_food", "01", "2024", 1),
+    ]
+    assert [f.id for f in food_repo.search_foods_by_keywords_locally(["OAT"])] == [1, 2]
+    assert [f.id for f in food_repo.search_foods_by_keywords_locally(["ce"])] == [3]
+    assert food_repo.search_foods_by_keywords_locally(["oat", "rice"]) == []
+
+
+def test_search_foods_by_keywords_locally_limit_offset():
+    food_repo.foods = [
+        food_repo.food(i, 0, "Soup" + "x" * (i % 7), 0, 0, 0,
+                       "branded_food" if i % 3 == 0 else "sr_legacy_food", "01", "2024", 1)
+        for i in range(300)
+    ]
+    full = sorted(food_repo.foods, key=lambda x: (x.data_type == "branded_food", len(x.description)))
+
+    assert food_repo.search_foods_by_keywords_locally(["soup"]) == full[:100]
+    page = food_repo.search_foods_by_keywords_locally(["soup"], limit=25, offset=50)
+    assert page == full[50:75]
+    assert food_repo.search_foods_by_keywords_locally(["soup"], limit=10, offset=295) == full[295:]
+    assert food_repo.search_foods_by_keywords_locally([], limit=5, offset=10) == food_repo.foods[10:15]
+
+
+# ------------------------------------------------------------
+# FoodTable (columnar storage)
+# ------------------------------------------------------------
+def test_food_table_round_trip_with_nulls():
+    items = [
+        food_repo.food(5, 55, "Crème brûlée", 9.5, 20.0, 250.0, "branded_food", "Desserts", "2024-01-01", 3),
+        food_repo.food(7, None, None, None, None, None, None, None, None, None),
+    ]
+    table = food_repo.FoodTable.from_foods(items)
+    assert len(table) == 2
+    assert list(table) == items
+    assert table[-1] == items[1]
+    assert table[0:1] == items[:1]
+    with pytest.raises(IndexError):
+        table[2]
+
+
+def test_food_table_interns_repeated_strings():
+    table = food_repo.FoodTable.from_foods(
+        food_repo.food(i, i, f"F{i}", 0, 0, 0, "branded_food", "Snacks", "2024", 1) for i in range(50)
+    )
+    assert table.data_type.values == ["branded_food"]
+    assert table.food_category_id.values == ["Snacks"]
+
+
+def test_food_table_position_of_sorted_and_unsorted():
+    sorted_table = food_repo.FoodTable.from_foods(
+        food_repo.food(i, 0, "x", 0, 0, 0, "x", "01", "2024", 1) for i in (1, 4, 9)
+    )
+    assert sorted_table.position_of(4) == 1
+    assert sorted_table.position_of(5) is None
+
+    unsorted_table = food_repo.FoodTable.from_foods(
+        food_repo.food(i, 0, "x", 0, 0, 0, "x", "01", "2024", 1) for i in (9, 1, 4)
+    )
+    assert unsorted_table.position_of(4) == 2
+    assert unsorted_table.position_of(5) is None
+
+
+def test_food_table_filter_positions():
+    table = food_repo.FoodTable.from_foods([
+        food_repo.food(1, 0, "a", 1.0, 10.0, 100.0, "x", "01", "2024", 1),
+        food_repo.food(2, 0, "b", 5.0, 10.0, 300.0, "x", "01", "2024", 1),
+        food_repo.food(3, 0, "c", 1.0, 50.0, 90.0, "x", "01", "2024", 1),
+        food_repo.food(4, 0, "d", None, None, None, "x", "01", "2024", 1),
+    ])
+    assert table.filter_positions(max_calories=200) == [0, 2]
+    assert table.filter_positions(max_calories=200, max_carbonhydrate=20) == [0]
+    assert table.filter_positions() == [0, 1, 2, 3]
+
+
+def test_get_foods_builds_table(mock_mydb):
+    res = food_repo.get_foods()
+    assert isinstance(res, food_repo.FoodTable)
+    assert food_repo.get_food_by_id_locally(1).description == "Apple"
+    assert food_repo.get_foods_by_ids_locally([1, 1, 2])[0].fdc_id == 111
+
+
+def test_foods_snapshot_round_trip(tmp_path):
+    food_repo._publish(food_repo.FoodCatalogue(food_repo.FoodTable.from_foods([
+        food_repo.food(1, 11, "Apple Juice", 0.1, 11.0, 46.0, "branded_food", "01", "2024", 1),
+        food_repo.food(2, None, None, None, None, None, "sr_legacy_food", None, "2023", None),
+        food_repo.food(5, 55, "Apple, raw", 0.2, 14.0, 52.0, "sr_legacy_food", "09", "2024", 9),
+    ]), version=(3, 5)))
+    expected = list(food_repo.get_foods_locally())
+    path = str(tmp_path / "foods.snap")
+    food_repo.save_foods_snapshot(path)
+
+    food_repo.foods = []
+    assert food_repo.load_foods_snapshot(path)
+
+    assert list(food_repo.foods) == expected
+    assert food_repo.loaded_foods_version() == (3, 5)
+    assert food_repo.get_food_by_id_locally(5).description == "Apple, raw"
+    assert [f.id for f in food_repo.search_foods_by_keywords_locally(["apple"])] == [5, 1]
+    assert food_repo.foods.filter_positions(max_calories=50) == [0]
+
+
+def test_load_foods_snapshot_missing_file(tmp_path):
+    assert food_repo.load_foods_snapshot(str(tmp_path / "none.snap")) is False
+
+
+def test_load_foods_since_extends_snapshot_backed_table(tmp_path, monkeypatch):
+    food_repo.foods = [
+        food_repo.food(1, 11, "Apple Juice", 0.1, 11.0, 46.0, "branded_food", "01", "2024", 1),
+        food_repo.food(3, 33, "Banana", 0.3, 23.0, 89.0, "sr_legacy_food", "09", "2024", 9),
+    ]
+    food_repo._publish(food_repo.FoodCatalogue(food_repo.get_foods_locally(), version=(2, 3)))
+    path = str(tmp_path / "foods.snap")
+    food_repo.save_foods_snapshot(path)
+    assert food_repo.load_foods_snapshot(path)  # read-only, memoryview columns
+    before = food_repo._current()
+
+    class Cursor(FakeCursor):
+        def execute(self, sql, params=None):
+            self.params = params
+
+    columns = [(c,) for c in food_repo.FOOD_COLUMNS]
+    rows = [(7, 77, "Apple Pie", 11.0, 34.0, 237.0, "survey_fndds_food", "18", "2024", 18)]
+    monkeypatch.setattr(food_repo, "mydb", lambda: FakeConn(Cursor(columns, rows)))
+
+    assert food_repo.load_foods_since(3) == 1
+    assert food_repo.loaded_foods_version() == (3, 7)
+    assert [f.id for f in food_repo.get_foods_locally()] == [1, 3, 7]
+    assert food_repo.get_food_by_id_locally(7).description == "Apple Pie"
+    assert [f.id for f in food_repo.search_foods_by_keywords_locally(["apple"])] == [7, 1]
+    assert food_repo.get_foods_locally().data_type.values[-1] == "survey_fndds_food"
+
+    # The previous generation still reads as before
+    assert len(before.table) == 2
+    assert before.search_index.search(["pie"]) == []
@@ -0,0 +1,41 @@
+import pytest
+from datetime import date, time
+
+from utils import keyset
+
+
+def test_cursor_round_trip():
+    k = keyset.key(date(2025, 1, 2), time(8, 30, 15), 123)
+    cursor = keyset.encode_cursor(k)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert keyset.decode_cursor(cursor) == k
+
+
+def test_null_time_round_trips_and_seeks_first():
+    k = keyset.key(date(2025, 1, 2), None, 5)
+    assert keyset.decode_cursor(keyset.encode_cursor(k)) == k
+    # time IS NULL sorts after false, so untimed records lead a descending day
+    assert keyset.seek_params(k) == (date(2025, 1, 2), True, time(0, 0), 5)
+    assert keyset.seek_params((date(2025, 1, 2), time(8), 6)) == (date(2025, 1, 2), False, time(8), 6)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90LWEta2V5", keyset.encode_cursor(
+    (date(2025, 1, 2), time(8), 1)) + "x"])
+def test_decode_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        keyset.decode_cursor(cursor)
+
+
+def test_parse_page_args():
+    cursor = keyset.encode_cursor((date(2025, 1, 2), time(8), 7))
+    assert keyset.parse_page_args({}) == (keyset.DEFAULT_LIMIT, None, None, None)
+    assert keyset.parse_page_args(
+        {"limit": "10", "cursor": cursor, "start": "2025-01-01", "end": "2025-01-31"}
+    ) == (10, (date(2025, 1, 2), time(8), 7), date(2025, 1, 1), date(2025, 1, 31))
+
+
+@pytest.mark.parametrize("args", [{"limit": "x"}, {"limit": "0"}, {"limit": "1000"},
+                                  {"cursor": "junk"}, {"start": "2025-13-01"}])
+def test_parse_page_args_rejects(args):
+    with pytest.raises(ValueError):
+        keyset.parse_page_args(args)
@@ -0,0 +1,138 @@
+import psycopg
+import pytest
+
+from utils import leader
+
+
+class Result:
+    def __init__(self, row):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    def __init__(self, lock_free=True):
+        self.autocommit = False
+        self.lock_free = lock_free
+        self.executed = []
+        self.broken = False
+        self.closed = False
+
+    def execute(self, query, params=None):
+        if self.broken:
+            raise psycopg.OperationalError("connection lost")
+        self.executed.append((query, params))
+        if "pg_try_advisory_lock" in query:
+            return Result((self.lock_free,))
+        return Result((1,))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def conns(monkeypatch):
+    state = {"opened": [], "lock_free": True}
+
+    def connect():
+        conn = FakeConn(lock_free=state["lock_free"])
+        state["opened"].append(conn)
+        return conn
+
+    monkeypatch.setattr(leader.config, "mydb_direct", connect)
+    return state
+
+
+def test_first_renew_takes_the_lock(conns):
+    lock = leader.LeaderLock("job")
+    assert lock.renew() is True
+    assert lock.is_leader
+
+    [conn] = conns["opened"]
+    assert conn.autocommit
+    assert conn.executed == [("SELECT pg_try_advisory_lock(%s)", (lock.key,))]
+
+
+def test_leader_renews_on_the_same_connection(conns):
+    lock = leader.LeaderLock("job")
+    lock.renew()
+    assert lock.renew() is True
+
+    [conn] = conns["opened"]
+    assert conn.executed[-1] == ("SELECT 1", None)
+
+
+def test_follower_keeps_trying(conns):
+    conns["lock_free"] = False
+    lock = leader.LeaderLock("job")
+    assert lock.renew() is False
+    assert not lock.is_leader
+
+    conns["opened"][0].lock_free = True     # the leader went away
+    assert lock.renew() is True
+    assert len(conns["opened"]) == 1
+
+
+def test_lost_connection_steps_down_then_reacquires(conns):
+    lock = leader.LeaderLock("job")
+    lock.renew()
+    conns["opened"][0].broken = True
+
+    assert lock.renew() is False
+    assert not lock.is_leader
+    assert conns["opened"][0].closed
+
+    assert lock.renew() is True
+    assert len(conns["opened"]) == 2
+
+
+def test_release_closes_the_session(conns):
+    lock = leader.LeaderLock("job")
+    lock.renew()
+    lock.release()
+    assert conns["opened"][0].closed
+    assert not lock.is_leader
+
+
+def test_disabled_lock_always_leads(monkeypatch):
+    monkeypatch.setattr(leader.config, "mydb_direct", lambda: pytest.fail("no connection expected"))
+    lock = leader.LeaderLock("job", enabled=False)
+    assert lock.renew() is True
+    assert lock.is_leader
+
+
+def test_lock_key_is_stable_per_name():
+    assert leader.LeaderLock("job").key == leader.LeaderLock("job").key
+    assert leader.LeaderLock("job").key != leader.LeaderLock("other").key
+
+
+def test_tick_stats_counts_overruns():
+    ticks = iter([0.0, 2.0, 10.0, 25.0])
+    stats = leader.TickStats("job", interval=10, clock=lambda: next(ticks))
+
+    with stats.timed():
+        pass
+    with stats.timed():
+        pass
+    stats.skip()
+
+    assert stats.as_dict() == {
+        "runs": 2,
+        "skipped": 1,
+        "overruns": 1,
+        "last_ms": 15000.0,
+        "max_ms": 15000.0,
+        "avg_ms": 8500.0,
+    }
+
+
+def test_tick_stats_records_failed_runs():
+    ticks = iter([0.0, 1.0])
+    stats = leader.TickStats("job", interval=10, clock=lambda: next(ticks))
+
+    with pytest.raises(RuntimeError):
+        with stats.timed():
+            raise RuntimeError("tick failed")
+    assert stats.runs == 1
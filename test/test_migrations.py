@@ -0,0 +1,112 @@
+import pytest
+
+from utils import migrations
+from utils.migrations import Migration
+
+
+# ---------- Fake connection ----------
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if query == "FAIL":
+            raise RuntimeError("boom")
+        self.conn.log.append((query, params, self.conn.autocommit))
+        if query.startswith("SELECT version"):
+            self.rows = [(v,) for v in sorted(self.conn.applied)]
+        if query.startswith("INSERT INTO schema_migrations"):
+            self.conn.pending_insert = params[0]
+            if self.conn.autocommit:
+                self.conn.commit()
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, applied=()):
+        self.applied = set(applied)
+        self.autocommit = False
+        self.log = []
+        self.pending_insert = None
+        self.rolled_back = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.pending_insert is not None:
+            self.applied.add(self.pending_insert)
+            self.pending_insert = None
+
+    def rollback(self):
+        self.pending_insert = None
+        self.rolled_back = True
+
+
+def statements(conn):
+    return [q for q, _, _ in conn.log if not q.startswith(("CREATE TABLE", "SELECT", "INSERT"))]
+
+
+MIGS = [
+    Migration(2, "second", ("STEP 2",)),
+    Migration(1, "first", ("STEP 1a", "STEP 1b"), transactional=False),
+]
+
+
+def test_migrate_applies_pending_in_version_order():
+    conn = FakeConn()
+    assert migrations.migrate(conn, MIGS) == [1, 2]
+    assert statements(conn) == ["STEP 1a", "STEP 1b", "STEP 2"]
+    assert conn.applied == {1, 2}
+
+    # Non-transactional migrations run in autocommit, the others do not
+    autocommit = {q: a for q, _, a in conn.log}
+    assert autocommit["STEP 1a"] is True and autocommit["STEP 2"] is False
+    assert conn.autocommit is False
+
+
+def test_migrate_skips_applied_versions():
+    conn = FakeConn(applied={1})
+    assert migrations.migrate(conn, MIGS) == [2]
+    assert statements(conn) == ["STEP 2"]
+
+
+def test_failed_migration_is_not_recorded():
+    conn = FakeConn()
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn, [Migration(1, "bad", ("STEP", "FAIL"))])
+    assert conn.applied == set()
+    assert conn.rolled_back
+
+
+def test_shipped_migrations_are_well_formed():
+    versions = [m.version for m in migrations.MIGRATIONS]
+    assert versions == sorted(set(versions))
+    for m in migrations.MIGRATIONS:
+        concurrent = any("CONCURRENTLY" in s for s in m.statements)
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        assert not (concurrent and m.transactional)
+
+
+def test_duplicate_doses_are_saved_before_the_unique_index():
+    by_name = {m.name: m for m in migrations.MIGRATIONS}
+    dedupe = by_name["remove duplicate drug_records doses"]
+    index = by_name["one drug_records row per planned dose"]
+
+    # All or nothing, and before the index that needs it
+    assert dedupe.transactional
+    assert dedupe.version < index.version
+    create, delete = dedupe.statements
+    assert "CREATE TABLE IF NOT EXISTS drug_records_duplicates" in create
+    assert "INSERT INTO drug_records_duplicates" in delete
+    assert not any("DELETE" in s for s in index.statements)
@@ -2,6 +2,7 @@ import pytest
 from datetime import datetime as real_datetime, date, time as dt_time, timedelta
 
 import pagelogic.service.notify_service as svc
+from utils.emailsender import LocalTransport, Mailer
 
 
 # =========================
@@ -21,39 +22,6 @@ def scheduled_dose():
     )
 
 
-@pytest.fixture
-def completed_record():
-    class Rec:
-        pass
-    r = Rec()
-    r.user_id = 1
-    r.plan_item_id = 10
-    r.expected_date = date(2025, 1, 1)
-    r.expected_time = dt_time(9, 0)
-    return r
-
-
-# =========================
-# find_missed_doses
-# =========================
-
-def test_find_missed_doses_all_missed(scheduled_dose):
-    missed = svc.find_missed_doses(
-        scheduled=[scheduled_dose],
-        recent_records=[],
-    )
-    assert len(missed) == 1
-    assert missed[0].plan_item_id == 10
-
-
-def test_find_missed_doses_none_missed(scheduled_dose, completed_record):
-    missed = svc.find_missed_doses(
-        scheduled=[scheduled_dose],
-        recent_records=[completed_record],
-    )
-    assert missed == []
-
-
 # =========================
 # build_email_body
 # =========================
@@ -81,274 +49,505 @@ def test_build_email_body_default_time():
     assert "2025-01-02 09:00" in body
 
 
+def test_build_email_body_digest(scheduled_dose):
+    evening = svc.ScheduledDose(
+        user_id=1, plan_item_id=11, expected_date=date(2025, 1, 1),
+        expected_time=dt_time(21, 0), drug_name="Metformin", dosage=500, unit="mg",
+    )
+    body = svc.build_email_body([evening, scheduled_dose], "Alice")
+    assert "You have 2 doses due" in body
+    assert body.index("2025-01-01 09:00  Aspirin (Dosage: 100 mg)") < body.index(
+        "2025-01-01 21:00  Metformin (Dosage: 500 mg)"
+    )
+
+
+def test_build_email_body_single_item_list(scheduled_dose):
+    assert svc.build_email_body([scheduled_dose], "Alice") == svc.build_email_body(
+        scheduled_dose, "Alice"
+    )
+
+
 # =========================
-# send_notifications
+# enqueue_reminders
 # =========================
 
-def test_send_notifications_no_missed():
-    svc.send_notifications([], interval=60, now=real_datetime(2025, 1, 1, 9, 0))
+class FakeUser:
+    def __init__(self, uid, email=None):
+        self.id = uid
+        self.email = email if email is not None else f"u{uid}@test.com"
+        self.username = f"User{uid}"
 
 
-def test_send_notifications_config_missing(monkeypatch, scheduled_dose):
-    # 1. No users found
-    monkeypatch.setattr(
-        svc.user_repo,
-        "get_users_by_ids",
-        lambda ids: [],
-    )
-    # 2. No config found
+class FakeNotifyCfg:
+    def __init__(self, minutes, enabled=True):
+        self.enabled = enabled
+        self.email_enabled = True
+        self.notify_minutes = minutes
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """In-memory reminder_outbox: what was queued and how each row ended."""
+    state = {"queued": [], "sent": [], "skipped": [], "released": [], "batches": []}
+
+    def fake_enqueue(entries, now):
+        entries = list(entries)
+        state["queued"].extend(entries)
+        return len(entries)
+
+    def fake_claim(now, limit, lease_seconds, max_attempts):
+        return state["batches"].pop(0) if state["batches"] else []
+
+    monkeypatch.setattr(svc.reminder_outbox_repo, "enqueue", fake_enqueue)
+    monkeypatch.setattr(svc.reminder_outbox_repo, "claim_batch", fake_claim)
+    monkeypatch.setattr(svc.reminder_outbox_repo, "mark_sent",
+                        lambda ids, now: state["sent"].extend(ids))
+    monkeypatch.setattr(svc.reminder_outbox_repo, "mark_skipped",
+                        lambda ids, now, reason: state["skipped"].extend(ids))
+    monkeypatch.setattr(svc.reminder_outbox_repo, "release_failed",
+                        lambda ids, retry_at, error, max_attempts:
+                        state["released"].append((list(ids), retry_at)))
+    return state
+
+
+def test_enqueue_reminders_no_missed(outbox):
+    now = real_datetime(2025, 1, 1, 9, 0)
+    assert svc.enqueue_reminders([], now - timedelta(minutes=1), now, now) == 0
+    assert outbox["queued"] == []
+
+
+@pytest.mark.parametrize("configs", [{}, {1: FakeNotifyCfg([0], enabled=False)}])
+def test_enqueue_reminders_config_missing_or_disabled(monkeypatch, scheduled_dose, outbox, configs):
     monkeypatch.setattr(
         svc.user_notification_repo,
         "get_notification_configs_by_user_ids",
-        lambda ids: {},
+        lambda ids: configs,
     )
 
-    called = {"send": False}
+    now = real_datetime(2025, 1, 1, 9, 0)
+    svc.enqueue_reminders([scheduled_dose], now - timedelta(minutes=1), now, now)
+    assert outbox["queued"] == []
 
-    def fake_send(email, subject, body):
-        called["send"] = True
 
-    monkeypatch.setattr(svc, "send_email_ses", fake_send)
-
-    svc.send_notifications([scheduled_dose], interval=60, now=real_datetime(2025, 1, 1, 9, 0))
-    assert called["send"] is False
+def test_enqueue_reminders_no_offset_match(monkeypatch, scheduled_dose, outbox):
+    monkeypatch.setattr(
+        svc.user_notification_repo,
+        "get_notification_configs_by_user_ids",
+        lambda ids: {1: FakeNotifyCfg([60])},
+    )
 
+    # scheduled at 9:00, notify at +60 => 10:00, far from 9:00
+    now = real_datetime(2025, 1, 1, 9, 0)
+    svc.enqueue_reminders([scheduled_dose], now - timedelta(minutes=1), now, now)
+    assert outbox["queued"] == []
 
-def test_send_notifications_disabled(monkeypatch, scheduled_dose):
-    class FakeUser:
-        def __init__(self, uid):
-            self.id = uid
-            self.email = "a@test.com"
-            self.username = "Alice"
 
+def test_enqueue_reminders_records_offset(monkeypatch, scheduled_dose, outbox):
     monkeypatch.setattr(
-        svc.user_repo,
-        "get_users_by_ids",
-        lambda ids: [FakeUser(1)],
+        svc.user_notification_repo,
+        "get_notification_configs_by_user_ids",
+        lambda ids: {1: FakeNotifyCfg([-15, 30])},
     )
 
-    class FakeCfg:
-        def __init__(self):
-            self.enabled = False         # disabled
-            self.email_enabled = True
-            self.notify_minutes = [0]
+    # scheduled at 9:00, notify at +30 => 9:30, the end of the window
+    now = real_datetime(2025, 1, 1, 9, 30)
+    assert svc.enqueue_reminders([scheduled_dose], now - timedelta(minutes=5), now, now) == 1
+
+    [entry] = outbox["queued"]
+    assert (entry.user_id, entry.plan_item_id, entry.notify_offset) == (1, 10, 30)
+    assert entry.trigger_at == real_datetime(2025, 1, 1, 9, 30)
+    assert entry.drug_name == "Aspirin"
+
 
+def test_enqueue_reminders_window_excludes_its_start(monkeypatch, scheduled_dose, outbox):
     monkeypatch.setattr(
         svc.user_notification_repo,
         "get_notification_configs_by_user_ids",
-        lambda ids: {1: FakeCfg()},
+        lambda ids: {1: FakeNotifyCfg([0])},
     )
 
-    called = {"send": False}
+    # The 9:00 trigger belonged to the previous window (8:55, 9:00]
+    start = real_datetime(2025, 1, 1, 9, 0)
+    svc.enqueue_reminders([scheduled_dose], start, start + timedelta(minutes=5), start)
+    assert outbox["queued"] == []
 
-    monkeypatch.setattr(svc, "send_email_ses", lambda email, subject, body: called.update(send=True))
 
-    svc.send_notifications([scheduled_dose], interval=60, now=real_datetime(2025, 1, 1, 9, 0))
-    assert called["send"] is False
+# =========================
+# send_notifications / dispatch_reminders
+# =========================
 
+@pytest.fixture
+def mailer(monkeypatch):
+    m = Mailer(LocalTransport(), max_workers=2, rate_per_second=0)
+    monkeypatch.setattr(svc, "get_mailer", lambda: m)
+    yield m
+    m.shutdown()
 
-def test_send_notifications_no_offset_match(monkeypatch, scheduled_dose):
-    class FakeUser:
-        def __init__(self, uid):
-            self.id = uid
-            self.email = "a@test.com"
-            self.username = "Alice"
 
+@pytest.fixture
+def users(monkeypatch):
+    state = {"users": [FakeUser(1), FakeUser(2)], "taken": set()}
     monkeypatch.setattr(
         svc.user_repo,
         "get_users_by_ids",
-        lambda ids: [FakeUser(1)],
+        lambda ids: [u for u in state["users"] if u.id in ids],
     )
+    monkeypatch.setattr(
+        svc.drug_record_repo,
+        "get_taken_dose_keys",
+        lambda user_ids, from_date, to_date: state["taken"],
+    )
+    return state
 
-    class FakeCfg:
-        def __init__(self):
-            self.enabled = True
-            self.email_enabled = True
-            self.notify_minutes = [300]  # too far
 
-    monkeypatch.setattr(
-        svc.user_notification_repo,
-        "get_notification_configs_by_user_ids",
-        lambda ids: {1: FakeCfg()},
+def make_entry(entry_id, user_id, plan_item_id, hour, drug, offset=0, attempts=1):
+    return svc.reminder_outbox_repo.outbox_entry(
+        id=entry_id, user_id=user_id, plan_item_id=plan_item_id,
+        expected_date=date(2025, 1, 1), expected_time=dt_time(hour, 0),
+        notify_offset=offset, trigger_at=real_datetime(2025, 1, 1, hour, 0) + timedelta(minutes=offset),
+        drug_name=drug, dosage=100, unit="mg", attempts=attempts,
     )
 
-    now = real_datetime(2025, 1, 1, 0, 0, 0)
 
-    called = {"send": False}
-    monkeypatch.setattr(svc, "send_email_ses", lambda e, s, b: called.update(send=True))
+NOW = real_datetime(2025, 1, 1, 9, 0, 10)
 
-    svc.send_notifications([scheduled_dose], interval=60, now=now)
-    assert called["send"] is False
 
+def test_send_notifications_nothing_claimed(outbox, mailer):
+    assert svc.send_notifications([], NOW) == 0
+    assert mailer.transport.outbox == []
 
-def test_send_notifications_send_once(monkeypatch, scheduled_dose):
-    class FakeUser:
-        def __init__(self, uid):
-            self.id = uid
-            self.email = "a@test.com"
-            self.username = "Alice"
 
-    monkeypatch.setattr(
-        svc.user_repo,
-        "get_users_by_ids",
-        lambda ids: [FakeUser(1)],
-    )
+def test_send_notifications_digest_per_user(outbox, users, mailer):
+    entries = [
+        make_entry(1, 1, 10, 9, "Aspirin"),
+        make_entry(2, 1, 11, 9, "Metformin"),
+        make_entry(3, 2, 20, 9, "Insulin"),
+    ]
 
-    class FakeCfg:
-        def __init__(self):
-            self.enabled = True
-            self.email_enabled = True
-            self.notify_minutes = [30]
+    assert svc.send_notifications(entries, NOW) == 2
 
-    monkeypatch.setattr(
-        svc.user_notification_repo,
-        "get_notification_configs_by_user_ids",
-        lambda ids: {1: FakeCfg()},
-    )
+    sent = {m.to: m for m in mailer.transport.outbox}
+    assert set(sent) == {"u1@test.com", "u2@test.com"}
+    assert sent["u1@test.com"].subject == "DineDose Medication Reminder (2 doses)"
+    assert "Aspirin" in sent["u1@test.com"].html_body
+    assert "Metformin" in sent["u1@test.com"].html_body
+    assert sent["u2@test.com"].subject == "DineDose Medication Reminder"
+    assert "Insulin" in sent["u2@test.com"].html_body
+    assert sorted(outbox["sent"]) == [1, 2, 3]
+
+
+def test_send_notifications_same_dose_two_offsets_listed_once(outbox, users, mailer):
+    entries = [make_entry(1, 1, 10, 9, "Aspirin", offset=0), make_entry(2, 1, 10, 9, "Aspirin", offset=-5)]
+
+    svc.send_notifications(entries, NOW)
+
+    [sent] = mailer.transport.outbox
+    assert sent.subject == "DineDose Medication Reminder"
+    assert sorted(outbox["sent"]) == [1, 2]
 
-    # scheduled at 9:00, notify at +30 => 9:30
-    now = real_datetime(2025, 1, 1, 9, 29, 40)
-    sent = {}
 
-    def fake_send(email, subject, body):
-        sent["email"] = email
-        sent["subject"] = subject
-        sent["body"] = body
+def test_send_notifications_skips_taken_and_no_email(outbox, users, mailer):
+    users["users"] = [FakeUser(1), FakeUser(2, email="")]
+    users["taken"] = {(1, 10, date(2025, 1, 1), dt_time(9, 0))}
+    entries = [make_entry(1, 1, 10, 9, "Aspirin"), make_entry(2, 2, 20, 9, "Insulin")]
 
-    monkeypatch.setattr(svc, "send_email_ses", fake_send)
+    assert svc.send_notifications(entries, NOW) == 0
 
-    svc.send_notifications([scheduled_dose], interval=60, now=now)
+    assert mailer.transport.outbox == []
+    assert sorted(outbox["skipped"]) == [1, 2]
+    assert outbox["sent"] == []
 
-    assert sent["email"] == "a@test.com"
-    assert "Aspirin" in sent["body"]
-    assert "DineDose Medication Reminder" in sent["subject"]
+
+def test_send_notifications_releases_failed_for_retry(monkeypatch, outbox, users, mailer):
+    monkeypatch.setattr(mailer.transport, "send", lambda message: False)
+    monkeypatch.setattr(svc.config, "OUTBOX_RETRY_SECONDS", 60)
+
+    svc.send_notifications([make_entry(1, 1, 10, 9, "Aspirin", attempts=2)], NOW)
+
+    assert outbox["released"] == [([1], NOW + timedelta(seconds=120))]
+    assert outbox["sent"] == []
+
+
+def test_dispatch_reminders_drains_full_batches(monkeypatch, outbox, users, mailer):
+    monkeypatch.setattr(svc, "get_now", lambda: NOW)
+    outbox["batches"] = [
+        [make_entry(1, 1, 10, 9, "Aspirin"), make_entry(2, 2, 20, 9, "Insulin")],
+        [make_entry(3, 1, 11, 9, "Metformin")],
+        [make_entry(4, 2, 21, 9, "never claimed")],
+    ]
+
+    assert svc.dispatch_reminders(batch_size=2) == 3
+    assert sorted(outbox["sent"]) == [1, 2, 3]
+    assert len(outbox["batches"]) == 1
 
 
 # =========================
 # notify_jobs
 # =========================
 
-def test_notify_jobs_happy_path(monkeypatch, scheduled_dose):
-    fake_now = real_datetime(2025, 1, 1, 9, 0)
-
-    monkeypatch.setattr(
-        svc,
-        "get_now",
-        lambda: fake_now,
+@pytest.fixture
+def tick(monkeypatch):
+    """notify_jobs around a fake index, watermark and outbox."""
+    state = {
+        "now": real_datetime(2025, 1, 1, 9, 0),
+        "watermark": None,
+        "due": [],
+        "reached": None,            # default: the whole window
+        "pops": [],
+        "enqueued": [],
+        "watermarks": [],
+        "taken": set(),
+    }
+
+    class FakeIndex:
+        def pop_due(self, start, end, limit=None):
+            state["pops"].append((start, end, limit))
+            return state["due"], state["reached"] or end
+
+    def fake_enqueue(missed, start, end, now):
+        state["enqueued"].append(([d.plan_item_id for d in missed], start, end, now))
+        return len(missed)
+
+    monkeypatch.setattr(svc, "get_now", lambda: state["now"])
+    monkeypatch.setattr(svc, "get_reminder_index", lambda days: FakeIndex())
+    monkeypatch.setattr(svc, "enqueue_reminders", fake_enqueue)
+    monkeypatch.setattr(svc.scheduler_repo, "get_watermark", lambda job: state["watermark"])
+    monkeypatch.setattr(svc.scheduler_repo, "set_watermark",
+                        lambda job, until: state["watermarks"].append((job, until)))
+    monkeypatch.setattr(svc.drug_record_repo, "get_taken_dose_keys",
+                        lambda user_ids, from_date, to_date: state["taken"])
+    monkeypatch.setattr(svc.config, "NOTIFY_MAX_PER_TICK", 100)
+    monkeypatch.setattr(svc.config, "NOTIFY_MAX_CATCHUP_SECONDS", 3600)
+    return state
+
+
+def test_notify_jobs_happy_path(tick, scheduled_dose):
+    taken = svc.ScheduledDose(
+        user_id=1, plan_item_id=11, expected_date=date(2025, 1, 1),
+        expected_time=dt_time(9, 0), drug_name="B", dosage=1, unit="mg",
     )
+    tick["watermark"] = real_datetime(2025, 1, 1, 8, 55)
+    tick["due"] = [scheduled_dose, taken]
+    tick["taken"] = {(1, 11, date(2025, 1, 1), dt_time(9, 0))}
 
-    monkeypatch.setattr(
-        svc,
-        "get_scheduled_doses_within",
-        lambda days, now: [scheduled_dose],
-    )
+    svc.notify_jobs(days=3, interval=300)
 
-    monkeypatch.setattr(
-        svc.drug_record_repo,
-        "get_recent_completed_drug_records",
-        lambda days, now: [],
-    )
+    window = (real_datetime(2025, 1, 1, 8, 55), tick["now"])
+    assert tick["pops"] == [window + (100,)]
+    assert tick["enqueued"] == [([10], *window, tick["now"])]
+    assert tick["watermarks"] == [(svc.NOTIFY_JOB, tick["now"])]
 
-    monkeypatch.setattr(
-        svc,
-        "find_missed_doses",
-        lambda scheduled, recent: [scheduled_dose],
-    )
 
-    called = {"missed": None, "interval": None, "now": None}
+def test_notify_jobs_late_tick_covers_the_gap(tick):
+    # The previous tick ran at 8:50; this one started 5 minutes late
+    tick["watermark"] = real_datetime(2025, 1, 1, 8, 50)
+    tick["now"] = real_datetime(2025, 1, 1, 9, 0, 7)
 
-    def fake_send_notifications(missed, interval, now):
-        called["missed"] = missed
-        called["interval"] = interval
-        called["now"] = now
+    svc.notify_jobs(days=1, interval=300)
+
+    assert tick["pops"][0][:2] == (real_datetime(2025, 1, 1, 8, 50), tick["now"])
+    assert tick["watermarks"] == [(svc.NOTIFY_JOB, tick["now"])]
+
+
+def test_notify_jobs_first_run_looks_back_one_interval(tick):
+    svc.notify_jobs(days=1, interval=300)
+    assert tick["pops"][0][:2] == (real_datetime(2025, 1, 1, 8, 55), tick["now"])
+
+
+def test_notify_jobs_caps_catch_up_after_downtime(tick):
+    tick["watermark"] = real_datetime(2024, 12, 30, 9, 0)
+
+    svc.notify_jobs(days=1, interval=300)
+
+    assert tick["pops"][0][:2] == (real_datetime(2025, 1, 1, 8, 0), tick["now"])
 
-    monkeypatch.setattr(
-        svc,
-        "send_notifications",
-        fake_send_notifications,
-    )
 
-    svc.notify_jobs(days=3, interval=120)
+def test_notify_jobs_capped_tick_leaves_the_rest(tick, scheduled_dose):
+    tick["watermark"] = real_datetime(2025, 1, 1, 8, 0)
+    tick["due"] = [scheduled_dose]
+    tick["reached"] = real_datetime(2025, 1, 1, 8, 30)
 
-    assert called["missed"][0].plan_item_id == 10
-    assert called["interval"] == 120
-    assert called["now"] == fake_now
+    svc.notify_jobs(days=1, interval=300)
+
+    assert tick["enqueued"][0][1:3] == (real_datetime(2025, 1, 1, 8, 0), tick["reached"])
+    assert tick["watermarks"] == [(svc.NOTIFY_JOB, tick["reached"])]
+
+
+def test_notify_jobs_failed_enqueue_keeps_watermark(monkeypatch, tick, scheduled_dose):
+    tick["due"] = [scheduled_dose]
+
+    def broken(*args):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(svc, "enqueue_reminders", broken)
+
+    with pytest.raises(RuntimeError):
+        svc.notify_jobs(days=1, interval=300)
+    assert tick["watermarks"] == []
 
 
 # =========================
-# get_scheduled_doses_within
+# ReminderIndex
 # =========================
 
-def test_get_scheduled_doses_within_basic(monkeypatch):
-    now = real_datetime(2025, 1, 1, 0, 0)
+class FakeCfg:
+    def __init__(self, minutes, enabled=True):
+        self.enabled = enabled
+        self.email_enabled = True
+        self.notify_minutes = minutes
 
-    class FakeUser:
-        def __init__(self, uid):
-            self.id = uid
 
-    monkeypatch.setattr(
-        svc.user_repo,
-        "get_all_users",
-        lambda: [FakeUser(1)],
-    )
+class FakeItem:
+    def __init__(self, item_id, d, t):
+        self.id = item_id
+        self.date = d
+        self.time = t
+        self.drug_name = "Aspirin"
+        self.dosage = 50
+        self.unit = "mg"
 
-    monkeypatch.setattr(
-        svc.plan_repo,
-        "get_plans_by_user_ids",
-        lambda user_ids: {1: "exists"},
-    )
 
-    class FakePlanItem:
-        def __init__(self):
-            self.id = 10
-            self.date = date(2025, 1, 1)
-            self.time = dt_time(9, 0)
-            self.drug_name = "Aspirin"
-            self.dosage = 50
-            self.unit = "mg"
+class FakePlan:
+    def __init__(self, items):
+        self.plan_items = items
+
 
-    class FakePlan:
-        def __init__(self):
-            self.plan_items = [FakePlanItem()]
+@pytest.fixture
+def reminder_db(monkeypatch):
+    """Plans and configs the index expands, keyed by user id."""
+    state = {"plans": {}, "configs": {}, "loads": []}
+
+    def fake_plans(from_when, to_when, user_ids=None):
+        state["loads"].append(user_ids)
+        return {uid: p for uid, p in state["plans"].items()
+                if user_ids is None or uid in user_ids}
 
+    monkeypatch.setattr(svc.plan_service, "get_all_user_plans", fake_plans)
     monkeypatch.setattr(
-        svc.plan_service,
-        "get_user_plan",
-        lambda id, from_when, to_when: FakePlan(),
+        svc.user_notification_repo,
+        "get_notification_configs_by_user_ids",
+        lambda ids: {uid: state["configs"][uid] for uid in ids if uid in state["configs"]},
     )
+    return state
 
-    doses = svc.get_scheduled_doses_within(days=1, now=now)
-    assert len(doses) == 1
-    d = doses[0]
-    assert isinstance(d, svc.ScheduledDose)
-    assert d.user_id == 1
-    assert d.plan_item_id == 10
 
+def at(hour, minute, day=1):
+    return real_datetime(2025, 1, day, hour, minute)
 
-def test_get_scheduled_doses_within_no_plan(monkeypatch):
-    now = real_datetime(2025, 1, 1, 0, 0)
 
-    class FakeUser:
-        def __init__(self, uid):
-            self.id = uid
+def test_reminder_index_pops_only_due(reminder_db):
+    d = date(2025, 1, 1)
+    reminder_db["plans"] = {
+        1: FakePlan([FakeItem(10, d, dt_time(9, 0)), FakeItem(11, d, dt_time(18, 0))]),
+        2: FakePlan([FakeItem(20, d, None)]),   # default time 09:00
+    }
+    reminder_db["configs"] = {1: FakeCfg([0, -15]), 2: FakeCfg([0], enabled=False)}
 
-    monkeypatch.setattr(
-        svc.user_repo,
-        "get_all_users",
-        lambda: [FakeUser(1)],
-    )
+    index = svc.ReminderIndex(listen=False)
 
-    monkeypatch.setattr(
-        svc.plan_repo,
-        "get_plans_by_user_ids",
-        lambda user_ids: {},
-    )
+    due, reached = index.pop_due(at(8, 40), at(8, 46))
+    assert [(x.user_id, x.plan_item_id) for x in due] == [(1, 10)]
+    assert reached == at(8, 46)
 
-    monkeypatch.setattr(
-        svc.plan_service,
-        "get_user_plan",
-        lambda id, from_when, to_when: None,
-    )
+    # Popped entries are gone; the 09:00 trigger comes next
+    due, _ = index.pop_due(at(8, 46), at(9, 1))
+    assert [x.plan_item_id for x in due] == [10]
+    assert index.pop_due(at(9, 1), at(9, 3)) == ([], at(9, 3))
+
+    # Only one full expansion so far
+    assert reminder_db["loads"] == [None]
+
+
+def test_reminder_index_window_excludes_start_includes_end(reminder_db):
+    reminder_db["plans"] = {1: FakePlan([FakeItem(10, date(2025, 1, 1), dt_time(9, 0))])}
+    reminder_db["configs"] = {1: FakeCfg([0])}
+
+    index = svc.ReminderIndex(listen=False)
+    due, _ = index.pop_due(at(8, 55), at(9, 0))
+    assert [x.plan_item_id for x in due] == [10]
+    assert index.pop_due(at(9, 0), at(9, 5))[0] == []
+
+
+def test_reminder_index_one_reminder_per_dose(reminder_db):
+    d = date(2025, 1, 1)
+    reminder_db["plans"] = {1: FakePlan([FakeItem(10, d, dt_time(9, 0))])}
+    reminder_db["configs"] = {1: FakeCfg([0, 1])}
+
+    index = svc.ReminderIndex(listen=False)
+    due, _ = index.pop_due(at(8, 59), at(9, 4))
+    assert len(due) == 1
+
+
+def test_reminder_index_limit_stops_between_minutes(reminder_db):
+    d = date(2025, 1, 1)
+    reminder_db["plans"] = {1: FakePlan([
+        FakeItem(10, d, dt_time(9, 0)),
+        FakeItem(11, d, dt_time(9, 0)),
+        FakeItem(12, d, dt_time(10, 0)),
+    ])}
+    reminder_db["configs"] = {1: FakeCfg([0])}
+
+    index = svc.ReminderIndex(listen=False)
+    due, reached = index.pop_due(at(8, 0), at(11, 0), limit=1)
+    assert sorted(x.plan_item_id for x in due) == [10, 11]
+    assert reached == at(9, 0)
+
+    due, reached = index.pop_due(reached, at(11, 0), limit=1)
+    assert [x.plan_item_id for x in due] == [12]
+    assert reached == at(11, 0)
+    assert reminder_db["loads"] == [None]
+
+
+def test_reminder_index_replays_uncommitted_window(reminder_db):
+    reminder_db["plans"] = {1: FakePlan([FakeItem(10, date(2025, 1, 1), dt_time(9, 0))])}
+    reminder_db["configs"] = {1: FakeCfg([0])}
+
+    index = svc.ReminderIndex(listen=False)
+    assert len(index.pop_due(at(8, 55), at(9, 0))[0]) == 1
+
+    # The tick failed before advancing its watermark: same window again
+    due, _ = index.pop_due(at(8, 55), at(9, 0))
+    assert [x.plan_item_id for x in due] == [10]
+    assert reminder_db["loads"] == [None, None]
+
+
+def test_reminder_index_reloads_changed_users(reminder_db):
+    d = date(2025, 1, 1)
+    reminder_db["plans"] = {
+        1: FakePlan([FakeItem(10, d, dt_time(9, 0))]),
+        2: FakePlan([FakeItem(20, d, dt_time(9, 0))]),
+    }
+    reminder_db["configs"] = {1: FakeCfg([0]), 2: FakeCfg([0])}
+
+    class Feed:
+        changes = set()
+
+        def drain(self):
+            changes, self.changes = self.changes, set()
+            return changes
+
+    index = svc.ReminderIndex(listen=False)
+    index._changes = feed = Feed()
+    assert index.pop_due(at(7, 59), at(8, 0))[0] == []
+
+    # User 1 moves the dose; the old trigger must not fire
+    reminder_db["plans"][1] = FakePlan([FakeItem(12, d, dt_time(9, 30))])
+    feed.changes = {"1"}     # what plan_repo announces on REMINDER_CHANNEL
+
+    due, _ = index.pop_due(at(8, 0), at(9, 0))
+    assert [(x.user_id, x.plan_item_id) for x in due] == [(2, 20)]
+    assert reminder_db["loads"] == [None, {1}]
+
+    due, _ = index.pop_due(at(9, 0), at(9, 30))
+    assert [(x.user_id, x.plan_item_id) for x in due] == [(1, 12)]
+
+
+def test_reminder_index_extends_horizon(reminder_db):
+    reminder_db["plans"] = {1: FakePlan([FakeItem(10, date(2025, 1, 2), dt_time(9, 0))])}
+    reminder_db["configs"] = {1: FakeCfg([0])}
+
+    index = svc.ReminderIndex(horizon=timedelta(hours=12), listen=False)
+    assert index.pop_due(at(7, 59), at(8, 0))[0] == []
+    due, _ = index.pop_due(at(8, 0), at(9, 0, day=2))
+    assert [x.plan_item_id for x in due] == [10]
 
-    doses = svc.get_scheduled_doses_within(days=1, now=now)
-    assert doses == []
\ No newline at end of file
@@ -0,0 +1,135 @@
+import pytest
+from datetime import date, time, timedelta
+
+from pagelogic.repo import adherence_repo, plan_repo
+from pagelogic.service import patient_stats_service as svc
+
+TODAY = date(2025, 3, 10)
+YESTERDAY = date(2025, 3, 9)
+
+
+def make_plan(plan_id, patient_id):
+    return plan_repo.plan(id=plan_id, patient_id=patient_id, doctor_id=1, name="p",
+                          description=None, doctor_name=None, patient_name=None)
+
+
+def make_item(item_id, plan_id):
+    return plan_repo.plan_item(id=item_id, plan_id=plan_id, drug_id=1, drug_name=None,
+                               dosage=1, unit="mg", amount_literal=None, note=None)
+
+
+def daily_rule(item_id, times):
+    return plan_repo.plan_item_rule(
+        id=item_id, plan_item_id=item_id, start_date=date(2025, 1, 1), end_date=None,
+        repeat_type="DAILY", interval_value=1,
+        mon=False, tue=False, wed=False, thu=False, fri=False, sat=False, sun=False,
+        times=times,
+    )
+
+
+class FakeRollup:
+    """adherence_daily in a dict; taken counts come from `taken` on upsert."""
+
+    def __init__(self, taken):
+        self.rows = {}
+        self.taken = taken
+
+    def get_adherence(self, ids, start, end):
+        return {k: r for k, r in self.rows.items() if k[0] in ids and start <= k[1] <= end}
+
+    def upsert_days(self, rows):
+        for pid, day, scheduled in rows:
+            taken = self.taken.get((pid, day), 0)
+            self.rows[(pid, day)] = adherence_repo.adherence_day(pid, day, scheduled, taken, 0, 0)
+
+
+class Calls(list):
+    """Recorded (name, args) repo calls, plus the fake rollup they hit."""
+    rollup = None
+
+
+@pytest.fixture
+def repos(monkeypatch):
+    calls = Calls()
+
+    def record(name, fn):
+        def wrapper(*args):
+            calls.append((name, args))
+            return fn(*args)
+        return wrapper
+
+    plans = {2: make_plan(10, 2), 3: make_plan(11, 3), 4: make_plan(12, 4)}
+    items = {10: [make_item(100, 10)], 11: [make_item(110, 11)]}  # plan 12 is empty
+    rules = {
+        100: [daily_rule(100, [time(8), time(20)])],
+        110: [daily_rule(110, [time(9)])],
+    }
+    rollup = FakeRollup(taken={(2, YESTERDAY): 2})
+    monkeypatch.setattr(svc.plan_repo, "get_patient_ids_with_items",
+                        record("with_items", lambda ids: [i for i in ids if i in (2, 3)]))
+    monkeypatch.setattr(svc.plan_repo, "get_plans_by_user_ids", record("plans", lambda ids: plans))
+    monkeypatch.setattr(svc.plan_repo, "get_plan_items_by_plan_ids", record("items", lambda ids: items))
+    monkeypatch.setattr(svc.plan_repo, "get_plan_item_rules_by_plan_ids",
+                        record("rules", lambda ids: rules))
+    monkeypatch.setattr(svc.adherence_repo, "get_adherence", record("rollup", rollup.get_adherence))
+    monkeypatch.setattr(svc.adherence_repo, "upsert_days", record("upsert", rollup.upsert_days))
+    monkeypatch.setattr(svc.feedback_repo, "get_patient_ids_with_feedback",
+                        record("feedback", lambda ids, d: {3}))
+    calls.rollup = rollup
+    return calls
+
+
+EXPECTED = {
+    2: {"yesterday_completion": 100, "today_tasks": 2,
+        "risk_level": "Low", "has_feedback_today": False},
+    3: {"yesterday_completion": 0, "today_tasks": 1,
+        "risk_level": "High", "has_feedback_today": True},
+}
+
+
+def test_get_patients_stats_fills_rollup_once(repos):
+    assert svc.get_patients_stats([2, 3, 4, 5], today=TODAY) == EXPECTED
+    assert [name for name, _ in repos] == [
+        "with_items", "rollup", "plans", "items", "rules", "upsert", "rollup", "feedback"]
+    assert sorted(repos.rollup.rows) == [(2, YESTERDAY), (2, TODAY), (3, YESTERDAY), (3, TODAY)]
+
+    # Afterwards the stats are a single read of the rollup
+    del repos[:]
+    assert svc.get_patients_stats([2, 3, 4, 5], today=TODAY) == EXPECTED
+    assert [name for name, _ in repos] == ["with_items", "rollup", "feedback"]
+
+
+def test_get_patients_stats_recomputes_invalidated_days(repos):
+    svc.get_patients_stats([2, 3], today=TODAY)
+    # A plan change resets scheduled; the taken count is kept up to date by drug_record_repo
+    repos.rollup.rows[(2, TODAY)].scheduled = None
+    del repos[:]
+
+    svc.get_patients_stats([2, 3], today=TODAY)
+    upserts = [args for name, args in repos if name == "upsert"]
+    assert upserts == [([(2, TODAY, 2)],)]
+
+
+def test_get_patients_stats_no_patients(monkeypatch):
+    monkeypatch.setattr(svc.plan_repo, "get_patient_ids_with_items", lambda ids: [])
+    monkeypatch.setattr(svc.adherence_repo, "get_adherence",
+                        lambda *a: pytest.fail("no patients, no rollup read"))
+    monkeypatch.setattr(svc.feedback_repo, "get_patient_ids_with_feedback", lambda ids, d: set())
+
+    assert svc.get_patients_stats([], today=TODAY) == {}
+
+
+def test_get_adherence_trend(repos):
+    repos.rollup.taken[(2, TODAY - timedelta(days=2))] = 1
+
+    trend = svc.get_adherence_trend(2, 3, today=TODAY)
+
+    assert [d["day"] for d in trend] == ["2025-03-08", "2025-03-09", "2025-03-10"]
+    assert [d["scheduled"] for d in trend] == [2, 2, 2]
+    assert [d["completion"] for d in trend] == [50, 100, 0]
+
+
+@pytest.mark.parametrize("completion,level", [(0, "High"), (69, "High"), (70, "Medium"),
+                                              (84, "Medium"), (85, "Low"), (100, "Low")])
+def test_risk_level(completion, level):
+    assert svc.risk_level(completion) == level
@@ -149,6 +149,25 @@ def test_get_plans_by_user_ids_empty_input():
     assert res == []
 
 
+def test_plan_loaders_agree_on_lowest_plan_id(monkeypatch):
+    """A patient with several plans gets the same one from every loader."""
+    cursor = FakeCursor()
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    plan_repo.get_plans_by_user_ids([10])
+    assert "DISTINCT ON (patient_id)" in cursor.last_query
+    assert "ORDER BY patient_id, id" in cursor.last_query
+
+    plan_repo.get_plan_by_user_id(10)
+    assert "ORDER BY id" in cursor.last_query
+
+    plan_repo.get_full_plan_by_user_id(10)
+    assert "ORDER BY id\n            LIMIT 1" in cursor.last_query
+
+    plan_repo.get_patient_ids_with_items([10])
+    assert "ORDER BY p.patient_id, p.id" in cursor.last_query
+
+
 # ===============================================
 # get_all_plan_items
 # ===============================================
@@ -372,3 +391,130 @@ def test_delete_plan_item_and_rules_exception(monkeypatch):
 
     assert conn.rolled_back is True
 
+
+
+# ===============================================
+# bulk loaders
+# ===============================================
+def test_get_all_plans(monkeypatch, sample_plan_row):
+    cursor = FakeCursor(rows=[sample_plan_row, (3, 11, 99, "PlanC", None, None, None)])
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    plans = plan_repo.get_all_plans()
+    assert set(plans) == {10, 11}
+    assert plans[10].id == 1
+    assert "DISTINCT ON" in cursor.last_query
+
+
+def test_get_plan_items_by_plan_ids(monkeypatch):
+    cursor = FakeCursor(rows=[
+        (1, 10, 100, 5, "mg", None, None),
+        (2, 10, 101, 1, "tab", "one", "note"),
+        (3, 11, 100, 5, "mg", None, None),
+    ])
+    cursor.description = [("id",), ("plan_id",), ("drug_id",), ("dosage",), ("unit",),
+                          ("amount_literal",), ("note",)]
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    items = plan_repo.get_plan_items_by_plan_ids([10, 11])
+    assert [i.id for i in items[10]] == [1, 2]
+    assert items[11][0].drug_id == 100
+    assert cursor.params == ([10, 11],)
+    assert plan_repo.get_plan_items_by_plan_ids([]) == {}
+
+
+def test_get_plan_item_rules_by_plan_ids(monkeypatch):
+    cursor = FakeCursor(rows=[
+        (7, 1, date(2025, 1, 1), None, "DAILY", 1,
+         True, True, True, True, True, True, True, [dt_time(9, 0)]),
+        (8, 1, date(2025, 2, 1), None, "ONCE", None,
+         False, False, False, False, False, False, False, []),
+    ])
+    cursor.description = [(c,) for c in (
+        "id", "plan_item_id", "start_date", "end_date", "repeat_type", "interval_value",
+        "mon", "tue", "wed", "thu", "fri", "sat", "sun", "times")]
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    rules = plan_repo.get_plan_item_rules_by_plan_ids([10])
+    assert [r.id for r in rules[1]] == [7, 8]
+    assert rules[1][0].times == [dt_time(9, 0)]
+    assert plan_repo.get_plan_item_rules_by_plan_ids([]) == {}
+
+
+FULL_PLAN_COLUMNS = [(c,) for c in (
+    "id", "patient_id", "doctor_id", "name", "description", "doctor_name", "patient_name",
+    "item_id", "item_drug_id", "item_dosage", "item_unit", "item_amount_literal", "item_note",
+    "rule_id", "rule_start_date", "rule_end_date", "rule_repeat_type", "rule_interval_value",
+    "rule_mon", "rule_tue", "rule_wed", "rule_thu", "rule_fri", "rule_sat", "rule_sun",
+    "rule_times")]
+
+
+def test_get_full_plan_by_user_id(monkeypatch, sample_plan_row):
+    no_rule = (None,) * 13
+    cursor = FakeCursor(rows=[
+        sample_plan_row + (5, 111, 1, "mg", None, None) + (
+            7, date(2025, 1, 1), None, "DAILY", 1,
+            True, True, True, True, True, True, True, [dt_time(9, 0)]),
+        sample_plan_row + (5, 111, 1, "mg", None, None) + (
+            8, date(2025, 2, 1), None, "ONCE", None,
+            False, False, False, False, False, False, False, []),
+        sample_plan_row + (6, 222, 2, "ml", "2 spoons", "with food") + no_rule,
+    ])
+    cursor.description = FULL_PLAN_COLUMNS
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    p, rules = plan_repo.get_full_plan_by_user_id(10)
+
+    assert cursor.params == (10,)
+    assert p.id == 1 and p.patient_id == 10
+    assert [it.id for it in p.plan_items] == [5, 6]
+    assert p.plan_items[1].note == "with food"
+    assert [r.id for r in rules[5]] == [7, 8]
+    assert rules[5][0].times == [dt_time(9, 0)]
+    assert rules[6] == []
+
+
+def test_get_full_plan_by_user_id_without_items(monkeypatch, sample_plan_row):
+    cursor = FakeCursor(rows=[sample_plan_row + (None,) * 19])
+    cursor.description = FULL_PLAN_COLUMNS
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    p, rules = plan_repo.get_full_plan_by_user_id(10)
+    assert p.plan_items == [] and rules == {}
+
+
+def test_get_full_plan_by_user_id_not_found(monkeypatch):
+    cursor = FakeCursor(rows=[])
+    cursor.description = FULL_PLAN_COLUMNS
+    monkeypatch.setattr(plan_repo, "mydb", lambda: FakeConn(cursor))
+
+    assert plan_repo.get_full_plan_by_user_id(10) is None
+
+def test_plan_occurrence_serialises_like_plan_item():
+    rule = plan_repo.plan_item_rule(
+        id=1, plan_item_id=3, start_date=date(2025, 1, 1), end_date=None,
+        repeat_type="DAILY", interval_value=1,
+        mon=False, tue=False, wed=False, thu=False, fri=False, sat=False, sun=False,
+        times=[dt_time(8, 0)],
+    )
+    item = plan_repo.plan_item(
+        id=3, plan_id=2, drug_id=7, drug_name="Aspirin", dosage=100, unit="mg",
+        amount_literal="1 tablet", note="after meals",
+    )
+    occ = plan_repo.plan_occurrence(item, date(2025, 1, 2), dt_time(8, 0), rule)
+    full = plan_repo.plan_item(
+        id=3, plan_id=2, drug_id=7, drug_name="Aspirin", dosage=100, unit="mg",
+        amount_literal="1 tablet", note="after meals",
+        date=date(2025, 1, 2), time=dt_time(8, 0), plan_item_rule=rule,
+    )
+
+    assert occ.to_dict() == full.to_dict()
+    assert list(occ.to_dict()) == list(full.to_dict())
+    assert occ.drug_name == "Aspirin" and occ.note == "after meals"
+
+    p = plan_repo.plan(id=2, patient_id=1, doctor_id=9, name="P", description=None,
+                       doctor_name=None, patient_name=None, plan_items=[occ])
+    assert p.to_dict()["plan_items"] == [full.to_dict()]
+
+    with pytest.raises(AttributeError):
+        occ.extra = 1  # __slots__
@@ -1,9 +1,14 @@
 import pytest
-from datetime import date, time, datetime
+from datetime import date, time, datetime, timedelta
+import pagelogic.service.plan_service as plan_service
 from pagelogic.service.plan_service import (
+    OPEN_ENDED_DAYS,
     get_raw_plan,
     get_user_plan,
-    fill_date_and_time
+    get_all_user_plans,
+    fill_date_and_time,
+    iter_plan_items,
+    iter_rule_dates,
 )
 
 # --------------------------------
@@ -11,11 +16,20 @@ from pagelogic.service.plan_service import (
 # --------------------------------
 
 class FakePlan:
-    def __init__(self, id):
+    def __init__(self, id, patient_id=5):
         self.id = id
+        self.patient_id = patient_id
         self.plan_items = None
 
 
+@pytest.fixture(autouse=True)
+def fresh_plan_cache(monkeypatch):
+    """Each test gets an empty cache that does not LISTEN on the database."""
+    cache = plan_service.PlanCache(maxsize=8, listen=False)
+    monkeypatch.setattr(plan_service, "_plan_cache", cache)
+    return cache
+
+
 class FakePlanItem:
     def __init__(self, id, plan_id=1, drug_id=1, drug_name=None,
                  dosage=1, unit="mg", amount_literal=None, note=None):
@@ -61,26 +75,28 @@ class FakeDrug:
         self.generic_name = generic_name
 
 
-# Returned objects from plan_repo.plan_item must have .date / .time
-class FakeGeneratedItem:
-    def __init__(self, **kwargs):
-        for k, v in kwargs.items():
-            setattr(self, k, v)
-
-
 # --------------------------------
 # Test get_raw_plan
 # --------------------------------
 
 def test_get_raw_plan_no_plan(monkeypatch):
     monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_by_user_id",
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id",
         lambda x: None
     )
 
     assert get_raw_plan(99) is None
 
 
+def test_get_user_plan_no_plan(monkeypatch):
+    monkeypatch.setattr(
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id",
+        lambda x: None
+    )
+
+    assert get_user_plan(99, None, None) is None
+
+
 def test_get_raw_plan_success(monkeypatch):
     plan = FakePlan(id=10)
 
@@ -99,17 +115,10 @@ def test_get_raw_plan_success(monkeypatch):
         FakeDrug(222, "DrugB")
     ]
 
+    plan.plan_items = items
     monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_by_user_id",
-        lambda uid: plan
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_all_plan_items_by_plan_id",
-        lambda pid: items
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_item_rules_by_plan_id",
-        lambda pid: rules
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id",
+        lambda uid: (plan, rules)
     )
     monkeypatch.setattr(
         "pagelogic.service.plan_service.drug_repo.get_drugs_by_ids_locally",
@@ -147,17 +156,10 @@ def test_get_user_plan_success(monkeypatch):
         FakeDrug(222, "DrugB")
     ]
 
+    plan.plan_items = items
     monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_by_user_id",
-        lambda uid: plan
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_all_plan_items_by_plan_id",
-        lambda pid: items
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_item_rules_by_plan_id",
-        lambda pid: rules
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id",
+        lambda uid: (plan, rules)
     )
     monkeypatch.setattr(
         "pagelogic.service.plan_service.drug_repo.get_drugs_by_ids_locally",
@@ -203,11 +205,6 @@ def test_fill_single_rule_object(monkeypatch):
 
     rules = {1: SingleRule()}
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time(
         [item], rules, date(2025, 1, 1), date(2025, 1, 31)
     )
@@ -220,11 +217,6 @@ def test_fill_date_range_none(monkeypatch):
     item = FakePlanItem(1)
     rule = FakeRule(start_date=date(2025, 1, 10), times=[time(9)])
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time([item], {1: [rule]}, None, None)
 
     assert len(result) == 1
@@ -234,11 +226,6 @@ def test_fill_times_string_format(monkeypatch):
     item = FakePlanItem(1)
     rule = FakeRule(start_date=date(2025, 1, 1), times=["08:30"])
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time([item], {1: [rule]}, date(2025, 1, 1), date(2025, 1, 2))
 
     assert result[0].time == "08:30"
@@ -248,11 +235,6 @@ def test_fill_times_string_invalid(monkeypatch):
     item = FakePlanItem(1)
     rule = FakeRule(start_date=date(2025, 1, 1), times=["not-a-time"])
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time([item], {1: [rule]}, date(2025, 1, 1), date(2025, 1, 2))
 
     assert result[0].time == "not-a-time"
@@ -273,11 +255,6 @@ def test_fill_weekly_no_flags(monkeypatch):
     item = FakePlanItem(1)
     rule = FakeRule(start_date=date(2025, 1, 1), repeat_type="WEEKLY", times=[time(8)])
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time(
         [item], {1: [rule]}, date(2025, 1, 1), date(2025, 1, 7)
     )
@@ -294,11 +271,6 @@ def test_fill_daily_default_interval(monkeypatch):
         times=[time(7)]
     )
 
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = fill_date_and_time(
         [item], {1: [rule]}, date(2025, 1, 1), date(2025, 1, 31)
     )
@@ -312,28 +284,208 @@ def test_get_user_plan_full_flow(monkeypatch):
     rules = {1: [FakeRule(start_date=date(2025, 1, 1), times=[time(9)])]}
     drugs = [FakeDrug(111, "AAA")]
 
+    plan.plan_items = items
     monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_by_user_id",
-        lambda uid: plan
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_all_plan_items_by_plan_id",
-        lambda pid: items
-    )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.get_plan_item_rules_by_plan_id",
-        lambda pid: rules
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id",
+        lambda uid: (plan, rules)
     )
     monkeypatch.setattr(
         "pagelogic.service.plan_service.drug_repo.get_drugs_by_ids_locally",
         lambda ids: drugs
     )
-    monkeypatch.setattr(
-        "pagelogic.service.plan_service.plan_repo.plan_item",
-        lambda **kw: FakeGeneratedItem(**kw)
-    )
-
     result = get_user_plan(1, date(2025, 1, 1), date(2025, 1, 2))
 
     assert len(result.plan_items) == 1
-    assert result.plan_items[0].drug_name == "AAA"
\ No newline at end of file
+    assert result.plan_items[0].drug_name == "AAA"
+
+def test_get_all_user_plans_bulk(monkeypatch):
+    plans = {5: FakePlan(id=10), 6: FakePlan(id=11), 7: FakePlan(id=12)}
+    items = {
+        10: [FakePlanItem(1, plan_id=10, drug_id=111)],
+        11: [FakePlanItem(2, plan_id=11, drug_id=222), FakePlanItem(3, plan_id=11, drug_id=999)],
+    }
+    rules = {
+        1: [FakeRule(start_date=date(2025, 1, 1), times=[time(9)])],
+        2: [FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", times=[time(8)])],
+        3: [FakeRule(start_date=date(2025, 3, 1))],  # outside the window
+    }
+    calls = []
+
+    def record(name, result):
+        def fn(*args):
+            calls.append((name, args))
+            return result
+        return fn
+
+    monkeypatch.setattr("pagelogic.service.plan_service.plan_repo.get_all_plans",
+                        record("plans", plans))
+    monkeypatch.setattr("pagelogic.service.plan_service.plan_repo.get_plan_items_by_plan_ids",
+                        record("items", items))
+    monkeypatch.setattr("pagelogic.service.plan_service.plan_repo.get_plan_item_rules_by_plan_ids",
+                        record("rules", rules))
+    monkeypatch.setattr("pagelogic.service.plan_service.drug_repo.get_drugs_by_ids_locally",
+                        lambda ids: [FakeDrug(111, "AAA"), FakeDrug(222, "BBB")])
+
+    result = get_all_user_plans(date(2025, 1, 1), date(2025, 1, 2))
+
+    # One call per repo function, whatever the number of users
+    assert [name for name, _ in calls] == ["plans", "items", "rules"]
+    assert calls[1][1] == ([10, 11, 12],)
+
+    assert [(i.drug_name, i.date) for i in result[5].plan_items] == [("AAA", date(2025, 1, 1))]
+    assert [(i.drug_name, i.date) for i in result[6].plan_items] == [
+        ("BBB", date(2025, 1, 1)), ("BBB", date(2025, 1, 2))]
+    assert result[7].plan_items == []
+
+
+# --------------------------------
+# Arithmetic expansion
+# --------------------------------
+
+def test_iter_rule_dates_daily_interval_keeps_rule_phase():
+    rule = FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", interval_value=3)
+    dates = list(iter_rule_dates(rule, date(2025, 1, 5), date(2025, 1, 12)))
+    # 1, 4, 7, 10, ... counted from the rule start, not from the window start
+    assert dates == [date(2025, 1, 7), date(2025, 1, 10)]
+
+
+def test_iter_rule_dates_weekly_jumps_to_flagged_days():
+    rule = FakeRule(start_date=date(2020, 1, 1), repeat_type="WEEKLY", mon=True, fri=True)
+    dates = list(iter_rule_dates(rule, date(2025, 1, 1), date(2025, 1, 14)))
+    assert dates == [date(2025, 1, 3), date(2025, 1, 6), date(2025, 1, 10), date(2025, 1, 13)]
+    assert all(d.weekday() in (0, 4) for d in dates)
+
+
+def test_iter_rule_dates_open_ended_up_to_date_max():
+    rule = FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", interval_value=2)
+    dates = list(iter_rule_dates(rule, date(9999, 12, 25), date.max))
+    assert dates[-1] >= date.max - timedelta(days=1)
+    assert all((b - a).days == 2 for a, b in zip(dates, dates[1:]))
+
+
+def test_fill_unbounded_daily_is_clamped(monkeypatch):
+    item = FakePlanItem(1)
+    rule = FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", times=[time(8)])
+
+    result = fill_date_and_time([item], {1: [rule]}, None, None)
+
+    assert result[0].date == date(2025, 1, 1)
+    assert result[-1].date == max(date(2025, 1, 1), date.today()) + timedelta(days=OPEN_ENDED_DAYS)
+
+
+def test_iter_plan_items_is_lazy_and_sorted(monkeypatch):
+    items = [FakePlanItem(1), FakePlanItem(2)]
+    rules = {
+        1: [FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", times=[time(20), time(8)])],
+        2: [FakeRule(start_date=date(2025, 1, 1), repeat_type="WEEKLY", wed=True, times=["12:00"])],
+    }
+
+    gen = iter_plan_items(items, rules, date(2025, 1, 1), None)
+    first = [next(gen) for _ in range(4)]
+    assert [(x.id, x.date.day, x.time) for x in first] == [
+        (1, 1, time(8)), (2, 1, "12:00"), (1, 1, time(20)), (1, 2, time(8)),
+    ]
+
+
+# --------------------------------
+# Expanded plan cache
+# --------------------------------
+
+def _count_loads(monkeypatch, rules):
+    loads = []
+
+    def load(uid):
+        loads.append(uid)
+        plan = FakePlan(id=10, patient_id=5)
+        plan.plan_items = [FakePlanItem(1, drug_id=111)]
+        return plan, rules
+
+    monkeypatch.setattr(
+        "pagelogic.service.plan_service.plan_repo.get_full_plan_by_user_id", load)
+    monkeypatch.setattr(
+        "pagelogic.service.plan_service.drug_repo.get_drugs_by_ids_locally",
+        lambda ids: [FakeDrug(111, "AAA")])
+    return loads
+
+
+def test_get_user_plan_cached_per_window(monkeypatch, fresh_plan_cache):
+    rules = {1: [FakeRule(start_date=date(2025, 1, 1), repeat_type="DAILY", times=[time(9)])]}
+    loads = _count_loads(monkeypatch, rules)
+
+    first = get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    again = get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    other = get_user_plan(5, date(2025, 1, 1), date(2025, 1, 1))
+
+    assert loads == [5, 5]
+    assert len(first.plan_items) == len(again.plan_items) == 7
+    assert len(other.plan_items) == 1
+    # Callers get their own copy
+    again.plan_items.clear()
+    assert len(get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7)).plan_items) == 7
+
+    stats = plan_service.get_plan_cache_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_get_user_plan_skips_cache_for_open_ended_windows(monkeypatch, fresh_plan_cache):
+    rules = {1: [FakeRule(start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), times=[time(9)])]}
+    loads = _count_loads(monkeypatch, rules)
+
+    get_user_plan(5, None, None)
+    get_user_plan(5, None, None)
+    get_user_plan(5, date(2025, 1, 1), None)
+
+    assert loads == [5, 5, 5]
+    stats = plan_service.get_plan_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (0, 0, 0)
+
+
+def test_get_user_plan_cache_invalidated_by_version(monkeypatch, fresh_plan_cache):
+    rules = {1: [FakeRule(start_date=date(2025, 1, 1), times=[time(9)])]}
+    loads = _count_loads(monkeypatch, rules)
+
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    plan_service.plan_repo.bump_plan_versions([10])  # what the repo writes do
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+
+    assert loads == [5, 5]
+
+
+def test_plan_cache_lru_eviction(monkeypatch):
+    cache = plan_service.PlanCache(maxsize=2, listen=False)
+    monkeypatch.setattr(plan_service, "_plan_cache", cache)
+    rules = {1: [FakeRule(start_date=date(2025, 1, 1), times=[time(9)])]}
+    loads = _count_loads(monkeypatch, rules)
+
+    for day in (1, 2, 3, 1):
+        get_user_plan(5, date(2025, 1, day), date(2025, 1, day))
+
+    assert len(loads) == 4  # day 1 was evicted by day 3
+    assert cache.stats()["evictions"] == 2
+
+
+def test_plan_cache_follows_other_workers(monkeypatch):
+    cache = plan_service.PlanCache(maxsize=8, listen=False)
+    monkeypatch.setattr(plan_service, "_plan_cache", cache)
+    rules = {1: [FakeRule(start_date=date(2025, 1, 1), times=[time(9)])]}
+    loads = _count_loads(monkeypatch, rules)
+
+    class Feed:
+        changes = set()
+
+        def drain(self):
+            changes, self.changes = self.changes, set()
+            return changes
+
+    feed = Feed()
+    cache._changes = feed
+
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    feed.changes = {"5"}  # patient 5's plan changed in another worker
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    feed.changes = None   # listener lost: forget everything
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+    get_user_plan(5, date(2025, 1, 1), date(2025, 1, 7))
+
+    assert loads == [5, 5, 5]
@@ -0,0 +1,144 @@
+import pytest
+from datetime import date, datetime, time as dt_time
+
+from pagelogic.repo import reminder_outbox_repo
+
+
+# --------------------------
+# Fake DB Objects
+# --------------------------
+class FakeCursor:
+    def __init__(self, rows=None, rowcount=0, fail=False):
+        self.rows = rows or []
+        self.rowcount = rowcount
+        self.fail = fail
+        self.queries = []
+        self.many = None
+
+    def execute(self, query, params=None):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.queries.append((query, params))
+
+    def executemany(self, query, params_seq):
+        self.many = (query, list(params_seq))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+NOW = datetime(2025, 1, 1, 9, 0)
+
+
+def entry(entry_id=None, trigger_hour=9):
+    return reminder_outbox_repo.outbox_entry(
+        id=entry_id, user_id=1, plan_item_id=10,
+        expected_date=date(2025, 1, 1), expected_time=dt_time(9, 0),
+        notify_offset=0, trigger_at=datetime(2025, 1, 1, trigger_hour, 0),
+        drug_name="Aspirin", dosage=100, unit="mg",
+    )
+
+
+def test_enqueue_ignores_duplicates_and_counts_new(monkeypatch):
+    cur = FakeCursor(rowcount=1)
+    conn = FakeConn(cur)
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: conn)
+
+    assert reminder_outbox_repo.enqueue([entry(), entry()], NOW) == 1
+
+    query, rows = cur.many
+    assert "ON CONFLICT (user_id, plan_item_id, expected_date, expected_time, notify_offset)" in query
+    assert "DO NOTHING" in query
+    assert rows[0]["notify_offset"] == 0
+    assert rows[0]["now"] == NOW
+    assert conn.committed
+
+
+def test_enqueue_empty_skips_db(monkeypatch):
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: pytest.fail("no query expected"))
+    assert reminder_outbox_repo.enqueue([], NOW) == 0
+
+
+def test_claim_batch_skips_locked_rows_and_orders_by_trigger(monkeypatch):
+    late = entry(2, trigger_hour=10)
+    early = entry(1, trigger_hour=9)
+    cur = FakeCursor(rows=[
+        (late.id, 1, 10, late.expected_date, late.expected_time, 0, late.trigger_at, "Aspirin", 100, "mg", 1),
+        (early.id, 1, 10, early.expected_date, early.expected_time, 0, early.trigger_at, "Aspirin", 100, "mg", 1),
+    ])
+    conn = FakeConn(cur)
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: conn)
+
+    claimed = reminder_outbox_repo.claim_batch(NOW, limit=50, lease_seconds=300, max_attempts=5)
+
+    assert [e.id for e in claimed] == [1, 2]
+    assert claimed[0].attempts == 1
+    query, params = cur.queries[1]
+    assert "FOR UPDATE SKIP LOCKED" in query
+    assert params == {"now": NOW, "lease": 300, "max_attempts": 5, "limit": 50}
+    assert conn.committed
+
+
+def test_claim_batch_fails_rows_whose_last_lease_expired(monkeypatch):
+    # Claimed on the final attempt, then the dispatcher died: the row is
+    # still PENDING but can never be claimed again
+    cur = FakeCursor()
+    conn = FakeConn(cur)
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: conn)
+
+    assert reminder_outbox_repo.claim_batch(NOW, limit=50, lease_seconds=300, max_attempts=5) == []
+
+    query, params = cur.queries[0]
+    assert "SET status = 'FAILED'" in query
+    assert "status = 'PENDING'" in query
+    assert "next_attempt_at <= %(now)s" in query
+    assert "attempts >= %(max_attempts)s" in query
+    assert params == {"now": NOW, "max_attempts": 5}
+    assert "attempts < %(max_attempts)s" in cur.queries[1][0]
+    assert conn.committed
+
+
+def test_mark_sent_and_skipped(monkeypatch):
+    cur = FakeCursor()
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: FakeConn(cur))
+
+    reminder_outbox_repo.mark_sent([1, 2], NOW)
+    reminder_outbox_repo.mark_skipped([3], NOW, "taken")
+    reminder_outbox_repo.mark_sent([], NOW)
+
+    assert [q[1] for q in cur.queries] == [
+        ("SENT", NOW, None, [1, 2]),
+        ("SKIPPED", NOW, "taken", [3]),
+    ]
+
+
+def test_release_failed_rolls_back_on_error(monkeypatch):
+    cur = FakeCursor(fail=True)
+    conn = FakeConn(cur)
+    monkeypatch.setattr(reminder_outbox_repo, "mydb", lambda: conn)
+
+    with pytest.raises(RuntimeError):
+        reminder_outbox_repo.release_failed([1], NOW, "send failed", max_attempts=5)
+    assert conn.rolled_back
@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime
+
+from pagelogic.repo import scheduler_repo
+
+
+# --------------------------
+# Fake DB Objects
+# --------------------------
+class FakeCursor:
+    def __init__(self, row=None, fail=False):
+        self.row = row
+        self.fail = fail
+        self.queries = []
+
+    def execute(self, query, params=None):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.queries.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+def test_get_watermark(monkeypatch):
+    until = datetime(2025, 1, 1, 9, 0)
+    cur = FakeCursor(row=(until,))
+    monkeypatch.setattr(scheduler_repo, "mydb", lambda: FakeConn(cur))
+
+    assert scheduler_repo.get_watermark("notify_jobs") == until
+    assert cur.queries[0][1] == ("notify_jobs",)
+
+
+def test_get_watermark_missing(monkeypatch):
+    monkeypatch.setattr(scheduler_repo, "mydb", lambda: FakeConn(FakeCursor()))
+    assert scheduler_repo.get_watermark("notify_jobs") is None
+
+
+def test_set_watermark_never_moves_back(monkeypatch):
+    cur = FakeCursor()
+    conn = FakeConn(cur)
+    monkeypatch.setattr(scheduler_repo, "mydb", lambda: conn)
+
+    until = datetime(2025, 1, 1, 9, 0)
+    scheduler_repo.set_watermark("notify_jobs", until)
+
+    query, params = cur.queries[0]
+    assert "GREATEST" in query
+    assert params == ("notify_jobs", until)
+    assert conn.committed
+
+
+def test_set_watermark_rolls_back_on_error(monkeypatch):
+    conn = FakeConn(FakeCursor(fail=True))
+    monkeypatch.setattr(scheduler_repo, "mydb", lambda: conn)
+
+    with pytest.raises(RuntimeError):
+        scheduler_repo.set_watermark("notify_jobs", datetime(2025, 1, 1))
+    assert conn.rolled_back
@@ -0,0 +1,60 @@
+import pytest
+from array import array
+from utils import snapshot
+from utils.snapshot import Snapshot, SnapshotError, StringColumn, read_snapshot, string_sections, write_snapshot
+
+
+def test_round_trip_sections_and_meta(tmp_path):
+    path = str(tmp_path / "x.snap")
+    sections = {
+        "ids": array("q", [1, 2, 3]),
+        "vals": array("d", [0.5, float("nan"), 2.0]),
+        "blob": b"abc",  # odd length: the next section must stay aligned
+        "codes": array("I", [7, 8]),
+    }
+    write_snapshot(path, {"table": "t", "version": [3, 3]}, sections)
+
+    snap = Snapshot(path)
+    assert snap.meta == {"table": "t", "version": [3, 3]}
+    assert list(snap.section("ids")) == [1, 2, 3]
+    assert snap.section("vals")[2] == 2.0
+    assert bytes(snap.section("blob")) == b"abc"
+    assert list(snap.section("codes")) == [7, 8]
+
+    with pytest.raises(SnapshotError):
+        snap.section("missing")
+
+
+def test_string_column_keeps_nulls_and_unicode(tmp_path):
+    path = str(tmp_path / "s.snap")
+    values = ["Apple", None, "", "Café au lait"]
+    write_snapshot(path, {}, string_sections("desc", values))
+
+    col = StringColumn(Snapshot(path), "desc")
+    assert len(col) == 4
+    assert [col[i] for i in range(4)] == values
+
+
+def test_rejects_missing_corrupt_and_other_versions(tmp_path, monkeypatch):
+    assert read_snapshot(str(tmp_path / "nope.snap")) is None
+
+    junk = tmp_path / "junk.snap"
+    junk.write_bytes(b"not a snapshot at all")
+    assert read_snapshot(str(junk)) is None
+
+    path = str(tmp_path / "old.snap")
+    write_snapshot(path, {}, {"a": b"x"})
+    monkeypatch.setattr(snapshot, "FORMAT_VERSION", snapshot.FORMAT_VERSION + 1)
+    assert read_snapshot(path) is None
+
+
+def test_rewrite_replaces_file_atomically(tmp_path):
+    path = str(tmp_path / "x.snap")
+    write_snapshot(path, {"v": 1}, {"a": b"1"})
+    old = Snapshot(path)
+    write_snapshot(path, {"v": 2}, {"a": b"22"})
+
+    # An open reader keeps seeing the file it mapped
+    assert bytes(old.section("a")) == b"1"
+    assert Snapshot(path).meta == {"v": 2}
+    assert [p.name for p in tmp_path.iterdir()] == ["x.snap"]
@@ -0,0 +1,83 @@
+from utils import text_index
+from utils.text_index import NgramIndex, top_ranked
+
+
+def _scan(rows, keywords):
+    """Reference implementation: the original full-catalogue scan."""
+    keywords = [k.lower() for k in keywords if k]
+    res = []
+    for pos, row in enumerate(rows):
+        for f in row:
+            if f and all(k in f.lower() for k in keywords):
+                res.append(pos)
+                break
+    return res
+
+
+ROWS = [
+    ("Tylenol", "Acetaminophen"),
+    ("Advil", "Ibuprofen"),
+    (None, "Acetaminophen and Codeine"),
+    ("Aspirin Low Dose", None),
+    ("Children's Advil", "IBUPROFEN"),
+    (None, None),
+]
+
+
+def test_search_matches_full_scan():
+    index = NgramIndex(ROWS)
+    for q in (["acet"], ["advil"], ["ibu", "pro"], ["acetaminophen", "codeine"],
+              ["ac"], ["a", "dose"], ["zzz"], ["Advil", "children"]):
+        assert index.search(q) == _scan(ROWS, q), q
+
+
+def test_keywords_must_match_within_one_field():
+    index = NgramIndex(ROWS)
+    # "tylenol" is in brand, "acetaminophen" in generic: no single field has both
+    assert index.search(["tylenol", "acetaminophen"]) == []
+
+
+def test_empty_keywords_and_empty_index():
+    assert NgramIndex(ROWS).search(["", ""]) == []
+    assert NgramIndex([]).search(["abc"]) == []
+
+
+def test_results_in_catalogue_order():
+    rows = [("beef stew",), ("stew",), ("lamb stew",)]
+    assert NgramIndex(rows).search(["stew"]) == [0, 1, 2]
+
+
+def test_snapshot_round_trip(tmp_path):
+    from utils.snapshot import Snapshot, write_snapshot
+    index = NgramIndex(ROWS)
+    path = str(tmp_path / "idx.snap")
+    write_snapshot(path, {}, index.to_sections("index"))
+
+    loaded = NgramIndex.from_snapshot(Snapshot(path), "index", rows=len(ROWS), width=2)
+    assert len(loaded) == len(ROWS)
+    for q in (["acet"], ["ibu", "pro"], ["ac"], ["zzz"], ["Advil", "children"]):
+        assert loaded.search(q) == index.search(q), q
+
+
+def test_extended_matches_fresh_build_and_leaves_original():
+    base = NgramIndex(ROWS[:3])
+    before = {g: list(p) for g, p in base.postings.items()}
+
+    grown = base.extended(ROWS[3:])
+    fresh = NgramIndex(ROWS)
+    for q in (["acet"], ["advil"], ["ibu", "pro"], ["ac"], ["a", "dose"], ["zzz"]):
+        assert grown.search(q) == fresh.search(q), q
+    assert len(grown) == len(ROWS)
+
+    assert {g: list(p) for g, p in base.postings.items()} == before
+    assert base.search(["advil"]) == [1]
+
+
+def test_top_ranked_pages_by_rank_and_clamps():
+    positions = list(range(50))
+    rank = lambda pos: pos % 10      # ties keep catalogue order
+
+    assert top_ranked(positions, rank, limit=3) == [0, 10, 20]
+    assert top_ranked(positions, rank, limit=3, offset=4) == [40, 1, 11]
+    assert top_ranked(positions, rank, limit=10 ** 9) == sorted(positions, key=rank)
+    assert top_ranked(range(10 ** 6), lambda pos: pos, limit=1, offset=10 ** 9) == [text_index.MAX_OFFSET]
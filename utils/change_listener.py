@@ -0,0 +1,71 @@
+"""
+Change notifications between processes over Postgres LISTEN/NOTIFY.
+
+Repos announce what they changed with pg_notify() inside their own
+transaction, so a notification is only delivered if the change commits.
+Each in-memory cache that must follow those changes in every gunicorn
+worker owns a ChangeListener on the channel and drains it, without
+blocking or a round-trip, before it trusts its contents.
+"""
+import time
+from typing import Optional, Set
+
+import psycopg
+from psycopg import sql
+
+import config
+
+
+class ChangeListener:
+    """
+    One LISTEN connection on `channel`, opened lazily.
+
+    drain() returns the payloads received since the previous call, or None
+    when notifications may have been missed: on the first call, after the
+    connection was lost, or while it cannot be (re)opened. The caller should
+    then forget everything it cached; the connection is already listening
+    again (if possible), so changes committed from then on are not lost.
+    A disabled listener (tests, single-process tools) always returns an
+    empty set.
+    """
+
+    def __init__(self, channel: str, enabled: bool = True, retry_seconds: float = 30.0):
+        self.channel = channel
+        self.enabled = enabled
+        self.retry_seconds = retry_seconds
+        self._conn = None
+        self._retry_at = 0.0
+
+    def _open(self) -> None:
+        self.close()
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            conn = config.mydb_direct()
+            conn.autocommit = True
+            conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+            self._conn = conn
+        except psycopg.Error as e:
+            print(f"[LISTEN] Cannot listen on {self.channel}: {e}")
+            self._retry_at = time.monotonic() + self.retry_seconds
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg.Error:
+                pass
+            self._conn = None
+
+    def drain(self) -> Optional[Set[str]]:
+        if not self.enabled:
+            return set()
+        if self._conn is None:
+            self._open()
+            return None
+        try:
+            return {n.payload for n in self._conn.notifies(timeout=0)}
+        except psycopg.Error as e:
+            print(f"[LISTEN] Lost the listener on {self.channel}: {e}")
+            self._open()
+            return None
@@ -0,0 +1,196 @@
+"""
+Process-wide PostgreSQL connection pool.
+
+Every repo function borrows a connection through config.mydb(), which now
+comes from here instead of opening a fresh TCP+TLS session per query.
+The pool is created lazily and per process, so gunicorn workers forked
+from a preloaded master never share sockets with their parent.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+import config
+
+_pool = None
+_pool_pid = None
+_lock = threading.RLock()
+
+# Acquire-time metrics (seconds), reset per process
+_stats = {}
+
+
+def _reset_stats() -> None:
+    _stats.update(acquired=0, released=0, timeouts=0, leaked=0,
+                  wait_total=0.0, wait_max=0.0)
+
+
+_reset_stats()
+
+
+def _new_pool() -> ConnectionPool:
+    return ConnectionPool(
+        kwargs=config.db_conninfo(),
+        min_size=config.DB_POOL_MIN_SIZE,
+        max_size=config.DB_POOL_MAX_SIZE,
+        timeout=config.DB_POOL_TIMEOUT,
+        max_idle=config.DB_POOL_MAX_IDLE,
+        check=ConnectionPool.check_connection,
+        name=f"dinedose-{os.getpid()}",
+        open=True,
+    )
+
+
+def get_pool() -> ConnectionPool:
+    """Return this process's pool, creating it on first use (or after fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _lock:
+        if _pool is None or _pool_pid != pid:
+            # After a fork the parent's pool is unusable here; just drop it.
+            _pool = _new_pool()
+            _pool_pid = pid
+            _reset_stats()
+    return _pool
+
+
+def close_pool() -> None:
+    """Close the pool owned by this process (used on shutdown and in tests)."""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+
+
+def _record_wait(seconds: float) -> None:
+    with _lock:
+        _stats["acquired"] += 1
+        _stats["wait_total"] += seconds
+        if seconds > _stats["wait_max"]:
+            _stats["wait_max"] = seconds
+
+
+def _acquire(pool: ConnectionPool) -> psycopg.Connection:
+    start = time.perf_counter()
+    try:
+        conn = pool.getconn()
+    except PoolTimeout:
+        with _lock:
+            _stats["timeouts"] += 1
+        raise
+    _record_wait(time.perf_counter() - start)
+    return conn
+
+
+def _release(pool: ConnectionPool, conn: psycopg.Connection) -> None:
+    # Read-only repo functions never commit; end their transaction here so
+    # the pool does not log a warning for every returned connection.
+    if not conn.closed and conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+        try:
+            conn.rollback()
+        except psycopg.Error:
+            pass
+    pool.putconn(conn)
+    with _lock:
+        _stats["released"] += 1
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled psycopg connection.
+
+    Behaves like the connection returned by psycopg.connect(), except that
+    close() hands the connection back to the pool. It can also be used as a
+    context manager: commit on success, rollback on error, then release.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn: psycopg.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise psycopg.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+
+    @property
+    def closed(self) -> bool:
+        return self._conn is None
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            _release(self._pool, conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+
+    def __del__(self):
+        # Safety net for code paths that return/raise without close().
+        if self.__dict__.get("_conn") is not None:
+            with _lock:
+                _stats["leaked"] += 1
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+def getconn() -> PooledConnection:
+    """Borrow a connection; the caller must close() it (or use `with`)."""
+    pool = get_pool()
+    return PooledConnection(pool, _acquire(pool))
+
+
+@contextmanager
+def connection():
+    """
+    Context-manager API for new code:
+
+        with db_pool.connection() as conn:
+            cur = conn.cursor()
+            ...
+
+    Commits on success, rolls back on error, and always returns the
+    connection to the pool.
+    """
+    conn = getconn()
+    with conn:
+        yield conn
+
+
+def get_pool_stats() -> dict:
+    """Pool sizing from psycopg_pool plus our acquire-time counters (ms)."""
+    with _lock:
+        acquired = _stats["acquired"]
+        res = {
+            "acquired": acquired,
+            "released": _stats["released"],
+            "timeouts": _stats["timeouts"],
+            "leaked": _stats["leaked"],
+            "wait_avg_ms": round(_stats["wait_total"] / acquired * 1000, 3) if acquired else 0.0,
+            "wait_max_ms": round(_stats["wait_max"] * 1000, 3),
+        }
+    if _pool is not None and _pool_pid == os.getpid():
+        res.update(_pool.get_stats())
+    return res
@@ -1,53 +1,217 @@
+"""
+Outgoing email through AWS SES.
+
+Everything goes through this process's Mailer: a bounded pool of sender
+threads sharing one SES client and one per-second rate limit, so a burst
+of reminders is sent in parallel but never faster than
+SES_MAX_SEND_RATE. Reminders are dispatched by a single process
+(app.dispatch_cronjob), so that limit holds for the account's SES
+sending quota as a whole. send_email_ses() sends one message and waits
+for it; jobs sending many at once (the reminder dispatcher) use
+get_mailer().send_bulk().
+
+The transport is pluggable: MAIL_TRANSPORT=local swaps SES for
+LocalTransport, which only records messages (tests, local development).
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
 import boto3
 from botocore.exceptions import ClientError
+
 import config
-import traceback
+
+DEFAULT_TEXT_BODY = "This email contains HTML content. Please view it in an HTML-capable client."
+
+
+@dataclass
+class EmailMessage:
+    to: str
+    subject: str
+    html_body: str
+    text_body: Optional[str] = None
+
+
+# =============== SES client ===============
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_ses_client():
+    """This process's SES client, created on first use (boto3 clients are thread-safe)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = boto3.client(
+                    "ses",
+                    region_name=config.AWS_REGION,
+                    aws_access_key_id=config.AWS_ACCESS_KEY,
+                    aws_secret_access_key=config.AWS_SECRET_KEY,
+                )
+                _client_pid = pid
+    return _client
+
+
+# =============== transports ===============
+
+class SesTransport:
+    """Sends each message with SES SendEmail."""
+
+    def send(self, message: EmailMessage) -> bool:
+        try:
+            response = get_ses_client().send_email(
+                Source=config.SES_SENDER,
+                Destination={"ToAddresses": [message.to]},
+                Message={
+                    "Subject": {"Data": message.subject},
+                    "Body": {
+                        "Text": {"Data": message.text_body or DEFAULT_TEXT_BODY},
+                        "Html": {"Data": message.html_body},
+                    },
+                },
+            )
+            print(f"✅ [SES] Sent email to {message.to}, MessageId={response['MessageId']}")
+            return True
+
+        except ClientError as e:
+            print(f"❌ [SES Error] {e.response['Error']['Message']}")
+            traceback.print_exc()
+            return False
+
+        except Exception as e:
+            print(f"❌ [Unknown Error] {e}")
+            traceback.print_exc()
+            return False
+
+
+class LocalTransport:
+    """Keeps messages in `outbox` instead of sending them."""
+
+    def __init__(self):
+        self.outbox: List[EmailMessage] = []
+        self._lock = threading.Lock()
+
+    def send(self, message: EmailMessage) -> bool:
+        with self._lock:
+            self.outbox.append(message)
+        return True
+
+
+# =============== rate limit ===============
+
+class RateLimiter:
+    """
+    Token bucket: at most `per_second` acquisitions per second on average,
+    with bursts of up to `per_second`. acquire() blocks until a token is
+    free; per_second <= 0 means unlimited.
+    """
+
+    def __init__(self, per_second: float, clock=time.monotonic, sleep=time.sleep):
+        self.per_second = per_second
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = max(per_second, 1.0)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.per_second <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(
+                    max(self.per_second, 1.0),
+                    self._tokens + (now - self._updated) * self.per_second,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.per_second
+            self._sleep(wait)
+
+
+# =============== mailer ===============
+
+class Mailer:
+    """
+    Sends messages on up to `max_workers` threads through `transport`,
+    throttled to `rate_per_second` messages across all of them.
+    """
+
+    def __init__(self, transport, max_workers: int = 4, rate_per_second: float = 14):
+        self.transport = transport
+        self.limiter = RateLimiter(rate_per_second)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mailer")
+
+    def _send(self, message: EmailMessage) -> bool:
+        self.limiter.acquire()
+        try:
+            return bool(self.transport.send(message))
+        except Exception as e:
+            print(f"❌ [Mailer] Failed to send to {message.to}: {e}")
+            return False
+
+    def send(self, message: EmailMessage) -> bool:
+        return self.send_bulk([message])[0]
+
+    def send_bulk(self, messages: List[EmailMessage]) -> List[bool]:
+        """Send all messages and wait for them; one success flag per message, in order."""
+        futures = [self._pool.submit(self._send, m) for m in messages]
+        return [f.result() for f in futures]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+_mailer = None
+_mailer_pid = None
+_mailer_lock = threading.Lock()
+
+
+def _new_transport():
+    if config.MAIL_TRANSPORT == "local":
+        return LocalTransport()
+    return SesTransport()
+
+
+def get_mailer() -> Mailer:
+    """This process's Mailer (thread pools do not survive a fork)."""
+    global _mailer, _mailer_pid
+    pid = os.getpid()
+    if _mailer is None or _mailer_pid != pid:
+        with _mailer_lock:
+            if _mailer is None or _mailer_pid != pid:
+                _mailer = Mailer(
+                    _new_transport(),
+                    max_workers=config.MAIL_WORKERS,
+                    rate_per_second=config.SES_MAX_SEND_RATE,
+                )
+                _mailer_pid = pid
+    return _mailer
 
 
 def send_email_ses(to, subject, html_body, text_body=None):
     """
     Send email via AWS SES.
-    
+
     Args:
         to (str): Recipient email address
         subject (str): Email subject
         html_body (str): Email HTML content
         text_body (str, optional): Plain text content (auto-generated if not provided)
-    
+
     Returns:
         bool: True if successful, False otherwise
     """
-    if not text_body:
-        text_body = "This email contains HTML content. Please view it in an HTML-capable client."
-
-    ses = boto3.client(
-        "ses",
-        region_name=config.AWS_REGION,
-        aws_access_key_id=config.AWS_ACCESS_KEY,
-        aws_secret_access_key=config.AWS_SECRET_KEY,
-    )
-
-    try:
-        response = ses.send_email(
-            Source=config.SES_SENDER,
-            Destination={"ToAddresses": [to]},
-            Message={
-                "Subject": {"Data": subject},
-                "Body": {
-                    "Text": {"Data": text_body},
-                    "Html": {"Data": html_body},
-                },
-            },
-        )
-        print(f"✅ [SES] Sent email to {to}, MessageId={response['MessageId']}")
-        return True
-
-    except ClientError as e:
-        print(f"❌ [SES Error] {e.response['Error']['Message']}")
-        traceback.print_exc()
-        return False
-
-    except Exception as e:
-        print(f"❌ [Unknown Error] {e}")
-        traceback.print_exc()
-        return False
+    return get_mailer().send(EmailMessage(to, subject, html_body, text_body))
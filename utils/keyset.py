@@ -0,0 +1,70 @@
+"""
+Keyset ("seek") pagination over (date, time, id).
+
+Record history is listed newest first and paged by the key of the last
+row shown instead of an OFFSET, so each page is an index range scan
+whatever its depth. Untimed records come first within their day, as with
+a plain `time DESC`: row comparisons cannot handle NULLs, so the repos
+order and compare on (date, time IS NULL, COALESCE(time, TIME '00:00'),
+id) instead, see seek_params(). The id breaks ties between records at
+the same minute.
+
+Keys travel to clients as opaque URL-safe cursor strings.
+"""
+import base64
+from datetime import date, time as dt_time
+from typing import Mapping, Optional, Tuple
+
+Key = Tuple[date, Optional[dt_time], int]
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def key(d: date, t: Optional[dt_time], record_id: int) -> Key:
+    return d, t, record_id
+
+
+def seek_params(k: Key) -> Tuple[date, bool, dt_time, int]:
+    """The values of `k` for the repos' (date, time IS NULL, COALESCE(time, 00:00), id)."""
+    d, t, record_id = k
+    return d, t is None, t or dt_time.min, record_id
+
+
+def encode_cursor(k: Key) -> str:
+    d, t, record_id = k
+    raw = f"{d.isoformat()}|{t.isoformat() if t else ''}|{record_id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Key:
+    """Inverse of encode_cursor(); raises ValueError on anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        d, t, record_id = raw.split("|")
+        return date.fromisoformat(d), dt_time.fromisoformat(t) if t else None, int(record_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def parse_page_args(args: Mapping) -> Tuple[int, Optional[Key], Optional[date], Optional[date]]:
+    """
+    (limit, after, start, end) from ?limit=&cursor=&start=&end= query
+    arguments; raises ValueError with a message fit for a 400 response.
+    """
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("Invalid limit") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    cursor = args.get("cursor")
+    after = decode_cursor(cursor) if cursor else None
+
+    try:
+        start = date.fromisoformat(args["start"]) if args.get("start") else None
+        end = date.fromisoformat(args["end"]) if args.get("end") else None
+    except ValueError:
+        raise ValueError("Invalid start or end date") from None
+    return limit, after, start, end
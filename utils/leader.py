@@ -0,0 +1,134 @@
+"""
+Leader election between processes over a Postgres advisory lock.
+
+Every gunicorn worker runs its own scheduler, but some jobs (the reminder
+tick) must run once per deployment, not once per worker. The worker that
+holds the job's session-level advisory lock is its leader; the others skip
+the job. The lock lives as long as the leader's dedicated connection, so a
+leader that exits or loses the database drops it and another worker takes
+over on its next renew(). renew() is the lease renewal: the leader checks
+that its connection (and so the lock) is still alive, followers try to
+take the lock.
+
+TickStats times the runs of such a job and counts overruns: runs that took
+longer than the job's interval, so the next one started late or was
+skipped by the scheduler.
+"""
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import psycopg
+
+import config
+
+
+class LeaderLock:
+    """
+    pg_try_advisory_lock() on a connection of its own, opened lazily.
+    A disabled lock (tests, single-process tools) always leads.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.key = zlib.crc32(name.encode("utf-8"))
+        self.enabled = enabled
+        self._conn = None
+        self._held = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or self._held
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg.Error:
+                pass
+        self._conn = None
+        self._held = False
+
+    def renew(self) -> bool:
+        """Keep or try to take the lock; returns whether this process leads."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = config.mydb_direct()
+                    self._conn.autocommit = True
+                if self._held:
+                    self._conn.execute("SELECT 1")
+                else:
+                    row = self._conn.execute("SELECT pg_try_advisory_lock(%s)", (self.key,)).fetchone()
+                    self._held = bool(row[0])
+                    if self._held:
+                        print(f"[LEADER] This process now runs {self.name}")
+            except psycopg.Error as e:
+                if self._held:
+                    print(f"[LEADER] Lost the {self.name} lock: {e}")
+                else:
+                    print(f"[LEADER] Cannot check the {self.name} lock: {e}")
+                self._close()
+            return self._held
+
+    def release(self) -> None:
+        """Step down; closing the session releases the lock."""
+        with self._lock:
+            self._close()
+
+
+class TickStats:
+    """Duration and overrun counters for one periodic job, per process."""
+
+    def __init__(self, name: str, interval: float, clock=time.perf_counter):
+        self.name = name
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.skipped = 0        # not the leader
+        self.overruns = 0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_seconds = 0.0
+
+    def skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.runs += 1
+            self.last_seconds = seconds
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            overrun = seconds > self.interval
+            if overrun:
+                self.overruns += 1
+        if overrun:
+            print(f"[TICK] {self.name} overran: {seconds:.1f}s for a {self.interval}s interval")
+        else:
+            print(f"[TICK] {self.name} took {seconds:.2f}s")
+
+    @contextmanager
+    def timed(self):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(self._clock() - start)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "skipped": self.skipped,
+                "overruns": self.overruns,
+                "last_ms": round(self.last_seconds * 1000, 3),
+                "max_ms": round(self.max_seconds * 1000, 3),
+                "avg_ms": round(self.total_seconds / self.runs * 1000, 3) if self.runs else 0.0,
+            }
@@ -0,0 +1,196 @@
+"""
+Versioned schema migrations.
+
+create.sql only creates missing tables, so changes to existing tables
+(indexes, constraints) live here as numbered migrations instead. Applied
+versions are recorded in schema_migrations, and each migration runs once:
+
+    python -m utils.migrations          # apply pending migrations
+    python -m utils.migrations --list   # show applied / pending
+
+Migrations are append-only: never edit or renumber one that has shipped,
+add a new one. Index builds use CREATE INDEX CONCURRENTLY so they do not
+block writes on a live table; such migrations run outside a transaction
+(transactional=False) and must be idempotent (IF NOT EXISTS), since a
+failure part-way leaves the earlier statements applied.
+"""
+import sys
+from dataclasses import dataclass
+from typing import List, Sequence, Set
+
+import config
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: Sequence[str]
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        name="drug_records lookup indexes",
+        statements=(
+            # get_drug_record_by_unique / get_drug_record_by_unique_key
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_drug_records_dose
+            ON drug_records (user_id, plan_item_id, expected_date, expected_time)
+            """,
+            # get_drug_records_by_date_range (and its ORDER BY),
+            # get_drug_records_by_user_id, get_taken_dose_keys, adherence recounts
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_drug_records_user_date
+            ON drug_records (user_id, expected_date, expected_time)
+            """,
+            "ANALYZE drug_records",
+        ),
+        transactional=False,
+    ),
+    Migration(
+        version=2,
+        name="remove duplicate drug_records doses",
+        statements=(
+            # Removed rows are kept here, so they can be checked or restored
+            """
+            CREATE TABLE IF NOT EXISTS drug_records_duplicates
+            AS SELECT * FROM drug_records WITH NO DATA
+            """,
+            # Keep the oldest record of each duplicated dose; the rollup rows
+            # of the days touched are rebuilt on their next read
+            """
+            WITH dup AS (
+                DELETE FROM drug_records d
+                USING drug_records k
+                WHERE d.plan_item_id IS NOT NULL
+                  AND d.user_id = k.user_id
+                  AND d.plan_item_id = k.plan_item_id
+                  AND d.expected_date = k.expected_date
+                  AND d.expected_time IS NOT DISTINCT FROM k.expected_time
+                  AND d.id > k.id
+                RETURNING d.*
+            ), saved AS (
+                INSERT INTO drug_records_duplicates
+                SELECT * FROM dup
+            )
+            DELETE FROM adherence_daily a
+            USING dup
+            WHERE a.patient_id = dup.user_id AND a.day = dup.expected_date
+            """,
+        ),
+    ),
+    Migration(
+        version=3,
+        name="one drug_records row per planned dose",
+        statements=(
+            # Left behind INVALID if an earlier attempt failed part-way
+            "DROP INDEX CONCURRENTLY IF EXISTS uq_drug_records_dose",
+            # drug_record_repo.toggle_drug_taken's ON CONFLICT target
+            # (NULLS NOT DISTINCT: PostgreSQL 15+)
+            """
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_drug_records_dose
+            ON drug_records (user_id, plan_item_id, expected_date, expected_time)
+            NULLS NOT DISTINCT
+            WHERE plan_item_id IS NOT NULL
+            """,
+            # Same columns, superseded by the unique index
+            "DROP INDEX CONCURRENTLY IF EXISTS idx_drug_records_dose",
+        ),
+        transactional=False,
+    ),
+    Migration(
+        version=4,
+        name="record history keyset indexes",
+        statements=(
+            # get_drug_records_page / get_food_records_page (utils/keyset.py)
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_drug_records_user_keyset
+            ON drug_records (user_id, expected_date, (expected_time IS NULL),
+                             COALESCE(expected_time, TIME '00:00'), id)
+            """,
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_food_records_user_keyset
+            ON food_records (user_id, eaten_date, (eaten_time IS NULL),
+                             COALESCE(eaten_time, TIME '00:00'), id)
+            """,
+        ),
+        transactional=False,
+    ),
+]
+
+_CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def applied_versions(conn) -> Set[int]:
+    with conn.cursor() as cur:
+        cur.execute(_CREATE_VERSION_TABLE)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def pending_migrations(conn, migrations: Sequence[Migration] = None) -> List[Migration]:
+    done = applied_versions(conn)
+    return sorted(
+        (m for m in (migrations or MIGRATIONS) if m.version not in done),
+        key=lambda m: m.version,
+    )
+
+
+def apply_migration(conn, migration: Migration) -> None:
+    """Run one migration and record it; `conn` must not be in a transaction."""
+    conn.autocommit = not migration.transactional
+    try:
+        with conn.cursor() as cur:
+            for statement in migration.statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name),
+            )
+        if migration.transactional:
+            conn.commit()
+    except Exception:
+        if migration.transactional:
+            conn.rollback()
+        raise
+    finally:
+        conn.autocommit = False
+
+
+def migrate(conn, migrations: Sequence[Migration] = None) -> List[int]:
+    """Apply every pending migration in version order; returns the versions applied."""
+    applied = []
+    for migration in pending_migrations(conn, migrations):
+        print(f"[MIGRATE] {migration.version:04d} {migration.name}")
+        apply_migration(conn, migration)
+        applied.append(migration.version)
+    return applied
+
+
+def main(argv: List[str]) -> None:
+    conn = config.mydb_direct()
+    try:
+        if "--list" in argv:
+            done = applied_versions(conn)
+            for m in MIGRATIONS:
+                state = "applied" if m.version in done else "pending"
+                print(f"{m.version:04d} {state:<8} {m.name}")
+            return
+        applied = migrate(conn)
+        print(f"[MIGRATE] {len(applied)} migration(s) applied")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,4 +1,4 @@
-from dataclasses import dataclass, asdict, is_dataclass
+from dataclasses import dataclass, fields, is_dataclass
 from datetime import datetime, date, time as dt_time
 
 def serialize_for_json(obj):
@@ -10,8 +10,14 @@ def serialize_for_json(obj):
     if isinstance(obj, dt_time):
         return obj.isoformat()
 
-    if is_dataclass(obj):
-        return {k: serialize_for_json(v) for k, v in asdict(obj).items()}
+    if is_dataclass(obj) and not isinstance(obj, type):
+        # Walk the fields directly; asdict() would deep-copy everything first
+        return {f.name: serialize_for_json(getattr(obj, f.name)) for f in fields(obj)}
+
+    # Lightweight non-dataclass models (e.g. plan_repo.plan_occurrence)
+    to_dict = getattr(obj, "to_dict", None)
+    if callable(to_dict) and not isinstance(obj, type):
+        return to_dict()
 
     if isinstance(obj, (list, tuple)):
         return [serialize_for_json(v) for v in obj]
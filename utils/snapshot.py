@@ -0,0 +1,169 @@
+"""
+Versioned binary snapshots of the in-memory catalogues.
+
+A snapshot is one file: a small JSON header followed by raw, 8-byte
+aligned sections (typed arrays and UTF-8 blobs). Reading maps the file and
+hands out memoryviews over it, so loading costs a few page faults instead
+of a full SELECT over the table, and workers reading the same file share
+its pages through the OS cache.
+
+    magic (8) | format version (u32) | header length (u32) | header JSON
+    | section | section | ...
+
+The header carries the caller's metadata (e.g. the table's row count and
+max id it was built from) plus the offset, length and typecode of every
+section. Files are written to a temp name and renamed into place, so a
+reader never sees a partial snapshot.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"DDSNAP\0\0"
+FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 8
+
+
+class SnapshotError(ValueError):
+    """The file is missing, truncated, or written by another format version."""
+
+
+def _padding(n: int) -> int:
+    return -n % _ALIGN
+
+
+def write_snapshot(path: str, meta: dict, sections: Dict[str, object]) -> None:
+    """
+    Write `sections` (name -> array or bytes-like) under `meta` to `path`.
+    Arrays keep their typecode so read_section() can cast them back.
+    """
+    table = {}
+    offset = 0
+    for name, data in sections.items():
+        size = memoryview(data).nbytes
+        table[name] = [offset, size, data.typecode if isinstance(data, array) else "B"]
+        offset += size + _padding(size)
+
+    header = json.dumps({"meta": meta, "sections": table}).encode("utf-8")
+    header += b" " * _padding(_PREFIX.size + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for data in sections.values():
+                size = memoryview(data).nbytes
+                f.write(data)
+                f.write(b"\0" * _padding(size))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot file.
+
+    Sections are memoryviews into the mapping; they stay valid for as long
+    as anything references them (the mapping is never closed explicitly).
+    """
+
+    def __init__(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:  # ValueError: empty file
+            raise SnapshotError(f"cannot open snapshot {path}: {e}") from e
+
+        if len(self._mm) < _PREFIX.size:
+            raise SnapshotError(f"truncated snapshot {path}")
+        magic, version, header_len = _PREFIX.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"not a snapshot file: {path}")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"snapshot format {version} != {FORMAT_VERSION}: {path}")
+
+        start = _PREFIX.size
+        try:
+            header = json.loads(bytes(self._mm[start:start + header_len]))
+        except ValueError as e:
+            raise SnapshotError(f"corrupt snapshot header: {path}") from e
+
+        self.path = path
+        self.meta: dict = header["meta"]
+        self._sections: Dict[str, List] = header["sections"]
+        self._data_start = start + header_len
+        for offset, size, _ in self._sections.values():
+            if self._data_start + offset + size > len(self._mm):
+                raise SnapshotError(f"truncated snapshot {path}")
+
+    def section(self, name: str) -> memoryview:
+        """The named section, cast to its original array typecode."""
+        try:
+            offset, size, typecode = self._sections[name]
+        except KeyError:
+            raise SnapshotError(f"snapshot {self.path} has no section {name!r}") from None
+        start = self._data_start + offset
+        return memoryview(self._mm)[start:start + size].cast(typecode)
+
+
+def read_snapshot(path: str) -> Optional[Snapshot]:
+    """Open `path`, or return None if there is no usable snapshot there."""
+    try:
+        return Snapshot(path)
+    except SnapshotError:
+        return None
+
+
+# =============== string columns ===============
+
+def pack_strings(values: Iterable[Optional[str]]) -> Tuple[array, bytes, bytes]:
+    """
+    Pack strings into (end offsets, UTF-8 blob, null flags). Offsets are
+    cumulative: value i spans offsets[i]:offsets[i + 1].
+    """
+    offsets = array("q", [0])
+    blob = bytearray()
+    nulls = bytearray()
+    for v in values:
+        nulls.append(v is None)
+        if v:
+            blob += v.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob), bytes(nulls)
+
+
+def string_sections(prefix: str, values: Iterable[Optional[str]]) -> Dict[str, object]:
+    offsets, blob, nulls = pack_strings(values)
+    return {f"{prefix}.offsets": offsets, f"{prefix}.blob": blob, f"{prefix}.nulls": nulls}
+
+
+class StringColumn:
+    """Indexable view over a string column written by string_sections()."""
+
+    def __init__(self, snap: Snapshot, prefix: str):
+        self._offsets = snap.section(f"{prefix}.offsets")
+        self._blob = snap.section(f"{prefix}.blob")
+        self._nulls = snap.section(f"{prefix}.nulls")
+
+    def __len__(self) -> int:
+        return len(self._nulls)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self._nulls[i]:
+            return None
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
@@ -0,0 +1,212 @@
+"""
+Trigram inverted index for case-insensitive substring search.
+
+The keyword search endpoints match when every keyword is a substring of a
+field, so a plain word index is not enough. Instead each row's searchable
+text is lowercased once at build time and every 3-character gram points
+to the rows containing it. A query only verifies rows that appear in the
+rarest posting list of every keyword, and results come back in catalogue
+order so callers can apply their existing (stable) ranking unchanged.
+"""
+import heapq
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Sequence
+
+from utils.snapshot import Snapshot, StringColumn, string_sections
+
+GRAM = 3
+
+# Largest page of search results, and deepest page start, a caller may ask for
+MAX_LIMIT = 100
+MAX_OFFSET = 1000
+
+
+def _copy(typecode: str, data) -> array:
+    """A growable array copy of an array or (snapshot) memoryview."""
+    a = array(typecode)
+    a.frombytes(memoryview(data).cast("B"))
+    return a
+
+
+def _grams(text: str):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class NgramIndex:
+    """
+    Build from a list of per-row field tuples, e.g.
+    [(brand_name, generic_name), ...]. None fields are allowed; every row
+    must have the same number of fields.
+
+    The lowercased text is kept as one UTF-8 buffer with field offsets
+    rather than a Python string per field, so the index adds little memory
+    on top of the catalogue. Substring tests on UTF-8 bytes give the same
+    answer as on the decoded strings.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[str]]):
+        self._buf = bytearray()
+        self._bounds = array("q", [0])  # field i spans _bounds[i]:_bounds[i + 1]
+        self._width = 0
+        self._rows = 0
+        self.postings: Dict[str, array] = {}
+        self._add(rows, owned=None)
+
+    def _add(self, rows: Iterable[Sequence[str]], owned) -> None:
+        # `owned` holds the grams whose posting arrays this index may append
+        # to; None means all of them. Other arrays are shared with the index
+        # this one was extended from and are copied before the first append.
+        postings = self.postings
+        pos = self._rows
+        for row in rows:
+            self._width = len(row)
+
+            seen = set()
+            for f in row:
+                if f:
+                    f = f.lower()
+                    seen |= _grams(f)
+                    self._buf += f.encode("utf-8")
+                self._bounds.append(len(self._buf))
+            for g in seen:
+                p = postings.get(g)
+                if p is None:
+                    p = postings[g] = array("i")
+                    if owned is not None:
+                        owned.add(g)
+                elif owned is not None and g not in owned:
+                    p = postings[g] = _copy("i", p)
+                    owned.add(g)
+                p.append(pos)
+            pos += 1
+        self._rows = pos
+
+    def extended(self, rows: Iterable[Sequence[str]]) -> "NgramIndex":
+        """
+        A new index over this index's rows followed by `rows`. This index is
+        left untouched, so readers still holding it keep a consistent view;
+        posting lists no new row touches are shared, not copied.
+        """
+        index = NgramIndex(())
+        index._buf = bytearray(self._buf)
+        index._bounds = _copy("q", self._bounds)
+        index._width = self._width
+        index._rows = self._rows
+        index.postings = dict(self.postings)
+        index._add(rows, owned=set())
+        return index
+
+    def __len__(self) -> int:
+        return self._rows
+
+    # -------- snapshot support (see utils/snapshot.py) --------
+
+    def to_sections(self, prefix: str) -> dict:
+        grams = list(self.postings)
+        ends = array("q", [0])
+        positions = array("i")
+        for g in grams:
+            positions.extend(self.postings[g])
+            ends.append(len(positions))
+        sections = string_sections(f"{prefix}.grams", grams)
+        sections.update({
+            f"{prefix}.buf": bytes(self._buf),
+            f"{prefix}.bounds": self._bounds,
+            f"{prefix}.ends": ends,
+            f"{prefix}.positions": positions,
+        })
+        return sections
+
+    @classmethod
+    def from_snapshot(cls, snap: Snapshot, prefix: str, rows: int, width: int) -> "NgramIndex":
+        """Rebuild an index written by to_sections() without re-tokenising."""
+        index = cls(())
+        index._buf = bytes(snap.section(f"{prefix}.buf"))  # bytes, for .find()
+        index._bounds = snap.section(f"{prefix}.bounds")
+        index._rows = rows
+        index._width = width
+
+        grams = StringColumn(snap, f"{prefix}.grams")
+        ends = snap.section(f"{prefix}.ends")
+        positions = snap.section(f"{prefix}.positions")
+        index.postings = {grams[i]: positions[ends[i]:ends[i + 1]] for i in range(len(grams))}
+        return index
+
+    def _candidates(self, keywords: List[str]):
+        """Row positions that may match, in ascending order."""
+        # Rarest gram of each keyword, then intersect those lists.
+        lists = []
+        for kw in keywords:
+            if len(kw) < GRAM:
+                continue
+            rarest = None
+            for g in _grams(kw):
+                p = self.postings.get(g)
+                if p is None:
+                    return ()
+                if rarest is None or len(p) < len(rarest):
+                    rarest = p
+            lists.append(rarest)
+
+        if not lists:
+            # Every keyword is shorter than a gram: let bytes.find skip
+            # through the text buffer for the longest one instead.
+            return self._rows_containing(max(keywords, key=len).encode("utf-8"))
+
+        lists.sort(key=len)
+        candidates = lists[0]
+        for other in lists[1:]:
+            if len(candidates) < 64:
+                break  # cheaper to just verify what is left
+            other = set(other)
+            candidates = [p for p in candidates if p in other]
+        return candidates
+
+    def _rows_containing(self, kw: bytes) -> List[int]:
+        buf, bounds, width = self._buf, self._bounds, self._width
+        rows = []
+        i = buf.find(kw)
+        while i != -1:
+            field = bisect_right(bounds, i) - 1
+            end = bounds[field + 1]
+            if i + len(kw) <= end:
+                row = field // width
+                rows.append(row)
+                i = bounds[(row + 1) * width]  # skip the rest of this row
+            else:
+                i += 1  # match straddles two fields
+            i = buf.find(kw, i)
+        return rows
+
+    def search(self, keywords: List[str]) -> List[int]:
+        """
+        Positions of rows where some single field contains every keyword
+        (case-insensitive), in catalogue order.
+        """
+        keywords = [k.lower() for k in keywords if k]
+        if not keywords:
+            return []
+
+        encoded = [k.encode("utf-8") for k in keywords]
+        buf, bounds, width = self._buf, self._bounds, self._width
+        res = []
+        for pos in self._candidates(keywords):
+            for i in range(pos * width, pos * width + width):
+                start, end = bounds[i], bounds[i + 1]
+                if all(buf.find(k, start, end) != -1 for k in encoded):
+                    res.append(pos)
+                    break
+        return res
+
+
+def top_ranked(positions: Iterable[int], rank, limit: int, offset: int = 0) -> List[int]:
+    """
+    Positions offset .. offset + limit of `positions` ordered by `rank`
+    (ties keep catalogue order). Only the top offset + limit are selected,
+    so a broad query does not sort every hit; both are clamped to
+    MAX_LIMIT / MAX_OFFSET.
+    """
+    offset = min(max(offset, 0), MAX_OFFSET)
+    limit = min(max(limit, 0), MAX_LIMIT)
+    return heapq.nsmallest(offset + limit, positions, key=rank)[offset:]